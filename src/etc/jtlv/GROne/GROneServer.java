@@ -0,0 +1,174 @@
+import edu.wis.jtlv.env.Env;
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.util.Arrays;
+import java.util.List;
+import java.util.concurrent.BlockingQueue;
+import java.util.concurrent.LinkedBlockingQueue;
+import java.util.concurrent.TimeUnit;
+
+/**
+ * GROneServer keeps one JVM around for repeated synthesis runs, to avoid
+ * paying for JVM startup and class loading on every compile.
+ *
+ * Each line read from stdin is one request: the name of the front-end to run
+ * (GROneMain or GROneDebug) followed by its usual command-line arguments,
+ * all separated by tabs.  The output of the run is written to stdout exactly
+ * as it would be by the front-end on its own, followed by a line containing
+ * only DONE_MESSAGE.  The server exits when stdin is closed.
+ *
+ * A line containing only CANCEL_MESSAGE while a request is running stops it;
+ * the rest of its output is dropped, but DONE_MESSAGE is still written.
+ */
+
+public class GROneServer {
+    public static final String DONE_MESSAGE = "==== GROneServer: request complete ====";
+    public static final String CANCEL_MESSAGE = "==== GROneServer: cancel request ====";
+
+    private static final List<String> GRONEMAIN_OPTIONS = Arrays.asList("--fastslow", "--safety", "--symbolic");
+
+    /** Passes output through until the request it belongs to is cancelled */
+    private static class RequestOutputStream extends OutputStream {
+        private final OutputStream out;
+        private volatile boolean cancelled = false;
+
+        public RequestOutputStream(OutputStream out) {
+            this.out = out;
+        }
+
+        public void cancel() {
+            cancelled = true;
+        }
+
+        @Override
+        public void write(int b) throws java.io.IOException {
+            if (!cancelled) out.write(b);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) throws java.io.IOException {
+            if (!cancelled) out.write(b, off, len);
+        }
+
+        @Override
+        public void flush() throws java.io.IOException {
+            if (!cancelled) out.flush();
+        }
+    }
+
+    /**
+     * Check the arguments the same way the front-ends do, since on bad
+     * arguments they call System.exit(), which would take the server down too.
+     * Returns an error message, or null if the request can be run.
+     */
+    private static String checkRequest(String[] request) {
+        if (!request[0].equals("GROneMain") && !request[0].equals("GROneDebug")) {
+            return "Unknown request: " + request[0];
+        }
+
+        if (request.length < 3) {
+            return "Usage: " + request[0] + " <smv_file> <ltl_file>";
+        }
+
+        for (int i = 3; i < request.length; i++) {
+            if (!request[0].equals("GROneMain") || !GRONEMAIN_OPTIONS.contains(request[i])) {
+                return "Unknown option: " + request[i];
+            }
+        }
+
+        return null;
+    }
+
+    @SuppressWarnings("deprecation")
+	public static void main(String[] args) throws Exception {
+        final PrintStream out = System.out;
+
+        // Read stdin on its own thread, so that cancellations can arrive while a request runs
+        final BlockingQueue<String> lines = new LinkedBlockingQueue<String>();
+        final String EOF = new String("EOF");
+        Thread reader = new Thread() {
+            public void run() {
+                BufferedReader in = new BufferedReader(new InputStreamReader(System.in));
+                try {
+                    String line;
+                    while ((line = in.readLine()) != null) {
+                        lines.put(line);
+                    }
+                } catch (Exception e) {
+                    e.printStackTrace(out);
+                }
+                lines.add(EOF);
+            }
+        };
+        reader.setDaemon(true);
+        reader.start();
+
+        String line;
+        while ((line = lines.take()) != EOF) {
+            if (line.trim().length() == 0 || line.equals(CANCEL_MESSAGE)) {
+                // A cancellation that arrived after its request had already finished
+                continue;
+            }
+
+            final String[] request = line.split("\t");
+            final String[] request_args = new String[request.length - 1];
+            System.arraycopy(request, 1, request_args, 0, request_args.length);
+
+            final RequestOutputStream request_out = new RequestOutputStream(out);
+            final PrintStream request_print = new PrintStream(request_out, true);
+
+            String error = checkRequest(request);
+            if (error != null) {
+                request_print.println(error);
+            } else {
+                Thread worker = new Thread() {
+                    public void run() {
+                        // Errors should end up in the log, just like when running on our own
+                        System.setOut(request_print);
+                        System.setErr(request_print);
+
+                        try {
+                            // Start each run with a fresh set of modules and BDD managers
+                            Env.resetEnv();
+
+                            if (request[0].equals("GROneMain")) {
+                                GROneMain.main(request_args);
+                            } else {
+                                GROneDebug.main(request_args);
+                            }
+                        } catch (ThreadDeath t) {
+                            // Cancelled
+                        } catch (Throwable t) {
+                            // Keep serving; the front-end may have left stdout redirected to a file
+                            t.printStackTrace(request_print);
+                        }
+                    }
+                };
+                worker.start();
+
+                while (worker.isAlive()) {
+                    String next = lines.poll(100, TimeUnit.MILLISECONDS);
+                    if (next == null) {
+                        continue;
+                    } else if (next.equals(CANCEL_MESSAGE)) {
+                        request_out.cancel();
+                        // The BDD managers are thrown away by the next request's resetEnv()
+                        worker.stop();
+                        worker.join();
+                    } else {
+                        // Nothing but cancellations may be sent during a request
+                        lines.put(next);
+                        worker.join();
+                    }
+                }
+            }
+
+            System.setOut(out);
+            System.setErr(out);
+            out.println(DONE_MESSAGE);
+            out.flush();
+        }
+	}
+}
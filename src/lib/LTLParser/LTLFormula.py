@@ -4,6 +4,7 @@ import sys
 import LTLParser
 import logging
 import re
+from functools import partial
 
 # Allocate global parser
 p = LTLParser.Parser()
@@ -117,81 +118,194 @@ class LTLFormula(object):
             # If we are a conjunction at highest level
             # Note: This is done separately just so we can insert
             # linebreaks between each conjunct
-            return " &\n".join(treeToString(t.tree, top_level=False) for t in self.getConjuncts())
+            return "".join(iterFormulaChunks(self))
         except ValueError:
             # Otherwise, if we are a single conjunct
             return treeToString(self.tree)
         
 
+_terminal_set = frozenset(p.terminals)
+_token_re = re.compile("(" + "|".join([re.escape(t) for t in p.terminals]) + "|[\w.]+)")
+
 def tokenize(text):
     """ Lexer for the formulas """
-    tokens = re.findall("(" + "|".join([re.escape(t) for t in p.terminals]) + \
-                        "|[\w.]+)", text)
+    tokens = _token_re.findall(text)
 
-    return [(t,) if t in p.terminals else ('id', t) for t in tokens]
+    return [(t,) if t in _terminal_set else ('id', t) for t in tokens]
 
 # =====================================================
-# Simplify the specifications
+# Iterative tree traversal
 # =====================================================
-def clean_tree(tree):
-    """ Cleans a parse tree, i.e. removes brackets and so on """
+def transformTree(tree, expand):
+    """ Post-order transformation of a parse tree, using an explicit stack so that
+        arbitrarily deep trees (e.g. long chains of conjunctions) do not hit the
+        recursion limit.
+
+        `expand(node)` must return either (None, value) if `value` is the finished
+        result for `node`, or (combine, children), in which case `combine` is called
+        with the list of transformed `children` to produce the result for `node`. """
+
+    combine, items = expand(tree)
+    if combine is None:
+        return items
+
+    stack = [(combine, items, [])]
+    while True:
+        combine, items, results = stack[-1]
+        if len(results) < len(items):
+            child_combine, child_items = expand(items[len(results)])
+            if child_combine is None:
+                results.append(child_items)
+            else:
+                stack.append((child_combine, child_items, []))
+        else:
+            stack.pop()
+            value = combine(results)
+            if not stack:
+                return value
+            stack[-1][2].append(value)
+
+def _onlyChild(results):
+    return results[0]
+
+def _prependHead(head, results):
+    return [head] + results
 
-    if tree[0] in p.terminals:
-        return tree
+# =====================================================
+# Simplify the specifications
+# =====================================================
+def _expandForCleaning(tree):
+    if tree[0] in _terminal_set:
+        return None, tree
 
     if tree[0] == "Brackets":
-        return clean_tree(tree[2])
+        return _onlyChild, [tree[2]]
     elif len(tree) == 2 and tree[0] in ["Implication", "Atomic", "Conjunction", "Biimplication", "Disjunction", "Xor", "BinaryTemporalFormula", "UnaryFormula"]:
-        return clean_tree(tree[1])
+        return _onlyChild, [tree[1]]
     elif tree[0] == "AtomicFormula":
         if len(tree) != 2:
             raise ValueError("AtomicFormula must have length 2")
-        return clean_tree(tree[1])
+        return _onlyChild, [tree[1]]
     elif tree[0] in ["Implication", "Conjunction", "Biimplication", "Disjunction", "Xor"]:
-        return [tree[0], clean_tree(tree[1]), clean_tree(tree[3])]
+        return partial(_prependHead, tree[0]), [tree[1], tree[3]]
     elif tree[0] == "BinaryTemporalFormula":
-        return [tree[0], clean_tree(tree[1]), clean_tree(tree[2]), clean_tree(tree[3])]
+        return partial(_prependHead, tree[0]), [tree[1], tree[2], tree[3]]
     elif tree[0] == "UnaryFormula":
-        return [tree[0], clean_tree(tree[1]), clean_tree(tree[2])]
+        return partial(_prependHead, tree[0]), [tree[1], tree[2]]
     elif tree[0] in ["BinaryTemporalOperator", "UnaryTemporalOperator"]:
         # Remove the "superfluous indirection"
-        return clean_tree(tree[1])
+        return _onlyChild, [tree[1]]
     elif tree[0] == "Assignment":
         # Flatten "id" case
-        return [tree[0], [tree[1][1]]]
+        return None, [tree[0], [tree[1][1]]]
     else:
-        return [tree[0]] + [clean_tree(x) for x in tree[1:]]
+        return partial(_prependHead, tree[0]), list(tree[1:])
 
-def flatten_as_much_as_possible(tree):
-    """ Flattens nested disjunctions/conjunctions """
-    # Ground case?
-    if len(tree) == 1 or isinstance(tree, basestring):
-        return tree
+def clean_tree(tree):
+    """ Cleans a parse tree, i.e. removes brackets and so on """
+
+    return transformTree(tree, _expandForCleaning)
 
-    tree = [flatten_as_much_as_possible(t) for t in tree]
+FLATTENABLE_TYPES = ["Conjunction", "Disjunction", "Xor"]
 
-    FLATTENABLE_TYPES = ["Conjunction", "Disjunction", "Xor"]
+def _expandForFlattening(tree):
+    # Ground case?
+    if len(tree) == 1 or isinstance(tree, basestring):
+        return None, tree
 
     if tree[0] in FLATTENABLE_TYPES:
-        parts = [tree[0]]
-        for a in tree[1:]:
-            if a[0] == tree[0]:
-                parts.extend(a[1:])
+        # Gather the operands of the whole chain of this operator in one pass,
+        # instead of merging each level of nesting into the one above it
+        operands = []
+        pending = list(reversed(tree[1:]))
+        while pending:
+            a = pending.pop()
+            if not isinstance(a, basestring) and a[0] == tree[0]:
+                pending.extend(reversed(a[1:]))
             else:
-                parts.append(a)
+                operands.append(a)
 
-        return parts
+        return partial(_prependHead, tree[0]), operands
 
     # Every other case
-    return tree
+    return list, list(tree)
+
+def flatten_as_much_as_possible(tree):
+    """ Flattens nested disjunctions/conjunctions """
+
+    return transformTree(tree, _expandForFlattening)
 
 
 # =====================================================
 # The parsing function
 # =====================================================
+def fastParse(tokens):
+    """ Run the LR automaton over `tokens` without any of the error-correction
+        bookkeeping of `Parser.parse`.  Returns the raw parse tree, or None
+        if the input does not parse cleanly. """
+
+    shift_table = p._shift
+    reduce_table = p._reduce
+    goto_table = p._goto
+    halting_state = p._halting_state
+
+    tokens = tokens + [(p.EOF,)]
+    num_tokens = len(tokens)
+    stack = []
+    state = 0
+    i = 0
+    while state != halting_state:
+        if i >= num_tokens:
+            return None
+        lookahead = tokens[i]
+        key = (state, lookahead[0])
+
+        if key in shift_table:
+            stack.append((state, lookahead))
+            state = shift_table[key]
+            i += 1
+        elif key in reduce_table:
+            X, n = reduce_table[key]
+            if n > 0:
+                state = stack[-n][0]
+                tree = (X,) + tuple(s[1] for s in stack[-n:])
+                del stack[-n:]
+            else:
+                tree = (X,)
+            stack.append((state, tree))
+            state = goto_table[(state, X)]
+        else:
+            return None
+
+    return stack[0][1]
+
+# Raw parse trees, keyed by formula text
+_parse_cache = {}
+MAX_PARSE_CACHE_SIZE = 1024
+
 def parseLTL(ltlTxt):
-    try:
+    tree = _parse_cache.get(ltlTxt)
+
+    if tree is None:
         tokens = tokenize(ltlTxt)
+        tree = fastParse(tokens)
+
+        if tree is None:
+            # Only use the error-correcting parser to produce diagnostics
+            tree = _parseWithDiagnostics(ltlTxt, tokens)
+
+        if len(_parse_cache) >= MAX_PARSE_CACHE_SIZE:
+            _parse_cache.clear()
+        _parse_cache[ltlTxt] = tree
+
+    # Post-process
+    cleaned_tree = clean_tree(tree)
+    simplified_tree = flatten_as_much_as_possible(cleaned_tree)
+
+    return simplified_tree
+
+def _parseWithDiagnostics(ltlTxt, tokens):
+    try:
         tree = p.parse(tokens)
     except p.ParseErrors as exc:
         for t, e in exc.errors:
@@ -208,49 +322,65 @@ def parseLTL(ltlTxt):
                 logging.error("Wanted a token of one of the following forms: %r", e)
         raise
 
-    # Post-process
-    cleaned_tree = clean_tree(tree)
-    simplified_tree = flatten_as_much_as_possible(cleaned_tree)
+    return tree
 
-    return simplified_tree
+# Mapping of n-ary operator types to their string representations
+n_ary_operators = {"Conjunction": " & ",
+                   "Disjunction": " | ",
+                   "Implication": " -> ",
+                   "Biimplication": " <-> "}
+
+# We need to force parentheses for some operators, even if they are unary
+requires_parens = ["NextOperator", "GloballyOperator", "FinallyOperator"]
+
+def _joinNAry(operator, results):
+    # Group with parentheses, since we are never at the top level here
+    return "(" + n_ary_operators[operator].join(results) + ")"
+
+def _joinUnary(tree, results):
+    operator, child = results
+    # Add parentheses only if necessary
+    if not (child.startswith("(") and child.endswith(")")) \
+       and not (tree[1][0] == "GloballyOperator" and tree[2][0] == "UnaryFormula" and tree[2][1][0] == "FinallyOperator"):
+       # ^^^ HACK: To be backwards compatible, we want to avoid [](<>(something))
+        child = "(" + child + ")"
+    return operator + child
+
+def _expandForString(tree):
+    if len(tree) == 1:
+        # Terminals and assignments, etc.
+        return None, tree[0]
+    elif tree[0] in n_ary_operators:
+        # Join the subparts of the n-ary operator
+        return partial(_joinNAry, tree[0]), tree[1:]
+    elif tree[0] == "UnaryFormula" and tree[1][0] in requires_parens:
+        return partial(_joinUnary, tree), [tree[1], tree[2]]
+    else:
+        return "".join, tree[1:]
 
 def treeToString(tree, top_level=True):
     """
     Flatten an LTL tree back to a string
     """
 
-    # Mapping of n-ary operator types to their string representations
-    n_ary_operators = {"Conjunction": " & ",
-                       "Disjunction": " | ",
-                       "Implication": " -> ",
-                       "Biimplication": " <-> "}
+    # Parentheses around an n-ary operator are unnecessary at the top level
+    if top_level and len(tree) > 1 and tree[0] in n_ary_operators:
+        return n_ary_operators[tree[0]].join(transformTree(t, _expandForString) for t in tree[1:])
 
-    # We need to force parentheses for some operators, even if they are unary
-    requires_parens = ["NextOperator", "GloballyOperator", "FinallyOperator"]
+    return transformTree(tree, _expandForString)
 
-    if len(tree) == 1:
-        # Terminals and assignments, etc.
-        return tree[0]
-    elif tree[0] in n_ary_operators.keys():
-        # Join the subparts of the n-ary operator
-        chunk = n_ary_operators[tree[0]].join(treeToString(t, top_level=False) for t in tree[1:])
-        
-        # Group with parenthese unless we are at the top level, in which case they are unnecessary
-        if not top_level:
-            chunk = "(" + chunk + ")"
+def iterFormulaChunks(formula, separator=" &\n"):
+    """
+    Generator yielding the string form of an LTLFormula one top-level conjunct
+    at a time, so that large formulas can be written out without building
+    the whole string in memory
+    """
+
+    for i, t in enumerate(formula.getConjuncts()):
+        if i > 0:
+            yield separator
+        yield treeToString(t.tree, top_level=False)
 
-        return chunk
-    elif tree[0] == "UnaryFormula" and tree[1][0] in requires_parens:
-        child = treeToString(tree[2], top_level=False)
-        # Add parentheses only if necessary
-        if not (child.startswith("(") and child.endswith(")")) \
-           and not (tree[1][0] == "GloballyOperator" and tree[2][0] == "UnaryFormula" and tree[2][1][0] == "FinallyOperator"):
-           # ^^^ HACK: To be backwards compatible, we want to avoid [](<>(something))
-            child = "(" + child + ")"
-        return treeToString(tree[1], top_level=False) + child
-    else:
-        return "".join(treeToString(t, top_level=False) for t in tree[1:])
-        
 if __name__ == "__main__":
     ### Test code:
 
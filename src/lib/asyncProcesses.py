@@ -3,42 +3,136 @@ import logging
 import time
 import threading
 import subprocess
+import select
+import Queue
 
-class AsynchronousProcessThread(threading.Thread):
-    def __init__(self, cmd, callback, logFunction):
+# How often to check on processes that aren't producing any output (seconds)
+POLL_INTERVAL = 0.05
+
+# How long to wait after asking a process to terminate before killing it (seconds)
+KILL_GRACE_PERIOD = 1.0
+
+def _getMemoryUsage(pid):
+    """ Return the resident memory of process `pid` in bytes, or None if
+        this can't be determined on this platform. """
+
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError, IndexError):
+        pass
+
+    return None
+
+class ProcessManager(object):
+    """
+    Runs a single event loop thread that watches the output, exit status,
+    and resource limits of any number of subprocesses.
+    """
+
+    def __init__(self):
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if os.name == "nt":
+            # select() only works on sockets on Windows, so each process gets
+            # a reader thread feeding this queue instead
+            self._wakeup = None
+        else:
+            self._wakeup = os.pipe()
+
+    def add(self, process):
+        with self._lock:
+            self._processes.add(process)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ProcessManager")
+                self._thread.daemon = True
+                self._thread.start()
+
+        self.wakeup()
+
+    def wakeup(self):
+        """ Interrupt the event loop, e.g. to have a cancellation noticed immediately """
+
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], "x")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                processes = list(self._processes)
+
+            # Wait for output, or until it's time to check on things again
+            if self._wakeup is not None:
+                readers = dict((p.fd, p) for p in processes if p.fd is not None)
+                ready, _, _ = select.select(readers.keys() + [self._wakeup[0]], [], [], POLL_INTERVAL)
+                for fd in ready:
+                    if fd == self._wakeup[0]:
+                        os.read(fd, 4096)
+                    else:
+                        readers[fd]._readAvailable()
+            else:
+                time.sleep(POLL_INTERVAL)
+                for p in processes:
+                    p._readQueued()
+
+            now = time.time()
+            for p in processes:
+                if p._update(now):
+                    with self._lock:
+                        self._processes.discard(p)
+
+_manager = None
+_managerLock = threading.Lock()
+
+def getProcessManager():
+    """ Return the shared ProcessManager, creating it if necessary """
+
+    global _manager
+
+    with _managerLock:
+        if _manager is None:
+            _manager = ProcessManager()
+        return _manager
+
+class AsynchronousProcess(object):
+    def __init__(self, cmd, callback, logFunction, timeout=None, memory_limit=None, chunked=False):
         """
         Run a command asynchronously, calling a callback function (if given) upon completion.
-        If a logFunction is given, stdout and stderr will be redirected to it.
+        If a logFunction is given, stdout and stderr will be redirected to it, one line at a time
+        (or, if `chunked` is True, in chunks of whatever complete lines are available).
         Otherwise, these streams are printed to the console.
+
+        The process is killed if it runs for longer than `timeout` seconds, or if its
+        resident memory exceeds `memory_limit` bytes (where this can be measured).
         """
 
         self.cmd = cmd
         self.callback = callback
         self.logFunction = logFunction
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.chunked = chunked
 
         self.running = False
+        self.process = None
+        self.fd = None
+        self.killReason = None
 
-        threading.Thread.__init__(self)
+        self._buffer = ""
+        self._queue = None
+        self._killTime = None
 
         self.startComplete = threading.Event()
+        self.complete = threading.Event()
 
-        # Auto-start
-        self.daemon = True
-        self.start()
-
-    def kill(self):
-        print "Killing process `%s`..." % ' '.join(self.cmd)
-
-        self.running = False
+        self._start()
 
-        try:
-            # This should cause the blocking readline() in the run loop to return with an EOF
-            self.process.kill()
-        except OSError:
-            # TODO: Figure out what's going on when this (rarely) happens
-            print "Ran into an error killing the process.  Hopefully we just missed it..."
-
-    def run(self):
+    def _start(self):
         if os.name == "nt":
             err_types = (OSError, WindowsError)
         else:
@@ -53,47 +147,160 @@ class AsynchronousProcessThread(threading.Thread):
         except err_types as (errno, strerror):
             print "ERROR: " + strerror
             self.startComplete.set()
+            self.complete.set()
             return
 
+        self.startTime = time.time()
         self.running = True
+
+        if self.logFunction is not None:
+            if os.name == "nt":
+                self._queue = Queue.Queue()
+                reader = threading.Thread(target=self._readerThread)
+                reader.daemon = True
+                reader.start()
+            else:
+                self.fd = self.process.stdout.fileno()
+
         self.startComplete.set()
 
-        # Sit around while it does its thing
-        while self.process.returncode is None:
-            # Make sure we aren't being interrupted
-            if not self.running:
+        getProcessManager().add(self)
+
+    def kill(self):
+        """ Stop the process.  The completion callback will not be called. """
+
+        print "Killing process `%s`..." % ' '.join(self.cmd)
+
+        self.running = False
+        self._terminate()
+        getProcessManager().wakeup()
+
+    def join(self, timeout=None):
+        """ Block until the process has exited and all of its output has been handled """
+
+        self.complete.wait(timeout)
+
+    def _terminate(self):
+        if self.process is None or self._killTime is not None:
+            return
+
+        self._killTime = time.time()
+
+        try:
+            self.process.terminate()
+        except OSError:
+            # The process has already exited
+            pass
+
+    def _readerThread(self):
+        for line in iter(self.process.stdout.readline, ''):
+            self._queue.put(line)
+        self._queue.put('')
+
+    def _readAvailable(self):
+        data = os.read(self.fd, 65536)
+
+        if data == '':
+            # EOF
+            self._flush()
+            self.fd = None
+        else:
+            self._handleOutput(data)
+
+    def _readQueued(self):
+        if self._queue is None:
+            return
+
+        while True:
+            try:
+                data = self._queue.get_nowait()
+            except Queue.Empty:
                 return
 
-            # Output to either a RichTextCtrl or the console
-            if self.logFunction is not None:
-                output = self.process.stdout.readline() # Blocking :(
+            if data == '':
+                self._flush()
+                self._queue = None
+                return
+
+            self._handleOutput(data)
+
+    def _handleOutput(self, data):
+        self._buffer += data
 
-                # Check for EOF (indicated by an empty string). We really
-                # shouldn't have to do this, because we are polling for the
-                # returncode once per readline, but for some reason on Windows
-                # we will get a couple hundred EOFs before the process is marked
-                # as completed.
+        # Only pass on complete lines, so messages are never split
+        end = self._buffer.rfind("\n") + 1
+        if end == 0:
+            return
+
+        text, self._buffer = self._buffer[:end], self._buffer[end:]
+        self._log(text)
 
-                if output == '':
-                    break
+    def _flush(self):
+        if self._buffer:
+            self._log(self._buffer)
+            self._buffer = ""
 
-                self.logFunction(output)
+    def _log(self, text):
+        # Keep quiet after being killed
+        if not self.running:
+            return
 
-            # Check the status of the process
-            self.process.poll()
+        # Don't let a broken log function take down the event loop
+        try:
+            if self.chunked:
+                self.logFunction(text)
+            else:
+                for line in text.splitlines(True):
+                    self.logFunction(line)
+        except Exception:
+            logging.exception("Error in log function for process `{}`".format(' '.join(self.cmd)))
 
-            # If we're not logging, limit our poll frequency
-            # (In the case of logging, readline() effectively does something similar)
-            if self.logFunction is None:
-                time.sleep(0.01)
+    def _update(self, now):
+        """ Check limits and exit status.  Returns True once the process is
+            finished and there is nothing left to do for it. """
+
+        if self._killTime is None:
+            if self.timeout is not None and now - self.startTime > self.timeout:
+                self.killReason = "timeout"
+            elif self.memory_limit is not None:
+                memory = _getMemoryUsage(self.process.pid)
+                if memory is not None and memory > self.memory_limit:
+                    self.killReason = "memory limit"
+
+            if self.killReason is not None:
+                logging.warning("Killing process `{}` after exceeding its {}".format(' '.join(self.cmd), self.killReason))
+                self.running = False
+                self._terminate()
+        elif now - self._killTime > KILL_GRACE_PERIOD:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+
+        if self.process.poll() is None:
+            return False
 
         # Grab any remaining output (often an error)
-        if self.logFunction is not None:
-            output = self.process.stdout.readlines()
-            for line in output:
-                self.logFunction(line)
+        if self.fd is not None or self._queue is not None:
+            if not self.running:
+                # Nobody is listening anymore
+                self.fd = self._queue = None
+            else:
+                return False
+
+        if self.process.stdout is not None:
+            self.process.stdout.close()
 
         # Call any callback function if terminated succesfully
         if self.callback is not None and self.running:
-            self.callback()
+            try:
+                self.callback()
+            except Exception:
+                logging.exception("Error in completion callback for process `{}`".format(' '.join(self.cmd)))
+
+        self.complete.set()
+
+        return True
 
+# Old name, from when each process had its own reader thread
+AsynchronousProcessThread = AsynchronousProcess
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+""" ===================================================
+    batchCompile.py - Compile many specifications at once
+    ===================================================
+
+    Headless entry point for compiling a batch of specifications in parallel,
+    e.g. for regression testing.  Each specification is compiled in its own
+    worker process and its own output directory, so the source projects are
+    left untouched and runs cannot clobber each other's files.
+"""
+
+import os, sys
+import re
+import time
+import glob
+import shutil
+import getopt
+import signal
+import logging
+import textwrap
+import multiprocessing
+import Queue
+
+import globalConfig
+import project
+
+STAGES = ["decompose", "ltl", "smv", "synthesis"]
+
+def usage(script_name):
+    """ Print command-line usage information. """
+
+    print textwrap.dedent("""\
+                              Usage: %s [-h] [-j N] [-t SECONDS] [-o DIR] spec_file_or_dir [...]
+
+                              Compiles each given specification (or every *.spec file one level
+                              below each given directory) and prints a summary table.
+
+                              -h, --help:
+                                  Display this message
+                              -j N, --jobs N:
+                                  Compile up to N specifications at once (default: one per CPU)
+                              -t SECONDS, --timeout SECONDS:
+                                  Give up on any specification that takes longer than SECONDS
+                              -o DIR, --output-dir DIR:
+                                  Write the outputs for each specification to a subdirectory of DIR
+                                  (default: batch_output) """ % script_name)
+
+def findSpecFiles(paths):
+    """ Expand any directories in `paths` to the spec files in their project subdirectories """
+
+    spec_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            spec_files.extend(sorted(glob.glob(os.path.join(path, "*.spec")) +
+                                     glob.glob(os.path.join(path, "*", "*.spec"))))
+        else:
+            spec_files.append(path)
+
+    return spec_files
+
+def prepareOutputDirectory(spec_file, output_dir):
+    """ Save a copy of the project in `spec_file` into `output_dir`, still referring
+        to the original region file.  Returns the path of the new spec file, or
+        None if the project could not be loaded. """
+
+    proj = project.Project()
+    if not proj.loadProject(spec_file):
+        return None
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Configurations are only needed by some parsers, but they are small
+    config_path = os.path.join(proj.project_root, "configs")
+    if os.path.isdir(config_path) and not os.path.exists(os.path.join(output_dir, "configs")):
+        shutil.copytree(config_path, os.path.join(output_dir, "configs"))
+
+    new_spec_file = os.path.join(output_dir, os.path.basename(spec_file))
+    proj.writeSpecFile(new_spec_file)
+
+    return new_spec_file
+
+def countStrategyStates(filename):
+    """ Return the number of states in an explicit-state strategy file, or None
+        if there isn't one """
+
+    if not filename.endswith(".aut") or not os.path.exists(filename):
+        return None
+
+    state_re = re.compile(r"^State\s+\d+\s+with\s+rank", re.MULTILINE)
+    with open(filename) as f:
+        return len(state_re.findall(f.read()))
+
+def _compileWorker(index, spec_file, output_dir, result_queue):
+    """ Compile one specification and put (index, result) on `result_queue` """
+
+    # Put ourselves (and the synthesizer we spawn) in a new process group,
+    # so that everything can be killed together on timeout
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+    result = {"spec": spec_file, "output_dir": output_dir, "status": "error",
+              "realizable": None, "realizableFS": None, "stage_times": {},
+              "strategy_states": None, "total_time": None}
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Send everything to a log file instead of interleaving with other workers
+    log_file = open(os.path.join(output_dir, "compile.log"), "w")
+    sys.stdout = sys.stderr = log_file
+    logger = logging.getLogger()
+    for h in logger.handlers[:]:
+        logger.removeHandler(h)
+    logger.addHandler(logging.StreamHandler(log_file))
+
+    tic = globalConfig.best_timer()
+    c = None
+
+    try:
+        import specCompiler
+
+        new_spec_file = prepareOutputDirectory(spec_file, output_dir)
+        if new_spec_file is None:
+            logging.error("Could not load specification {}".format(spec_file))
+        else:
+            c = specCompiler.SpecCompiler(new_spec_file)
+            c_out = c.compile()
+
+            if c_out is None:
+                logging.error("Compilation failed due to parser error")
+            else:
+                realizable, realizableFS, output = c_out
+                logging.info(output)
+                result["realizable"] = realizable
+                result["realizableFS"] = realizableFS
+                result["status"] = "realizable" if realizable else "unrealizable"
+                if realizable:
+                    result["strategy_states"] = countStrategyStates(c.proj.getStrategyFilename())
+    except Exception:
+        logging.exception("Error compiling {}".format(spec_file))
+
+    if c is not None:
+        result["stage_times"] = getattr(c, "stage_times", {})
+    result["total_time"] = globalConfig.best_timer() - tic
+
+    log_file.flush()
+    result_queue.put((index, result))
+
+def _killWorker(process):
+    """ Kill a worker process along with any synthesizer it spawned """
+
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.terminate()
+    except OSError:
+        pass
+
+    process.join()
+
+def compileSpecs(spec_files, output_root="batch_output", processes=None, timeout=None):
+    """ Compile each of `spec_files`, running up to `processes` compilations
+        at once (default: one per CPU).  Any compilation that takes longer than
+        `timeout` seconds is killed.  Each project is compiled in its own
+        subdirectory of `output_root`.
+
+        Returns a list with a result dictionary for each spec file, in order. """
+
+    if processes is None or processes <= 0:
+        processes = multiprocessing.cpu_count()
+
+    # Give every project its own output directory, even if names collide
+    output_dirs = []
+    for spec_file in spec_files:
+        name = os.path.splitext(os.path.basename(spec_file))[0]
+        output_dir = os.path.join(output_root, name)
+        i = 2
+        while output_dir in output_dirs:
+            output_dir = os.path.join(output_root, "{}_{}".format(name, i))
+            i += 1
+        output_dirs.append(output_dir)
+
+    pending = list(enumerate(zip(spec_files, output_dirs)))
+    pending.reverse()
+    running = {}  # index -> (process, start time)
+    results = [None] * len(spec_files)
+    result_queue = multiprocessing.Queue()
+
+    while pending or running:
+        # Keep all the workers busy
+        while pending and len(running) < processes:
+            index, (spec_file, output_dir) = pending.pop()
+            logging.info("Compiling {}...".format(spec_file))
+            process = multiprocessing.Process(target=_compileWorker, args=(index, spec_file, output_dir, result_queue))
+            process.daemon = True
+            process.start()
+            running[index] = (process, time.time())
+
+        try:
+            index, result = result_queue.get(timeout=0.1)
+        except Queue.Empty:
+            pass
+        else:
+            results[index] = result
+            running.pop(index)[0].join()
+            logging.info("Finished {}: {}".format(result["spec"], result["status"]))
+
+        # Deal with workers that have run out of time, or died without reporting back
+        for index, (process, start_time) in running.items():
+            if timeout is not None and time.time() - start_time > timeout:
+                status = "timeout"
+            elif not process.is_alive() and result_queue.empty():
+                status = "crashed"
+            else:
+                continue
+
+            _killWorker(process)
+            del running[index]
+            spec_file, output_dir = spec_files[index], output_dirs[index]
+            results[index] = {"spec": spec_file, "output_dir": output_dir, "status": status,
+                              "realizable": None, "realizableFS": None, "stage_times": {},
+                              "strategy_states": None, "total_time": time.time() - start_time}
+            logging.warning("Finished {}: {}".format(spec_file, status))
+
+    return results
+
+def formatSummary(results):
+    """ Return a plain-text table summarizing `results` from compileSpecs() """
+
+    def fmt(value, spec="{:.2f}"):
+        return "-" if value is None else spec.format(value)
+
+    header = ["Specification", "Result"] + [s.capitalize() for s in STAGES] + ["Total (s)", "States"]
+    rows = [header]
+    for r in results:
+        rows.append([os.path.basename(r["spec"]), r["status"]] +
+                    [fmt(r["stage_times"].get(s)) for s in STAGES] +
+                    [fmt(r["total_time"]), fmt(r["strategy_states"], "{}")])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(w) for cell, w in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    lines.append("")
+    lines.append(", ".join("{} {}".format(n, status) for status, n in sorted(counts.items())))
+
+    return "\n".join(lines)
+
+### Command-line argument parsing ###
+
+if __name__ == "__main__":
+    processes = None
+    timeout = None
+    output_root = "batch_output"
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hj:t:o:", ["help", "jobs=", "timeout=", "output-dir="])
+    except getopt.GetoptError:
+        logging.exception("Bad arguments")
+        usage(sys.argv[0])
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage(sys.argv[0])
+            sys.exit()
+        elif opt in ("-j", "--jobs"):
+            try:
+                processes = int(arg)
+            except ValueError:
+                logging.error("Invalid number of jobs '{}'".format(arg))
+                sys.exit(2)
+        elif opt in ("-t", "--timeout"):
+            try:
+                timeout = float(arg)
+            except ValueError:
+                logging.error("Invalid timeout '{}'".format(arg))
+                sys.exit(2)
+        elif opt in ("-o", "--output-dir"):
+            output_root = arg
+
+    spec_files = findSpecFiles(args)
+    if not spec_files:
+        usage(sys.argv[0])
+        sys.exit(2)
+
+    results = compileSpecs(spec_files, output_root, processes, timeout)
+
+    print
+    print formatSummary(results)
+
+    # Exit with an error if anything failed to compile at all
+    sys.exit(0 if all(r["status"] in ("realizable", "unrealizable") for r in results) else 1)
@@ -19,6 +19,15 @@ import logging
 #       - stutter state removal
 #       - minimal Y after Z change
 
+def fileHasTransitions(filename):
+    """ Return True if the strategy BDD in `filename` has any transition at all.
+        Unlike loading the strategy for use, no states are enumerated. """
+
+    strat = BDDStrategy()
+    strat._loadFromFile(filename)
+
+    return bool(strat.strategy)
+
 class BDDStrategy(strategy.Strategy):
     def __init__(self):
         super(BDDStrategy, self).__init__()
@@ -1,29 +1,91 @@
 
 import math, re, sys, random, os, subprocess, time
 from copy import copy, deepcopy
-from logic import to_cnf
-from multiprocessing import Pool
+from tseitin import encodeFormula, clauseToString
+from picosatBinding import loadLibrary, IncrementalSolver
+from multiprocessing import Pool, Event
 import threading
 import itertools
 import logging
 import random
+import atexit
+import numpy
+import globalConfig
 
-USE_MULTIPROCESSING = False
+# These can be changed in the [cores] section of global.cfg
+USE_MULTIPROCESSING = globalConfig.getConfigOption("cores", "multiprocessing", False)
+NUM_PROCESSES = globalConfig.getConfigOption("cores", "processes", 0) # 0 means one per CPU
+FIRST_CORE_ONLY = globalConfig.getConfigOption("cores", "first_core_only", False)
+USE_INCREMENTAL_SAT = globalConfig.getConfigOption("cores", "incremental_sat", False) # only if a shared PicoSAT library is found
 
-def runMap(function, inputs):
-    """ Wrapper for single- and multi-threaded versions of map, to make
+# Worker pool shared by all core-finding calls, created on first use
+_pool = None
+_poolLock = threading.Lock()
+# Set to tell workers that the rest of the current map is no longer needed
+_cancelEvent = None
+
+def _initWorker(cancelEvent):
+    global _cancelEvent
+    _cancelEvent = cancelEvent
+
+def _isCancelled():
+    return _cancelEvent is not None and _cancelEvent.is_set()
+
+def getPool():
+    """ Return the persistent worker pool, creating it if necessary """
+
+    global _pool, _cancelEvent
+
+    if _pool is None:
+        _cancelEvent = Event()
+        _pool = Pool(NUM_PROCESSES or None, _initWorker, (_cancelEvent,))
+        atexit.register(shutdownPool)
+
+    return _pool
+
+def shutdownPool():
+    """ Terminate the persistent worker pool, if there is one """
+
+    global _pool
+
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+def runMap(function, inputs, stopCondition=None):
+    """ Wrapper for single- and multi-process versions of map, to make
         it easy to disable multiprocessing for debugging purposes
+
+        If `stopCondition` is given, outputs are checked in input order and the
+        rest of the map is cancelled as soon as `stopCondition(output)` is True.
+        In that case the returned list ends with that output.
     """
 
-    logging.debug("Starting map ({}-threaded): {}".\
+    logging.debug("Starting map ({}-process): {}".\
                   format("multi" if USE_MULTIPROCESSING else "single", function.__name__))
 
+    outputs = []
+
     if USE_MULTIPROCESSING:
-        pool = Pool()
-        outputs = pool.map(function, inputs, chunksize = 1)   
-        pool.terminate()
+        # Only one map at a time may use the pool, since they share the cancel flag
+        with _poolLock:
+            results = getPool().imap(function, inputs, chunksize = 1)
+            for output in results:
+                outputs.append(output)
+                if stopCondition is not None and stopCondition(output):
+                    # Tell any remaining jobs to give up, and wait for them to do so
+                    _cancelEvent.set()
+                    for _ in results:
+                        pass
+                    break
+            _cancelEvent.clear()
     else:
-        outputs = map(function, inputs)   
+        for input in inputs:
+            output = function(input)
+            outputs.append(output)
+            if stopCondition is not None and stopCondition(output):
+                break
 
     logging.debug("Finished map: {}".format(function.__name__))
 
@@ -31,8 +93,9 @@ def runMap(function, inputs):
 
 def conjunctsToCNF(conjuncts, propList):
     #takes a list of LTL formulas and a list of propositions used in them,
-    #and converts them into DIMACS CNF format replacing each proposition
-    #with its index in the list. 
+    #and converts them into CNF replacing each proposition with its index
+    #in the list. CNFs are flat integer arrays of DIMACS-style literals, with
+    #each clause terminated by a 0 (see clausesToDimacs).
     #returns:
     #         mapping: a mapping from LTL formulas to CNF clause numbers
     #         cnfMapping: a mapping from LTL formulas to CNFs 
@@ -42,44 +105,61 @@ def conjunctsToCNF(conjuncts, propList):
     #                     (useful for further unrolling later)
     #         goalClauses: CNFS corresponding to goal formulas
     #                     (useful for checking goals at each time step)
+    #         numVars: number of variables per time step (propositions followed
+    #                     by the auxiliary variables of the Tseitin encoding)
     
-    propListNext = map(lambda s: 'next_'+s, propList)
-    
-    props = {propList[x]:x+1 for x in range(0,len(propList))}
-    propsNext = {propListNext[x]:len(propList)+x+1 for x in range(0,len(propListNext))}
     mapping = {conjuncts[x]:[] for x in range(0,len(conjuncts))}
     
     cnfClauses = []
     transClauses = []
     goalClauses = []
     n = 0 #counts number of clauses generated for mapping LTL to line numbers
-    p = len(props)+len(propsNext)  
-    
     
     allCnfs = runMap(lineToCnf, conjuncts)   
+
+    #auxiliary variables are allocated in each time step right after the propositions,
+    #so that unrolling can keep shifting every variable by a whole time step
+    propListNext = map(lambda s: 'next_'+s, propList)
+    known = set(propList + propListNext)
+    numAux = sum(len([name for name in names if name not in known]) for clauses, names in filter(None, allCnfs))
+    numVars = len(propList) + numAux
+
+    props = {propList[x]:x+1 for x in range(0,len(propList))}
+    propsNext = {propListNext[x]:numVars+x+1 for x in range(0,len(propListNext))}
+    nextAux = len(propList) + 1
     
     #associate original LTL conjuncts with CNF clauses
-    cnfMapping = {line:cnf.split("&") for cnf, line in zip(allCnfs,conjuncts) if cnf}  
+    cnfMapping = {}
     for cnf, lineOld in zip(allCnfs,conjuncts):     
       if cnf: 
-        allClauses = cnf.split("&");
-        for clause in allClauses:    
-            clause = re.sub('[()]', '', clause)   
-            clause = re.sub('[|]', '', clause)           
-            clause = re.sub('~', '-', clause)    
-            #replace prop names with var numbers
-            for k in propsNext.keys():
-                clause = re.sub("\\b"+k+"\\b",str(propsNext[k]), clause)
-            for k in props.keys():
-                clause = re.sub("\\b"+k+"\\b",str(props[k]), clause)   
-            #add trailing 0   
-            if "<>" in lineOld:
-                goalClauses.append(clause.strip()+" 0\n")
-            elif "[]" in lineOld:
-                transClauses.append(clause.strip()+" 0\n")
-                cnfClauses.append(clause.strip()+" 0\n")                                
+        allClauses, names = cnf
+        cnfMapping[lineOld] = [clauseToString(clause, names) for clause in allClauses]
+
+        #replace local variable numbers with global ones
+        varNumbers = [0] # placeholder so that clause terminators map to 0
+        for name in names:
+            if name in props:
+                varNumbers.append(props[name])
+            elif name in propsNext:
+                varNumbers.append(propsNext[name])
             else:
-                cnfClauses.append(clause.strip()+" 0\n")         
+                if name is not None:
+                    #treat it as unconstrained
+                    logging.error("Unknown proposition {!r} in {!r}".format(name, lineOld))
+                varNumbers.append(nextAux)
+                nextAux += 1
+
+        #add trailing 0s and renumber all literals at once
+        localClauses = numpy.array([l for clause in allClauses for l in clause + [0]], dtype=int)
+        clauses = numpy.sign(localClauses) * numpy.array(varNumbers)[numpy.abs(localClauses)]
+
+        if "<>" in lineOld:
+            goalClauses.append(clauses)
+        elif "[]" in lineOld:
+            transClauses.append(clauses)
+            cnfClauses.append(clauses)
+        else:
+            cnfClauses.append(clauses)
             
         if not "<>" in lineOld:
             #for non-goal (i.e. trans and init) formulas, extend mapping with line nos.
@@ -87,7 +167,24 @@ def conjunctsToCNF(conjuncts, propList):
             mapping[lineOld].extend(range(n+1,n+1+len(allClauses)))    
             n = n + len(allClauses)
                         
-    return mapping, cnfMapping, cnfClauses, transClauses, goalClauses
+    cnfClauses, transClauses, goalClauses = [numpy.concatenate(c) if c else numpy.zeros(0, dtype=int)
+                                             for c in (cnfClauses, transClauses, goalClauses)]
+
+    return mapping, cnfMapping, cnfClauses, transClauses, goalClauses, numVars
+
+def numClauses(clauses):
+    #number of clauses in a flat, 0-terminated clause array
+    return int(numpy.count_nonzero(clauses == 0))
+
+def shiftClauses(clauses, offset):
+    #renames every variable in a flat clause array to the one `offset` further on
+    #(e.g. offset numProps moves the clauses forward by one time step)
+    return clauses + numpy.sign(clauses) * offset
+
+def clausesToDimacs(clauses):
+    #DIMACS text for a flat, 0-terminated clause array; one clause per line
+    tokens = numpy.where(clauses == 0, "0\n", numpy.char.add(clauses.astype(str), " "))
+    return "".join(tokens.tolist())
     
 
 def cnfToConjuncts(cnfIndices, mapping, cnfMapping):
@@ -109,21 +206,11 @@ def cnfToConjuncts(cnfIndices, mapping, cnfMapping):
 
 
 def lineToCnf(line):
-        #converts a single LTL formula into CNF form 
+        #converts a single LTL formula into an equisatisfiable CNF using the
+        #Tseitin transformation (see tseitin.TseitinEncoder for the format)
         line = stripLTLLine(line)
         if line!='':
-            line = re.sub('s\.','',line)
-            line = re.sub('e\.','',line)   
-            line = re.sub(r'(next\(\s*!)', r'(!next_', line)         
-            line = re.sub(r'(next\(\s*)', r'(next_', line)
-            line = re.sub('!', '~', line)
-            #line = re.sub('&\s*\n', '', line)
-            line = re.sub('[\s]+', ' ', line)        
-            line = re.sub('\<-\>', '<=>', line)
-            line = re.sub('->', '>>', line)
-            line = line.strip() 
-            cnf = str(to_cnf(line))            
-            return cnf
+            return encodeFormula(line)
         else:
             return None        
         
@@ -159,23 +246,26 @@ def findGuiltyLTLConjuncts(cmd, depth, numProps, init, trans, goals, mapping,  c
         #checking goal at final time step
         #note that init contains one-step unrolling of trans already
         
-        mapping = deepcopy(mapping)
         #precompute p and n
         p = (depth+2)*(numProps)
         #the +2 is because init contains one trans already 
         #(so effectively there are depth+1 time steps and one final "next" time step)        
         
-        n = (depth)*(len(trans)) + len(init) + len(goals)
+        n = (depth)*numClauses(trans) + numClauses(init) + numClauses(goals)
         if ignoreDepth == 0:
             ignoreBound = 0
         else:
-            ignoreBound = len(init) + (ignoreDepth)*len(trans)
+            ignoreBound = numClauses(init) + (ignoreDepth)*numClauses(trans)
             
         output = []
         
         #find minimal unsatisfiable core by calling picomus
         if cmd is None:
             return (False, False, [], "")   
+
+        #no need to start if a smaller depth has already found a core
+        if _isCancelled():
+            return []
                 
         #start a reader thread        
         subp = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)                                            
@@ -183,55 +273,33 @@ def findGuiltyLTLConjuncts(cmd, depth, numProps, init, trans, goals, mapping,  c
         readThread.daemon = True
         readThread.start()
         
-        
-        #send header
-        input = ["p cnf "+str(p)+" "+str(n)+"\n"]
-        subp.stdin.write(input[0])                     
-        subp.stdin.writelines(init)             
-        input.extend(init)
-        
         #Duplicating transition clauses for depth greater than 1         
-        numOrigClauses = len(trans)  
+        numOrigClauses = numClauses(trans)  
         #the depth tells you how many time steps of trans to use
         #depth 0 just checks init with goals
-        
-        
-        for i in range(1,depth+1):
-                    for clause in trans:
-                        newClause = ""
-                        for c in clause.split():
-                            intC = int(c)
-                            newClause= newClause + str(cmp(intC,0)*(abs(intC)+numProps*i)) +" "                            
-                        newClause=newClause+"\n"                                                         
-                        #send this clause
-                        subp.stdin.write(newClause)
-                        input.append(newClause)
-                        
-                    j = 0    
-                    for line in conjuncts:
-                        if "[]" in line and "<>" not in line:                      
-                            numVarsInTrans = (len(mapping[line]))/(i+1)
-                            mapping[line].extend(map(lambda x: x+numOrigClauses, mapping[line][-numVarsInTrans:]))
-                            j = j + 1
-                    #transClauses.extend(transClausesNew)  
+        #(row i-1 holds the transition clauses shifted forward by i time steps)
+        unrolledTrans = trans[numpy.newaxis,:] + numpy.outer(numpy.arange(1,depth+1)*numProps, numpy.sign(trans))
+
+        mapping = unrollMapping(mapping, conjuncts, depth, numOrigClauses, n, numClauses(goals))
                     
         #create goal clauses
-        dg = map(lambda x: ' '.join(map(lambda y: str(cmp(int(y),0)*(abs(int(y))+numProps*(depth))), x.split())) + '\n', goals)        
-        #send goalClauses
-        subp.stdin.writelines(dg)
-        input.extend(dg)
+        dg = shiftClauses(goals, numProps*depth)
+
+        #send everything to the solver as DIMACS; this is the only place clauses become text
+        input = ["p cnf "+str(p)+" "+str(n)+"\n",
+                 clausesToDimacs(numpy.concatenate([init, unrolledTrans.ravel(), dg]))]
+        subp.stdin.writelines(input)
         #send EOF
         subp.stdin.close()
         
                                 
-        #update mapping with newly added clause line numbers
-        nMinusG = n - len(goals)
-        for line in conjuncts:
-            if "<>" in line:
-                mapping[line] = range(nMinusG+1,nMinusG+len(goals)+1)
-                
-        
-        readThread.join()
+        #wait for picomus to finish, unless the result is no longer needed
+        while readThread.is_alive():
+            readThread.join(0.1)
+            if _isCancelled():
+                subp.kill()
+                readThread.join()
+                return []
         
     
 
@@ -290,10 +358,93 @@ def findGuiltyLTLConjuncts(cmd, depth, numProps, init, trans, goals, mapping,  c
         return guilty
     
  
+def unrollMapping(mapping, conjuncts, depth, numOrigClauses, n, numGoalClauses):
+        #returns a copy of the conjunct-to-clause mapping extended with the clause
+        #numbers of every unrolled time step, with the goal checked at the final step
+        #(n is the total number of clauses at this depth)
+        mapping = deepcopy(mapping)
+
+        for i in range(1,depth+1):
+                    for line in conjuncts:
+                        if "[]" in line and "<>" not in line:                      
+                            numVarsInTrans = (len(mapping[line]))/(i+1)
+                            mapping[line].extend(map(lambda x: x+numOrigClauses, mapping[line][-numVarsInTrans:]))
+
+        #update mapping with newly added clause line numbers
+        nMinusG = n - numGoalClauses
+        for line in conjuncts:
+            if "<>" in line:
+                mapping[line] = range(nMinusG+1,n+1)
+
+        return mapping
+
+def findGuiltyLTLConjunctsIncremental(lib, depths, numProps, init, trans, goals, mapping, cnfMapping, conjuncts, ignoreDepth, stopCondition=None):
+        #same as calling findGuiltyLTLConjuncts for each depth in (increasing) depths, but
+        #keeps one solver session: each depth only adds the clauses of the new time step,
+        #and every clause gets a selector literal so that the goal clauses of earlier depths
+        #can be switched off. Clause numbers are the same as in the picomus input.
+        #returns the list of guilty conjuncts for each depth, stopping early if stopCondition
+        #holds for one of them
+
+        nInit, nTrans, nGoals = numClauses(init), numClauses(trans), numClauses(goals)
+        if ignoreDepth == 0:
+            ignoreBound = 0
+        else:
+            ignoreBound = nInit + (ignoreDepth)*nTrans
+
+        #selector variables come after all time steps of the deepest unrolling
+        nextSelector = [(max(depths)+2)*numProps + 1]
+        solver = IncrementalSolver(lib, nextSelector[0] + nInit + max(depths)*nTrans + len(depths)*nGoals)
+
+        def addGuardedClauses(clauses):
+            #add (clause | !selector) for each clause; returns the selectors
+            selectors = numpy.arange(nextSelector[0], nextSelector[0] + numClauses(clauses))
+            nextSelector[0] += len(selectors)
+            guarded = clauses.copy()
+            guarded[clauses == 0] = -selectors
+            solver.addClauses(numpy.insert(guarded, numpy.flatnonzero(clauses == 0) + 1, 0))
+            return selectors
+
+        selectors = list(addGuardedClauses(init))
+        guiltyList = []
+        try:
+            for depth in depths:
+                if _isCancelled():
+                    break
+
+                #add the new time steps
+                while len(selectors) < nInit + depth*nTrans:
+                    step = (len(selectors) - nInit)/nTrans + 1
+                    selectors.extend(addGuardedClauses(shiftClauses(trans, numProps*step)))
+
+                #check the goal at the final time step
+                goalSelectors = addGuardedClauses(shiftClauses(goals, numProps*depth))
+                allSelectors = selectors[:nInit + depth*nTrans] + list(goalSelectors)
+                clauseNumber = {sel: i+1 for i, sel in enumerate(allSelectors)}
+
+                core = solver.findCore(allSelectors)
+                if core is None:
+                    logging.info("Satisfiable at depth {}".format(depth))
+                    guilty = []
+                else:
+                    logging.info("Unsatisfiable core found at depth {}".format(depth))
+                    n = len(allSelectors)
+                    depthMapping = unrollMapping(mapping, conjuncts, depth, nTrans, n, nGoals)
+                    cnfIndices = [clauseNumber[sel] for sel in core]
+                    guilty = cnfToConjuncts([idx for idx in cnfIndices if idx > ignoreBound], depthMapping, cnfMapping)
+
+                guiltyList.append(guilty)
+                if stopCondition is not None and stopCondition(guilty):
+                    break
+        finally:
+            solver.close()
+
+        return guiltyList
+
 def unsatCoreCasesWrapper(x): 
     return unsatCoreCases(*x) 
     
-def unsatCoreCases(cmd, propList, topo, badInit, conjuncts, maxDepth, numRegions):
+def unsatCoreCases(cmd, propList, topo, badInit, conjuncts, maxDepth, numRegions, firstCoreOnly=None):
      #returns the minimal unsatisfiable core (LTL formulas) given
      #        cmd: picosat command
      #        propList: list of proposition names used
@@ -302,28 +453,42 @@ def unsatCoreCases(cmd, propList, topo, badInit, conjuncts, maxDepth, numRegions
      #        conjuncts: remaining LTL formulas highlighted by preliminary analysis
      #        maxDepth: determines how many time steps we unroll 
      #        numRegions: used to determine minimum depth to prevent false alarms (every depth between numRegions+1 and maxDepth is checked)
+     #        firstCoreOnly: stop at the smallest depth that yields a core (defaults to FIRST_CORE_ONLY)
+
+        if firstCoreOnly is None:
+            firstCoreOnly = FIRST_CORE_ONLY
        
-        numProps = len(propList)
         #initial depth is set to the number of regions. This ensures that we unroll at least as 
         #far as needed to physically get to the goal
         depth = numRegions
         
         #first try without topo and init, see if it is satisfiable
         ignoreDepth = 0    
-        mapping, cnfMapping, init, trans, goals = conjunctsToCNF([badInit]+conjuncts, propList)
+        mapping, cnfMapping, init, trans, goals, numProps = conjunctsToCNF([badInit]+conjuncts, propList)
         
         logging.info("Trying to find core without topo or init") 
 
-        guiltyList = runMap(findGuiltyLTLConjunctsWrapper, itertools.izip(itertools.repeat(cmd),
-                                                                          range(1, maxDepth + 1),
-                                                                          itertools.repeat(numProps),
-                                                                          itertools.repeat(init),
-                                                                          itertools.repeat(trans), 
-                                                                          itertools.repeat(goals),
-                                                                          itertools.repeat(mapping),
-                                                                          itertools.repeat(cnfMapping),
-                                                                          itertools.repeat(conjuncts),
-                                                                          itertools.repeat(ignoreDepth)))
+        lib = loadLibrary(cmd) if USE_INCREMENTAL_SAT else None
+        if lib is not None and numClauses(trans) > 0:
+            guiltyList = findGuiltyLTLConjunctsIncremental(lib, range(1, maxDepth + 1), numProps, init, trans, goals,
+                                                           mapping, cnfMapping, conjuncts, ignoreDepth,
+                                                           stopCondition=(bool if firstCoreOnly else None))
+        else:
+            guiltyList = runMap(findGuiltyLTLConjunctsWrapper, itertools.izip(itertools.repeat(cmd),
+                                                                            range(1, maxDepth + 1),
+                                                                            itertools.repeat(numProps),
+                                                                            itertools.repeat(init),
+                                                                            itertools.repeat(trans), 
+                                                                            itertools.repeat(goals),
+                                                                            itertools.repeat(mapping),
+                                                                            itertools.repeat(cnfMapping),
+                                                                            itertools.repeat(conjuncts),
+                                                                            itertools.repeat(ignoreDepth)),
+                              stopCondition=(bool if firstCoreOnly else None))
+
+        if firstCoreOnly and guiltyList and guiltyList[-1]:
+            logging.info("Unsat core found without topo or init at depth {}".format(len(guiltyList)))
+            return trans, set(guiltyList[-1])
 
         #allGuilty = map((lambda (depth, cnfs): self.guiltyParallel(depth+1, cnfs, mapping)), list(enumerate(allCnfs)))
             
@@ -340,7 +505,7 @@ def unsatCoreCases(cmd, propList, topo, badInit, conjuncts, maxDepth, numRegions
             
         #then try just topo and init and see if it is unsatisfiable. If so, return core.
         logging.info("Trying to find core with just topo and init") 
-        mapping,  cnfMapping, init, trans, goals = conjunctsToCNF([topo, badInit], propList)
+        mapping,  cnfMapping, init, trans, goals, numProps = conjunctsToCNF([topo, badInit], propList)
        
                     
         guilty = findGuiltyLTLConjuncts(cmd,maxDepth,numProps,init,trans,goals,mapping,cnfMapping,[topo, badInit],0)
@@ -353,7 +518,7 @@ def unsatCoreCases(cmd, propList, topo, badInit, conjuncts, maxDepth, numRegions
             return trans, guilty
         
         #if the problem is in conjunction with the topo but not just topo, keep increasing the depth until something more than just topo is returned
-        mapping,  cnfMapping, init, trans, goals = conjunctsToCNF([topo,badInit] + conjuncts, propList)
+        mapping,  cnfMapping, init, trans, goals, numProps = conjunctsToCNF([topo,badInit] + conjuncts, propList)
         
         logging.info("Trying to find core with everything")
         
@@ -0,0 +1,98 @@
+"""
+    ======================================================
+    picosatBinding.py - Incremental PicoSAT via its library
+    ======================================================
+
+    Minimal ctypes wrapper around a shared build of the PicoSAT library
+    (e.g. configured with `./configure --shared` in the picosat directory
+    next to picomus), so that one solver session can be reused while
+    clauses are added, instead of starting picomus over for each query.
+"""
+
+import os
+import ctypes
+import logging
+
+PICOSAT_SATISFIABLE = 10
+PICOSAT_UNSATISFIABLE = 20
+
+LIBRARY_NAMES = ["libpicosat.so", "libpicosat.dylib", "picosat.dll"]
+
+def loadLibrary(cmd):
+    """ Look for a shared PicoSAT library next to the picomus command `cmd`.
+        Returns a ctypes library handle, or None if none could be loaded. """
+
+    if cmd is None:
+        return None
+
+    if not isinstance(cmd, basestring):
+        cmd = cmd[0]
+
+    for name in LIBRARY_NAMES:
+        path = os.path.join(os.path.dirname(cmd), name)
+        if not os.path.exists(path):
+            continue
+
+        try:
+            lib = ctypes.CDLL(path)
+        except OSError as e:
+            logging.warning("Could not load PicoSAT library {}: {}".format(path, e))
+            continue
+
+        lib.picosat_init.restype = ctypes.c_void_p
+        lib.picosat_reset.argtypes = [ctypes.c_void_p]
+        lib.picosat_adjust.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.picosat_add.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.picosat_assume.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.picosat_sat.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.picosat_mus_assumptions.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]
+        lib.picosat_mus_assumptions.restype = ctypes.POINTER(ctypes.c_int)
+
+        logging.debug("Using PicoSAT library in " + path)
+        return lib
+
+    return None
+
+class IncrementalSolver(object):
+    """ One PicoSAT session.  Clauses are added permanently; each query to
+        `findCore` only uses the clauses whose selector literals are assumed. """
+
+    def __init__(self, lib, numVars=0):
+        self.lib = lib
+        self.ps = lib.picosat_init()
+        if numVars > 0:
+            lib.picosat_adjust(self.ps, numVars)
+
+    def addClauses(self, clauses):
+        """ Add a flat, 0-terminated array of clause literals """
+
+        add = self.lib.picosat_add
+        for l in clauses:
+            add(self.ps, int(l))
+
+    def findCore(self, assumptions):
+        """ Solve under `assumptions`.  Returns None if satisfiable, otherwise
+            a minimal subset of the assumptions that is unsatisfiable. """
+
+        for l in assumptions:
+            self.lib.picosat_assume(self.ps, int(l))
+
+        if self.lib.picosat_sat(self.ps, -1) != PICOSAT_UNSATISFIABLE:
+            return None
+
+        core = []
+        mus = self.lib.picosat_mus_assumptions(self.ps, None, None, 0)
+        i = 0
+        while mus[i] != 0:
+            core.append(mus[i])
+            i += 1
+
+        return core
+
+    def close(self):
+        if self.ps is not None:
+            self.lib.picosat_reset(self.ps)
+            self.ps = None
+
+    def __del__(self):
+        self.close()
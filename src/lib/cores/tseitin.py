@@ -0,0 +1,191 @@
+"""
+    =================================================
+    tseitin.py - Linear-size CNF encoding of formulas
+    =================================================
+
+    Converts the propositional (one-step) part of an LTL formula into an
+    equisatisfiable CNF using the Tseitin transformation, working directly on
+    the parse tree produced by LTLParser.  Unlike distributing ands over ors,
+    the size of the result is linear in the size of the formula.
+"""
+
+from LTLParser.LTLFormula import parseLTL, transformTree
+
+
+class TseitinEncoder(object):
+    """ Encodes a single formula.  Variables are numbered locally from 1;
+        `names[v-1]` is the proposition name of variable `v` (with a "next_"
+        prefix if it refers to the next time step), or None if `v` is an
+        auxiliary Tseitin variable. """
+
+    def __init__(self):
+        self.names = []
+        self.clauses = []
+        self._vars = {}
+
+    def encode(self, tree):
+        """ Add clauses asserting `tree`, and return (clauses, names) """
+
+        # Split conjunctions at the top level into separate assertions
+        stack = [(tree, False)]
+        while stack:
+            node, is_next = stack.pop()
+            if node[0] == "Conjunction":
+                stack.extend((c, is_next) for c in reversed(node[1:]))
+            elif node[0] == "UnaryFormula" and node[1][0] != "NotOperator":
+                stack.append((node[2], is_next or node[1][0] == "NextOperator"))
+            else:
+                self._addClause(self._clauseLiterals(node, is_next))
+
+        return self.clauses, self.names
+
+    def _addClause(self, literals):
+        # Simplify away constants
+        if any(l is True for l in literals):
+            return
+        self.clauses.append([l for l in literals if l is not False])
+
+    def _clauseLiterals(self, tree, is_next):
+        """ Return a list of literals whose disjunction is equivalent to `tree`,
+            introducing auxiliary variables only below the disjunctive top """
+
+        literals = []
+        stack = [(tree, is_next, True)]
+        while stack:
+            node, is_next, positive = stack.pop()
+            if node[0] == "Disjunction" and positive:
+                stack.extend((c, is_next, True) for c in reversed(node[1:]))
+            elif node[0] == "Conjunction" and not positive:
+                stack.extend((c, is_next, False) for c in reversed(node[1:]))
+            elif node[0] == "Implication" and positive:
+                stack.append((node[2], is_next, True))
+                stack.append((node[1], is_next, False))
+            elif node[0] == "UnaryFormula" and node[1][0] == "NotOperator":
+                stack.append((node[2], is_next, not positive))
+            elif node[0] == "UnaryFormula":
+                stack.append((node[2], is_next or node[1][0] == "NextOperator", positive))
+            else:
+                literal = self._literal(node, is_next)
+                literals.append(literal if positive else _negate(literal))
+
+        return literals
+
+    def _literal(self, tree, is_next):
+        """ Return a literal (or constant) equivalent to `tree` """
+
+        return transformTree((tree, is_next), self._expand)
+
+    def _expand(self, item):
+        tree, is_next = item
+
+        if tree[0] == "TRUE":
+            return None, True
+        elif tree[0] == "FALSE":
+            return None, False
+        elif tree[0] == "Assignment":
+            return None, self._variable(tree[1][0], is_next)
+        elif tree[0] == "UnaryFormula":
+            operator = tree[1][0]
+            if operator == "NotOperator":
+                return _negateOnly, [(tree[2], is_next)]
+            # Other temporal operators have already been taken care of by unrolling
+            return _onlyChild, [(tree[2], is_next or operator == "NextOperator")]
+        elif tree[0] == "Conjunction":
+            return self._andGate, [(c, is_next) for c in tree[1:]]
+        elif tree[0] == "Disjunction":
+            return self._orGate, [(c, is_next) for c in tree[1:]]
+        elif tree[0] == "Implication":
+            return self._impliesGate, [(tree[1], is_next), (tree[2], is_next)]
+        elif tree[0] == "Biimplication":
+            return self._iffGate, [(tree[1], is_next), (tree[2], is_next)]
+        elif tree[0] == "Xor":
+            return self._xorGate, [(c, is_next) for c in tree[1:]]
+        else:
+            raise ValueError("Cannot encode {!r} as CNF".format(tree[0]))
+
+    def _variable(self, name, is_next):
+        # Drop the agent prefix (s./e.) to match the proposition list
+        if name.startswith("s.") or name.startswith("e."):
+            name = name[2:]
+        if is_next:
+            name = "next_" + name
+
+        if name not in self._vars:
+            self.names.append(name)
+            self._vars[name] = len(self.names)
+
+        return self._vars[name]
+
+    def _newAux(self):
+        self.names.append(None)
+        return len(self.names)
+
+    def _andGate(self, literals):
+        # Note: constants must be compared by identity, since True == 1
+        if any(l is False for l in literals):
+            return False
+        literals = [l for l in literals if l is not True]
+        if not literals:
+            return True
+        if len(literals) == 1:
+            return literals[0]
+
+        x = self._newAux()
+        for l in literals:
+            self.clauses.append([-x, l])
+        self.clauses.append([x] + [-l for l in literals])
+        return x
+
+    def _orGate(self, literals):
+        return _negate(self._andGate([_negate(l) for l in literals]))
+
+    def _impliesGate(self, literals):
+        a, b = literals
+        return self._orGate([_negate(a), b])
+
+    def _iffGate(self, literals):
+        a, b = literals
+        if isinstance(a, bool):
+            return b if a else _negate(b)
+        if isinstance(b, bool):
+            return a if b else _negate(a)
+
+        x = self._newAux()
+        self.clauses.extend([[-x, -a, b], [-x, a, -b], [x, a, b], [x, -a, -b]])
+        return x
+
+    def _xorGate(self, literals):
+        result = literals[0]
+        for l in literals[1:]:
+            result = _negate(self._iffGate([result, l]))
+        return result
+
+
+def _negate(literal):
+    if isinstance(literal, bool):
+        return not literal
+    return -literal
+
+def _negateOnly(results):
+    return _negate(results[0])
+
+def _onlyChild(results):
+    return results[0]
+
+def encodeFormula(text):
+    """ Return (clauses, names) for the propositional formula `text`.  See
+        `TseitinEncoder` for the meaning of the result. """
+
+    return TseitinEncoder().encode(parseLTL(text))
+
+def clauseToString(clause, names):
+    """ Human-readable representation of a clause, for reporting cores """
+
+    literals = []
+    for l in clause:
+        name = names[abs(l)-1]
+        if name is None:
+            name = "_aux{}".format(abs(l))
+        literals.append(("~" if l < 0 else "") + name)
+
+    return "(" + " | ".join(literals) + ")"
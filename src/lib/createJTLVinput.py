@@ -8,9 +8,10 @@
     includes the topological relations and the given spec.
 """
 import math
+import bisect
 import parseEnglishToLTL
 import textwrap
-from LTLParser.LTLFormula import LTLFormula, LTLFormulaType, treeToString
+from LTLParser.LTLFormula import LTLFormula, LTLFormulaType, treeToString, iterFormulaChunks
 
 def createSMVfile(fileName, sensorList, robotPropList):
     ''' This function writes the skeleton SMV file.
@@ -58,94 +59,205 @@ def createSMVfile(fileName, sensorList, robotPropList):
     smvFile.close()
     
 
-def createTopologyFragment(adjData, regions, use_bits=True):
+def createTopologyFragment(adjData, regions, use_bits=True, bitEncode=None, compact=False):
+    """ Returns the topological relation (adjacency) of the map as a single
+        formula string.  See `iterTopologyFragment` for the arguments. """
+
+    return " & \n".join(iterTopologyFragment(adjData, regions, use_bits, bitEncode, compact))
+
+def iterTopologyFragment(adjData, regions, use_bits=True, bitEncode=None, compact=False):
+    """ Generator yielding one conjunct of the topological relation per region,
+        followed by the valid-region-encoding constraint.
+
+        If `bitEncode` (as returned by `parseEnglishToLTL.bitEncoding`) is given,
+        it is used instead of recalculating the encoding.  If `compact` is True
+        (only meaningful with `use_bits`), the allowed destinations of each region
+        are grouped by shared bit prefixes, which yields a much shorter formula
+        for large maps. """
+
     if use_bits:
-        numBits = int(math.ceil(math.log(len(adjData),2)))
-        # TODO: only calc bitencoding once
-        bitEncode = parseEnglishToLTL.bitEncoding(len(adjData), numBits)
+        if bitEncode is None:
+            bitEncode = getBitEncoding(len(adjData))
         currBitEnc = bitEncode['current']
         nextBitEnc = bitEncode['next']
-
-    # The topological relation (adjacency)
-    adjFormulas = []
+        numBits = int(math.ceil(math.log(len(adjData),2)))
 
     for Origin in range(len(adjData)):
         # from region i we can stay in region i
-        adjFormula = '\t\t\t []( ('
-        adjFormula = adjFormula + (currBitEnc[Origin] if use_bits else "s."+regions[Origin].name)
-        adjFormula = adjFormula + ') -> ( ('
-        adjFormula = adjFormula + (nextBitEnc[Origin] if use_bits else "next(s."+regions[Origin].name+")")
-        adjFormula = adjFormula + ')'
-        
-        for dest in range(len(adjData)):
-            if adjData[Origin][dest]:
-                # not empty, hence there is a transition
-                adjFormula = adjFormula + '\n\t\t\t\t\t\t\t\t\t| ('
-                adjFormula = adjFormula + (nextBitEnc[dest] if use_bits else "next(s."+regions[dest].name+")")
-                adjFormula = adjFormula + ') '
+        if compact and use_bits and numBits > 0:
+            dests = [Origin] + [dest for dest in range(len(adjData)) if adjData[Origin][dest] and dest != Origin]
+            nextFormulas = _prefixCubes(sorted(dests), len(adjData), numBits)
+        else:
+            nextFormulas = [nextBitEnc[Origin] if use_bits else "next(s."+regions[Origin].name+")"]
+            for dest in range(len(adjData)):
+                if adjData[Origin][dest]:
+                    # not empty, hence there is a transition
+                    nextFormulas.append(nextBitEnc[dest] if use_bits else "next(s."+regions[dest].name+")")
+
+        adjFormula = ['\t\t\t []( (',
+                      (currBitEnc[Origin] if use_bits else "s."+regions[Origin].name),
+                      ') -> ( (',
+                      nextFormulas[0],
+                      ')']
+        for nextFormula in nextFormulas[1:]:
+            adjFormula.extend(['\n\t\t\t\t\t\t\t\t\t| (', nextFormula, ') '])
 
         # closing this region
-        adjFormula = adjFormula + ' ) ) '
+        adjFormula.append(' ) ) ')
 
-        adjFormulas.append(adjFormula)
+        yield "".join(adjFormula)
 
     # In a BDD strategy, it's best to explicitly exclude these
-    adjFormulas.append("[]"+createInitialRegionFragment(regions, use_bits))
-
-    return " & \n".join(adjFormulas)
-
-def createInitialRegionFragment(regions, use_bits=True):
+    yield "[]"+createInitialRegionFragment(regions, use_bits, bitEncode)
+
+def _prefixCubes(codes, numRegions, numBits):
+    """ Cover the sorted list of region `codes` with the fewest bit-prefix cubes
+        (over the next-state bits).  Codes >= numRegions never occur, so they are
+        treated as don't-cares. """
+
+    cubes = []
+
+    # Each stack entry is (prefix value, prefix length)
+    stack = [(0, 0)]
+    while stack:
+        prefix, depth = stack.pop()
+        lo = prefix << (numBits - depth)
+        if lo >= numRegions:
+            continue
+        hi = min(lo + (1 << (numBits - depth)), numRegions)
+
+        count = bisect.bisect_left(codes, hi) - bisect.bisect_left(codes, lo)
+        if count == 0:
+            continue
+        elif count == hi - lo:
+            if depth == 0:
+                return ["TRUE"]
+            bits = []
+            for bitNum in range(depth):
+                if (prefix >> (depth - 1 - bitNum)) & 1:
+                    bits.append('next(s.bit' + str(bitNum) + ')')
+                else:
+                    bits.append('!next(s.bit' + str(bitNum) + ')')
+            cubes.append('(' + ' & '.join(bits) + ')')
+        else:
+            # Push the 1-branch first so that cubes come out in ascending order
+            stack.append(((prefix << 1) | 1, depth + 1))
+            stack.append((prefix << 1, depth + 1))
+
+    return cubes
+
+def createInitialRegionFragment(regions, use_bits=True, bitEncode=None):
     # Setting the system initial formula to allow only valid
     #  region (encoding). This may be redundant if an initial region is
     #  specified, but it is here to ensure the system cannot start from
     #  an invalid, or empty region (encoding).
     if use_bits:
-        numBits = int(math.ceil(math.log(len(regions),2)))
-        # TODO: only calc bitencoding once
-        bitEncode = parseEnglishToLTL.bitEncoding(len(regions), numBits)
+        if bitEncode is None:
+            bitEncode = getBitEncoding(len(regions))
         currBitEnc = bitEncode['current']
-        nextBitEnc = bitEncode['next']
 
-        initreg_formula = '\t\t\t( ' + currBitEnc[0] + ' \n'
+        initreg_formula = ['\t\t\t( ' + currBitEnc[0] + ' \n']
         for regionInd in range(1,len(currBitEnc)):
-            initreg_formula = initreg_formula + '\t\t\t\t | ' + currBitEnc[regionInd] + '\n'
-        initreg_formula = initreg_formula + '\t\t\t) \n'
+            initreg_formula.append('\t\t\t\t | ' + currBitEnc[regionInd] + '\n')
+        initreg_formula.append('\t\t\t) \n')
+        initreg_formula = "".join(initreg_formula)
     else:
         initreg_formula = "\n\t({})".format(" | ".join(["({})".format(" & ".join(["s."+r2.name if r is r2 else "!s."+r2.name for r2 in regions])) for r in regions]))
         
     return initreg_formula
 
+def getBitEncoding(numRegions):
+    """ Returns the region bit encoding for `numRegions` regions, only
+        calculating it once for each map size. """
+
+    if numRegions not in _bitEncodingCache:
+        numBits = int(math.ceil(math.log(numRegions,2)))
+        _bitEncodingCache[numRegions] = parseEnglishToLTL.bitEncoding(numRegions, numBits)
+
+    return _bitEncodingCache[numRegions]
+
+_bitEncodingCache = {}
+
 def createNecessaryFillerSpec(spec_part):
     """ Both assumptions guarantees need to have at least one each of
         initial, safety, and liveness.  If any are not present,
         create trivial TRUE ones. """
 
-    if spec_part.strip() == "":
-        filler_spec = ["TRUE", "[](TRUE)", "[]<>(TRUE)"]
-    else:
-        formula = LTLFormula.fromString(spec_part)
-        filler_spec = []
-        if not formula.getConjunctsByType(LTLFormulaType.INITIAL):
-            filler_spec.append("TRUE")
-        if not formula.getConjunctsByType(LTLFormulaType.SAFETY):
-            filler_spec.append("[](TRUE)")
-        if not formula.getConjunctsByType(LTLFormulaType.LIVENESS):
-            filler_spec.append("[]<>(TRUE)")
+    types = set()
+    for conjunct in _iterConjuncts(spec_part):
+        types.add(conjunct.getType())
+        if _REQUIRED_TYPES <= types:
+            # No need to look at (or parse) the rest of the formula
+            break
+
+    filler_spec = []
+    if LTLFormulaType.INITIAL not in types:
+        filler_spec.append("TRUE")
+    if LTLFormulaType.SAFETY not in types:
+        filler_spec.append("[](TRUE)")
+    if LTLFormulaType.LIVENESS not in types:
+        filler_spec.append("[]<>(TRUE)")
 
     return " & ".join(filler_spec) 
 
-def flattenLTLFormulas(f):
+_REQUIRED_TYPES = set([LTLFormulaType.INITIAL, LTLFormulaType.SAFETY, LTLFormulaType.LIVENESS])
+
+def _iterConjuncts(f):
+    """ Generator yielding the top-level conjuncts of a formula given as a string,
+        LTLFormula, or list of strings or LTLFormulas (which are conjoined).  Strings
+        in a list are only parsed once the conjuncts before them have been used. """
+
+    if isinstance(f, (basestring, LTLFormula)):
+        f = [f]
+
+    for sf in f:
+        if isinstance(sf, basestring):
+            if sf.strip() == "":
+                continue
+            sf = LTLFormula.fromString(sf)
+
+        if sf.tree[0] == "Conjunction":
+            for t in sf.tree[1:]:
+                yield LTLFormula(t)
+        else:
+            yield sf
+
+def iterLTLFormulaChunks(f):
+    """ Generator yielding the text of a formula given as a string, LTLFormula,
+        or list of LTLFormulas (which are conjoined), one conjunct at a time.
+        A list of strings is written out part by part, joined by "\n&\n". """
+
     if isinstance(f, LTLFormula):
-        return str(f)
+        for chunk in iterFormulaChunks(f):
+            yield chunk
 
     # If we've received a list of LTLFormula, assume that they should be conjoined
-    if isinstance(f, list) and all((isinstance(sf, LTLFormula) for sf in f)):
-        return " & \n".join([treeToString(sf.tree, top_level=False) for sf in f])
+    elif isinstance(f, list) and all((isinstance(sf, LTLFormula) for sf in f)):
+        for i, sf in enumerate(f):
+            if i > 0:
+                yield " & \n"
+            yield treeToString(sf.tree, top_level=False)
 
+    elif isinstance(f, basestring):
+        yield f
+
+    elif isinstance(f, list) and all((isinstance(sf, basestring) for sf in f)):
+        for i, sf in enumerate(f):
+            if i > 0:
+                yield "\n&\n"
+            yield sf
+
+    else:
+        raise ValueError("Invalid formula type: must be either string, LTLFormula, or LTLFormula list")
+
+def flattenLTLFormulas(f):
+    return "".join(iterLTLFormulaChunks(f))
+
+def _isEmptySpec(f):
     if isinstance(f, basestring):
-        return f
+        return f.strip() == ""
 
-    raise ValueError("Invalid formula type: must be either string, LTLFormula, or LTLFormula list")
+    return isinstance(f, list) and all((isinstance(sf, basestring) and sf.strip() == "" for sf in f))
 
 def createLTLfile(fileName, spec_env, spec_sys):
     ''' This function writes the LTL file. It encodes the specification and 
@@ -156,9 +268,6 @@ def createLTLfile(fileName, spec_env, spec_sys):
     a specification
     '''
 
-    spec_env = flattenLTLFormulas(spec_env)
-    spec_sys = flattenLTLFormulas(spec_sys)
-
     # Force .ltl suffix
     if not fileName.endswith('.ltl'):
         fileName = fileName + '.ltl'
@@ -180,10 +289,11 @@ def createLTLfile(fileName, spec_env, spec_sys):
 
     # Write the environment assumptions
     # from the 'spec' input 
-    if spec_env.strip() != "":
+    if not _isEmptySpec(spec_env):
         if filler:
             ltlFile.write('& \n')
-        ltlFile.write(spec_env)
+        for chunk in iterLTLFormulaChunks(spec_env):
+            ltlFile.write(chunk)
     ltlFile.write('\n\t);\n\n')
 
     ltlFile.write('LTLSPEC -- Guarantees\n')
@@ -194,10 +304,11 @@ def createLTLfile(fileName, spec_env, spec_sys):
         ltlFile.write('\t' + filler)
 
     # Write the desired robot behavior
-    if spec_sys.strip() != "":
+    if not _isEmptySpec(spec_sys):
         if filler:
             ltlFile.write('& \n')
-        ltlFile.write(spec_sys)
+        for chunk in iterLTLFormulaChunks(spec_sys):
+            ltlFile.write(chunk)
 
     # Close the LTL formula
     ltlFile.write('\n\t);\n')
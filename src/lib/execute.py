@@ -123,15 +123,19 @@ class LTLMoPExecutor(ExecutorStrategyExtensions,ExecutorResynthesisExtensions, o
         # Tell GUI to load the spec file
         self.postEvent("SPEC", self.proj.getFilenamePrefix() + ".spec")
 
-    def loadAutFile(self, filename):
+    def loadAutFile(self, filename, proj=None):
         """
         This function loads the the .aut/.bdd file named filename and returns the strategy object.
         filename (string): name of the file with path included
+        proj (Project): project the strategy belongs to (default: the current project)
         """
-        region_domain = strategy.Domain("region",  self.proj.rfi.regions, strategy.Domain.B0_IS_MSB)
+        if proj is None:
+            proj = self.proj
+
+        region_domain = strategy.Domain("region",  proj.rfi.regions, strategy.Domain.B0_IS_MSB)
         strat = strategy.createStrategyFromFile(filename,
-                                                self.proj.enabled_sensors,
-                                                self.proj.enabled_actuators + self.proj.all_customs +  [region_domain])
+                                                proj.enabled_sensors,
+                                                proj.enabled_actuators + proj.all_customs +  [region_domain])
 
         return strat
 
@@ -241,9 +245,10 @@ class LTLMoPExecutor(ExecutorStrategyExtensions,ExecutorResynthesisExtensions, o
             logging.info("Preparing proposition mapping...")
             self.hsub.prepareMapping()
         else:
-            #print "Reloading motion control handler..."
-            #self.proj.importHandlers(['motionControl'])
-            pass
+            # The map may have been decomposed differently
+            logging.info("Reloading motion control handler...")
+            if self.hsub.reloadMotionControlHandler() is None:
+                logging.error("Could not reload motion control handler; keeping the old one.")
 
         # We are done initializing at this point if there is no aut file yet
         if strategy_file is None:
@@ -319,6 +324,9 @@ class LTLMoPExecutor(ExecutorStrategyExtensions,ExecutorResynthesisExtensions, o
             if not self.alive.isSet():
                 break
 
+            # Switch to a strategy from background resynthesis, if one is ready
+            self.swapInPendingStrategy()
+
             self.prev_outputs = self.strategy.current_state.getOutputs()
             self.prev_z = self.strategy.current_state.goal_id
 
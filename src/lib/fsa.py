@@ -8,6 +8,19 @@ import sys
 import time
 from collections import defaultdict
 
+def fileHasTransitions(filename):
+    """ Return True if any state in the automaton in `filename` has a successor,
+        reading only as far into the file as necessary. """
+
+    p = re.compile(r"With successors : \d+", re.IGNORECASE)
+
+    with open(filename, "r") as f:
+        for line in f:
+            if p.search(line):
+                return True
+
+    return False
+
 class FSAStrategy(strategy.Strategy):
     """
     An automaton object is a collection of state objects along with information about the
@@ -1,6 +1,6 @@
 """
 Module for loading and saving LTLMoP global configuration file.
-Currently, this only sets up logging.
+This sets up logging, and provides access to other global options.
 """
 
 import logging
@@ -20,6 +20,49 @@ def get_ltlmop_root():
 
     return os.path.join(p, "src")
 
+def get_cache_dir():
+    """ Return the per-user directory for LTLMoP's cache files, creating it if
+        necessary, or None if that isn't possible. """
+
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        path = os.path.join(base, "LTLMoP", "cache")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "ltlmop")
+
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    except OSError:
+        return None
+
+    return path
+
+def getConfigOption(section, option, default=None):
+    """ Return the value of `option` in `section` of the global.cfg file,
+        or `default` if it is not set.  The value is coerced to the type
+        of `default`, if one is given. """
+
+    cfg = ConfigParser.ConfigParser()
+
+    try:
+        cfg.read(os.path.join(get_ltlmop_root(), "global.cfg"))
+        value = cfg.get(section, option)
+    except (ConfigParser.Error, TypeError):
+        return default
+
+    if isinstance(default, bool):
+        return value.strip().lower() in ['true', 't', '1']
+    elif isinstance(default, int):
+        try:
+            return int(value)
+        except ValueError:
+            logging.warning("Invalid value {!r} for option '{}' in global.cfg".format(value, option))
+            return default
+
+    return value
+
 def setupLogging(loggerLevel=None):
     # Set up loggers for printing error messages
     class ColorLogFormatter(logging.Formatter):
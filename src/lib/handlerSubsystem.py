@@ -67,6 +67,8 @@ class HandlerSubsystem:
 
         self.prop2func = {}         # a mapping from a proporsition to a handler function for execution
         self.handler_instance = []  # a list of handler instances that are instantiated
+        self.main_handlers = {}     # handler instances of the main robot, by handler type class
+        self.region_indices = (None, 0, {}) # (region list, its length, {region: index}) for the current map
         self.method_configs = set() # a set of func references
 
         self.coordmap_map2lab = None# function that maps from map coord to lab coord
@@ -133,6 +135,9 @@ class HandlerSubsystem:
                     self.handler_configs[robot_type][handler_config.h_type] = []
                 self.handler_configs[robot_type][handler_config.h_type].append(handler_config)
 
+        # Write out the metadata of any new or changed handlers in one go
+        HandlerConfig.saveHandlerMetadataCache()
+
     def findHandlerTypeStringFromName(self, handler_name):
         """
         given a handler name, find folder of this handler in the handlers/share folder
@@ -337,6 +342,9 @@ class HandlerSubsystem:
             # no robot is specified
             if handler_type_class in [ht.SensorHandler, ht.ActuatorHandler]:
                 raise ValueError("A robot name is required when looking for instance of sensor or actuator handler")
+            elif handler_type_class in self.main_handlers:
+                # this has already been looked up
+                return self.main_handlers[handler_type_class]
             else:
                 # we assume it is asking for the handler of main robot
                 robot_config = self.getMainRobot()
@@ -371,9 +379,9 @@ class HandlerSubsystem:
 
         # if the region is object, we need to find the index of it
         if not isinstance(current_region, int):
-            current_region = self.executor.proj.rfi.regions.index(current_region)
+            current_region = self.getRegionIndex(current_region)
         if not isinstance(next_region, int):
-            next_region = self.executor.proj.rfi.regions.index(next_region)
+            next_region = self.getRegionIndex(next_region)
 
         if motion_handler_instance is None:
             raise ValueError("Cannot set target region, because no motionControl handler instance is found for the main robot")
@@ -383,16 +391,34 @@ class HandlerSubsystem:
 
         return arrived
 
+    def getRegionIndex(self, region):
+        """
+        Return the index of the given region object in the current map
+        """
+        regions = self.executor.proj.rfi.regions
+
+        # rebuild the lookup table whenever the map changes
+        region_list, num_regions, indices = self.region_indices
+        if region_list is not regions or num_regions != len(regions):
+            indices = {}
+            for i, r in enumerate(regions):
+                indices.setdefault(r, i)
+            self.region_indices = (regions, len(regions), indices)
+
+        try:
+            return indices[region]
+        except KeyError:
+            raise ValueError("Region {!r} is not in the current map".format(getattr(region, "name", region)))
+
     def getPose(self, cached=False):
         """
         A wrapper function that returns the pose from the pose handler of the main robot in the
         current executing config
         """
-        # get the main robot config
-        robot_config = self.getMainRobot()
-
         # first make sure the coord transformation function is ready
         if self.coordmap_map2lab is None:
+            # get the main robot config
+            robot_config = self.getMainRobot()
             self.coordmap_map2lab, self.coordmap_lab2map = robot_config.getCoordMaps()
             self.executor.proj.coordmap_map2lab, self.executor.proj.coordmap_lab2map = robot_config.getCoordMaps()
 
@@ -522,8 +548,8 @@ class HandlerSubsystem:
         # Save it to a list so we can initialize it later
         self.method_configs.add(hmc)
 
-        # Return a reference to this HMC's execute function
-        return hmc.execute
+        # Return this HMC's method, with its arguments already filled in
+        return hmc.getBoundFunction()
 
     def createPropositionMappingExecutionFunctionFromString(self, func_string, mode):
         """ Given a string description of the function(s) that some
@@ -541,12 +567,17 @@ class HandlerSubsystem:
         instantiate all the handlers of the main robot of the current executing config
         instantiate only the init handler of the non-main robot
         """
+        self.main_handlers = {}
+
         for robot in self.executing_config.robots:
             if robot.name == self.executing_config.main_robot:
                 # this is a main robot
                 for handler_type_class in ht.getAllHandlerTypeClass():
                     if handler_type_class in robot.handlers:
                         h = self.prepareHandler(robot.handlers[handler_type_class])
+                        # keep a direct reference, so it doesn't need to be looked up on every use
+                        if h is not None:
+                            self.main_handlers[handler_type_class] = h
                     # if this is a init handler, set the shared_data
                     if handler_type_class == ht.InitHandler:
                         self.executor.proj.shared_data.update(h.getSharedData())
@@ -556,6 +587,34 @@ class HandlerSubsystem:
                 # this is a init handler, set the shared_data
                 self.executor.proj.shared_data.update(h.getSharedData())
 
+    def reloadMotionControlHandler(self):
+        """
+        Instantiate the motion control handler of the main robot again, so that it
+        picks up a new map (e.g. after switching to a strategy with a new decomposition)
+        Return the new handler instance, or None if it could not be instantiated, in
+        which case the old one is kept
+        """
+        handler_config = self.getMainRobot().getHandlerOfRobot(ht.MotionControlHandler)
+        old_h = self.getHandlerInstanceByName(handler_config.name)
+
+        # prepareHandler() only instantiates handlers that aren't instantiated yet
+        if old_h is not None:
+            self.handler_instance.remove(old_h)
+
+        h = self.prepareHandler(handler_config)
+
+        if h is None:
+            if old_h is not None:
+                self.handler_instance.append(old_h)
+            return None
+
+        self.main_handlers[ht.MotionControlHandler] = h
+
+        if old_h is not None and hasattr(old_h, "_stop"):
+            old_h._stop()
+
+        return h
+
 
     def createHandlerMethodConfig(self, robot_name, handler_name, method_name, kwargs):
         """
@@ -10,21 +10,46 @@ Uses the heat-controller to take a current position, current region, and destina
 import __heatControllerHelper as heatControllerHelper
 from numpy import *
 from __is_inside import is_inside
+from __regionGeometry import getRegionGeometry
 import time
+import cPickle
+import logging
 
 import lib.handlers.handlerTemplates as handlerTemplates
 
 class HeatControllerHandler(handlerTemplates.MotionControlHandler):
-    def __init__(self, executor, shared_data):
+    def __init__(self, executor, shared_data, precompute=False, save_controllers=False):
         """
         Heat motion planning controller
+
+        precompute (bool): Build the controllers for all pairs of adjacent regions at startup, instead of when each is first needed (default=False)
+        save_controllers (bool): Save the controllers next to the project after precomputing them and on shutdown, and reuse them on later runs while the map and calibration are unchanged (default=False)
         """
         self.drive_handler = executor.hsub.getHandlerInstanceByType(handlerTemplates.DriveHandler)
         self.pose_handler = executor.hsub.getHandlerInstanceByType(handlerTemplates.PoseHandler)
         self.fwd_coordmap = executor.hsub.coordmap_map2lab
         self.rfi = executor.proj.rfi
+        self.geometry = getRegionGeometry(self.rfi, self.fwd_coordmap)
         self.last_warning = 0
 
+        self.controllers = {}       # (current region, next region or None if last) -> FieldEvaluator
+        self.controller_data = {}   # the same, but the picklable data each controller is made from
+        self.num_saved = 0          # number of controllers in the saved file, if any
+
+        self.controller_file = None
+        if save_controllers:
+            self.map_hash = self.geometry.getHash()
+            self.controller_file = executor.proj.getFilenamePrefix() + ".heatcontrollers"
+            self._loadControllers()
+
+        if precompute:
+            self._precomputeControllers()
+            self._saveControllers()
+
+    def _stop(self):
+        # Keep the controllers built during this run for the next one
+        self._saveControllers()
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is true, we will move to the center of the region.
@@ -41,86 +66,95 @@ class HeatControllerHandler(handlerTemplates.MotionControlHandler):
 
         pose = self.pose_handler.getPose()
 
-        [X, DqX, F, inside, J] = controller(mat(pose[0:2]).T)
-
-        self.drive_handler.setVelocity(X[0,0], X[1,0], pose[2])
+        [X, F, inside] = controller.evaluate(pose[0:2])
+        inside = inside[0]
 
-        # Transform the region vertices into real coordinates
-        pointArray = [self.fwd_coordmap(x) for x in self.rfi.regions[next_reg].getPoints()]
-        vertices = mat(pointArray).T
+        self.drive_handler.setVelocity(X[0,0], X[0,1], pose[2])
 
         # Figure out whether we've reached the destination region
-        if is_inside([pose[0], pose[1]], vertices):
-            arrived = True
-        else:
-            arrived = False
+        arrived = self.geometry.isInside([pose[0], pose[1]], next_reg)
 
         if (arrived != (not inside)) and (time.time()-self.last_warning) > 0.5:
             print "WARNING: Left current region but not in expected destination region"
             # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.fwd_coordmap(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.geometry.findRegion([pose[0], pose[1]])
+            if r is not None:
+                print "I think I'm in " + self.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         return arrived
 
 
-    def get_controller(self, current, next, last, cache={}):
+    def _getControllerArgs(self, current, next, last):
         """
-        Wrapper for the controller factory, with caching.
+        Returns the arguments for heatControllerHelper.getControllerData() for the given regions
         """
 
-        # Check to see if we already have an appropriate controller stored in the cache.
-        # TODO: Account for last in cache
-
-        if current in cache and next in cache[current]:
-            return cache[current][next]
-
-        # If not, create a space in the cache to put our new controller.
-
-        cache[current] = {}
-
-        # Let's go get a controller!
-
         if last:
             transFaceIdx = None
         else:
             # Find a face to go through
             # TODO: Account for non-determinacy?
-            # For now, let's just choose the largest face available, because we are probably using a big clunky robot
-            # TODO: Why don't we just store this as the index?
-            transFaceIdx = None
-            max_magsq = 0
-            for i, face in enumerate(self.rfi.regions[current_reg].getFaces()):
-                if face not in self.rfi.transitions[current_reg][next_reg]:
-                    continue
-
-                tf_pta, tf_ptb = face
-                tf_vector = tf_ptb - tf_pta
-                magsq = (tf_vector.x)**2 + (tf_vector.y)**2
-                if magsq > max_magsq:
-                    transFaceIdx = i
-                    max_magsq = magsq
+            # For now, this is the largest face available, because we are probably using a big clunky robot
+            transFaceIdx = self.geometry.getTransitionFaceIndex(current, next)
 
             if transFaceIdx is None:
-                print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current_reg].name, self.rfi.regions[next_reg].name)
+                print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current].name, self.rfi.regions[next].name)
 
-        # Transform the region vertices into real coordinates
-        pointArray = [x for x in self.rfi.regions[current].getPoints()]
-        pointArray = map(self.fwd_coordmap, pointArray)
-        vertices = mat(pointArray).T
+        # The region vertices in real coordinates
+        return (self.geometry.vertices[current], transFaceIdx, last)
 
-        # Get a controller function
-        controller = heatControllerHelper.getController(vertices, transFaceIdx, last)
+    def _precomputeControllers(self):
+        """
+        Build the controllers for every pair of adjacent regions
+        """
 
-        # Cache it in
-        cache[current][next] = controller
+        keys = [k for k in sorted(self.geometry.transition_face_indices) if k not in self.controller_data]
+        if not keys:
+            return
+
+        logging.info("Precomputing {} heat controllers...".format(len(keys)))
+        for current, next in keys:
+            self.controller_data[current, next] = heatControllerHelper.buildControllerData(self._getControllerArgs(current, next, False))
+
+    def _loadControllers(self):
+        try:
+            with open(self.controller_file, "rb") as f:
+                map_hash, controller_data = cPickle.load(f)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if map_hash == self.map_hash:
+            logging.info("Loaded saved heat controllers from {}".format(self.controller_file))
+            self.controller_data.update(controller_data)
+            self.num_saved = len(self.controller_data)
+
+    def _saveControllers(self):
+        if self.controller_file is None or len(self.controller_data) == self.num_saved:
+            return
+
+        try:
+            with open(self.controller_file, "wb") as f:
+                cPickle.dump((self.map_hash, self.controller_data), f, cPickle.HIGHEST_PROTOCOL)
+            self.num_saved = len(self.controller_data)
+        except IOError as e:
+            logging.warning("Could not save heat controllers: {}".format(e))
+
+    def get_controller(self, current, next, last):
+        """
+        Wrapper for the controller factory, with caching.
+        """
+
+        # The controller for the last region doesn't depend on the next one
+        key = (current, None) if last else (current, next)
+
+        # Check to see if we already have an appropriate controller stored in the cache.
+        if key not in self.controllers:
+            if key not in self.controller_data:
+                # Let's go get a controller!
+                self.controller_data[key] = heatControllerHelper.buildControllerData(self._getControllerArgs(current, next, last))
 
-        return controller
+            self.controllers[key] = heatControllerHelper.FieldEvaluator(self.controller_data[key])
 
+        return self.controllers[key]
@@ -34,6 +34,9 @@ from time import sleep
 from math import fabs
 from numpy import *
 from __is_inside import *
+from __regionGeometry import getRegionGeometry
+from __pathCache import PathCache, repairPath
+from __roadmap import getSweptCircle
 import math
 import sys,os, time
 from scipy.linalg import norm
@@ -57,13 +60,14 @@ import threading
 import lib.handlers.handlerTemplates as handlerTemplates
 
 class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
-    def __init__(self, executor, shared_data,Space_Dimension,planner,robot_type,Geometric_Control,plotting):
+    def __init__(self, executor, shared_data,Space_Dimension,planner,robot_type,Geometric_Control,plotting,path_cache=False):
         """
         Space_Dimension(int): dimension of the space operating in. Enter 2 for 2D and 3 for 3D. Only quadrotor in ROS is supported for 3D now.(default=2)
         planner(string): Planner to be used. Enter RRT,KPIECE1 or PRM, RRTConnect. (default='PRM')
         robot_type (int): Which robot is used for execution. BasicSim is 1, ODE is 2, ROS is 3, Nao is 4, Pioneer is 5(default=1)
         Geometric_Control(string): Specify if you want to planner to sample in geometric or control space. G for geometric and C for control. (default='G')
         plotting (bool): Check the box to enable plotting (default=True)
+        path_cache (bool): Reuse the path planned earlier for the same pair of regions when starting from about the same position, instead of planning again. 2D only (default=False)
         """
 
         #Parameters
@@ -73,6 +77,7 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
         self.map                = {}                    # dictionary of polygons of different regions
         self.all                = Polygon.Polygon()     # polygon of the boundary
         self.OMPLpath           = None
+        self.path               = None                  # waypoints of the path being followed
         self.trans_matrix       = mat([[0,1],[-1,0]])   # transformation matrix for find the normal to the vector
 
         # Get references to handlers we'll need to communicate with
@@ -83,6 +88,7 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
         self.proj              = executor.proj
         self.coordmap_map2lab  = executor.hsub.coordmap_map2lab
         self.coordmap_lab2map  = executor.hsub.coordmap_lab2map
+        self.geometry          = getRegionGeometry(self.proj.rfi, self.coordmap_map2lab)
         self.last_warning      = 0
         self.previous_next_reg = None
 
@@ -203,6 +209,12 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
         self.current_reg = None
         self.next_reg    = None
 
+        # Paths planned so far, keyed by the regions and the starting position
+        if path_cache and self.Space_Dimension == 2:
+            self.path_cache = PathCache(2*self.radius)
+        else:
+            self.path_cache = None
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -273,9 +285,7 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
                 transFace   = None
                 goalPoints   = [[],[]] # list of goal points (midpoints of transition faces)
                 face_normal = [[],[]] # normal of the trnasition faces
-                for i in range(len(self.proj.rfi.transitions[current_reg][next_reg])):
-                    pointArray_transface = [x for x in self.proj.rfi.transitions[current_reg][next_reg][i]]
-                    transFace = asarray(map(self.coordmap_map2lab,pointArray_transface))
+                for transFace in self.geometry.getTransitionFaces(current_reg, next_reg):
                     coord_x = (transFace[0,0] +transFace[1,0])/2    #mid-point coordinate x
                     coord_y = (transFace[0,1] +transFace[1,1])/2    #mid-point coordinate y
                     goalPoints = hstack((goalPoints,vstack((coord_x,coord_y))))
@@ -300,19 +310,33 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
                 if transFace is None:
                     print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.proj.rfi.regions[current_reg].name, self.proj.rfi.regions[next_reg].name)
 
-            self.OMPLpath = self.plan(goalPoints,self.proj.rfi.regions[current_reg].name,self.proj.rfi.regions[next_reg].name,0)
+            self.path = None
+            if self.path_cache is not None:
+                path = self.path_cache.get(current_reg, next_reg, pose)
+                if path is not None:
+                    self.path = repairPath(pose, path, lambda a, b: self.nextAndcurrentRegionPoly.covers(getSweptCircle(a, b, self.radius)))
+                    if self.path is None:
+                        self.path_cache.discard(current_reg, next_reg, pose)
+
+            if self.path is None:
+                self.OMPLpath = self.plan(goalPoints,self.proj.rfi.regions[current_reg].name,self.proj.rfi.regions[next_reg].name,0)
+                self.path = self.getWaypoints(self.OMPLpath)
+                if self.path_cache is not None and self.OMPLpath.haveExactSolutionPath():
+                    self.path_cache.put(current_reg, next_reg, pose, self.path)
+            elif self.system_print == True:
+                print "Reusing the cached path"
             self.currentState = 1
 
         # Run algorithm to find a velocity vector (global frame) to take the robot to the next region
         if self.Space_Dimension == 3:
-            self.Velocity = self.getVelocity([pose[0],pose[1],pose[3]], self.OMPLpath)
+            self.Velocity = self.getVelocity([pose[0],pose[1],pose[3]], self.path)
         else:
-            self.Velocity = self.getVelocity([pose[0], pose[1]], self.OMPLpath)
+            self.Velocity = self.getVelocity([pose[0], pose[1]], self.path)
         self.previous_next_reg = next_reg
 
         """
         # FOR ROBERT
-        self.Node = self.getNode([pose[0], pose[1]], self.OMPLpath)
+        self.Node = self.getNode([pose[0], pose[1]], self.path)
         print "self.Node:" + str(self.Node)
         self.drive_handler.setDestination(self.Node[0,0], self.Node[1,0], pose[2])
         """
@@ -332,67 +356,64 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             # Figure out what region we think we stumbled into
-            for r in self.proj.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.geometry.findRegion([pose[0], pose[1]])
+            if r is not None:
+                print "I think I'm in " + self.proj.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         #print "arrived:"+str(arrived)
         return arrived
 
-    def getVelocity(self,p, OMPLpath, last=False):
+    def getWaypoints(self, OMPLpath):
+        """
+        Returns a (D,N) array of the positions of the states on the solution path of the planner.
+        """
+
+        solution = OMPLpath.getSolutionPath()
+        waypoints = zeros([self.Space_Dimension, solution.getStateCount()])
+        for i in range(solution.getStateCount()):
+            state = solution.getState(i)
+            waypoints[0,i] = state.getX()
+            waypoints[1,i] = state.getY()
+            if self.Space_Dimension == 3:
+                waypoints[2,i] = state.getZ()
+        return waypoints
+
+    def getVelocity(self,p, path, last=False):
         """
         This function calculates the velocity for the robot with RRT.
         The inputs are (given in order):
-            p        = the current x-y position of the robot
-            OMPLpath = path information of the planner
+            p        = the current x-y position of the robot (and z, in 3D)
+            path     = waypoints of the path to follow (Space_Dimension x No. of waypoints)
             last = True, if the current region is the last region
                  = False, if the current region is NOT the last region
         """
 
         pose     = mat(p).T
-        """
-        if self.system_print == True:
-            print (OMPLpath.getSolutionPath().getState(self.currentState))[0]   # x-coordinate of the current state
-        """
-        if self.Space_Dimension == 3:
-            dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY(),(OMPLpath.getSolutionPath().getState(self.currentState)).getZ()))- pose
 
-            if norm(dis_cur) < 1.5*self.radius:         # go to next point
-                if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
-                    self.currentState = self.currentState + 1
-                    dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY(),(OMPLpath.getSolutionPath().getState(self.currentState)).getZ()))- pose
+        dis_cur  = path[:,self.currentState:self.currentState+1] - pose
+        if norm(dis_cur) < 1.5*self.radius:         # go to next point
+            if not (self.currentState+1) == shape(path)[1]:
+                # head to the next node
+                self.currentState = self.currentState + 1
+                dis_cur  = path[:,self.currentState:self.currentState+1] - pose
 
-            Vel = zeros([3,1])
+        Vel = zeros([self.Space_Dimension,1])
+        if self.Space_Dimension == 3:
             Vel[0:3,0] = dis_cur/norm(dis_cur)*0.3              #TUNE THE SPEED LATER
-
         else:
-            dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
-
-            if norm(dis_cur) < 1.5*self.radius:         # go to next point
-                if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
-                    # head to the next node
-                    self.currentState = self.currentState + 1
-                    dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
-            Vel = zeros([2,1])
             # set different speed for basicSim
             Vel[0:2,0] = dis_cur/norm(dis_cur)*0.5                    #TUNE THE SPEED LATER
         return Vel
 
-    def getNode(self,p, OMPLpath, last=False):
+    def getNode(self,p, path, last=False):
         """
 
         This function return the heading node of the robot. (for 2D only now)
         The inputs are (given in order):
             p        = the current x-y position of the robot
-
-            E        = edges of the tree  (2 x No. of nodes on the tree)
-            V        = points of the tree (2 x No. of vertices)
+            path     = waypoints of the path to follow (2 x No. of waypoints)
             last = True, if the current region is the last region
                  = False, if the current region is NOT the last region
 
@@ -401,16 +422,16 @@ class OMPLControllerHandler(handlerTemplates.MotionControlHandler):
         pose     = mat(p).T
 
         #dis_cur = distance between current position and the next point
-        dis_cur  = vstack(((OMPLpath.getSolutionPath().getState(self.currentState)).getX(),(OMPLpath.getSolutionPath().getState(self.currentState)).getY()))- pose[0:2]
+        dis_cur  = path[0:2,self.currentState:self.currentState+1] - pose[0:2]
 
         if norm(dis_cur) < 1.5*self.radius:         # go to next point
-            if not (self.currentState+1) == OMPLpath.getSolutionPath().getStateCount():
+            if not (self.currentState+1) == shape(path)[1]:
                 # head to the next node
                 self.currentState = self.currentState + 1
 
         Node = zeros([2,1])
-        Node[0,0] = (OMPLpath.getSolutionPath().getState(self.currentState)).getX()
-        Node[1,0] = (OMPLpath.getSolutionPath().getState(self.currentState)).getY()
+        Node[0,0] = path[0,self.currentState]
+        Node[1,0] = path[1,self.currentState]
         return Node
 
 
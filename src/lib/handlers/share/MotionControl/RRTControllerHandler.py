@@ -9,7 +9,12 @@ Uses Rapidly-exploring Random Tree Algorithm to generate paths given the startin
 
 from numpy import *
 from __is_inside import *
+from __regionGeometry import getRegionGeometry
+from __spatialIndex import SpatialIndex
+from __pathCache import PathCache, repairPath
+from __roadmap import Roadmap, getSweptCircle
 import math
+import numpy
 import sys,os
 from scipy.linalg import norm
 from numpy.matlib import zeros
@@ -24,6 +29,8 @@ from math import sqrt, fabs , pi
 import random
 import thread
 import threading
+import cPickle
+import logging
 
 # importing matplotlib to show the path if possible
 try:
@@ -37,7 +44,7 @@ except:
 import lib.handlers.handlerTemplates as handlerTemplates
 
 class RRTControllerHandler(handlerTemplates.MotionControlHandler):
-    def __init__(self, executor, shared_data,robot_type,max_angle_goal,max_angle_overlap,plotting):
+    def __init__(self, executor, shared_data,robot_type,max_angle_goal,max_angle_overlap,plotting,path_cache=False,use_roadmap=False,save_paths=False):
         """
         Rapidly-Exploring Random Trees alogorithm motion planning controller
 
@@ -45,6 +52,9 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         max_angle_goal (float): The biggest difference in angle between the new node and the goal point that is acceptable. If it is bigger than the max_angle, the new node will not be connected to the goal point. The value should be within 0 to 6.28 = 2*pi. Default set to 6.28 = 2*pi (default=6.28)
         max_angle_overlap (float): difference in angle allowed for two nodes overlapping each other. If you don't want any node overlapping with each other, put in 2*pi = 6.28. Default set to 1.57 = pi/2 (default=1.57)
         plotting (bool): Check the box to enable plotting. Uncheck to disable plotting (default=True)
+        path_cache (bool): Reuse the path planned earlier for the same pair of regions when starting from about the same pose, instead of building a new tree (default=False)
+        use_roadmap (bool): Build a probabilistic roadmap of each region at startup, and plan paths on it, falling back to building a tree if it has no path (default=False)
+        save_paths (bool): Save the roadmaps and cached paths next to the project on startup and shutdown, and reuse them on later runs while the map is unchanged (default=False)
         """
 
         self.system_print       = False       # for debugging. print on GUI ( a bunch of stuffs)
@@ -59,6 +69,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         self.proj              = executor.proj
         self.coordmap_map2lab  = executor.hsub.coordmap_map2lab
         self.coordmap_lab2map  = executor.hsub.coordmap_lab2map
+        self.geometry          = getRegionGeometry(self.proj.rfi, self.coordmap_map2lab)
         self.last_warning      = 0
         self.previous_next_reg = None
 
@@ -133,6 +144,20 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
             self.timeStep = 5
             self.velocity  = 0.05
 
+        #!!! CONTROL SPACE: generate a list of omega for random sampling
+        omegaLowerBound = -math.pi/20      # lower bound for the value of omega
+        omegaUpperBound = math.pi/20       # upper bound for the value of omega
+        omegaNoOfSteps  = 20
+        self.omega_range = linspace(omegaLowerBound,omegaUpperBound,omegaNoOfSteps)
+        self.omega_range_escape = linspace(omegaLowerBound*4,omegaUpperBound*4,omegaNoOfSteps*4)    # range used when stuck > stuck_thres
+
+        # Footprint of the robot, and the area it sweeps for each omega, relative to a node
+        # at the origin facing along the x-axis. These are rotated and moved to each node.
+        self.robot_footprint  = asarray(PolyUtils.pointList(PolyShapes.Circle(self.radius)))
+        self.swept_footprints = {}
+        for omega in hstack((self.omega_range, self.omega_range_escape)):
+            self.swept_footprints[omega] = self.getSweptFootprint(omega)
+
 
         # Operate_system (int): Which operating system is used for execution.
         # Ubuntu and Mac is 1, Windows is 2
@@ -154,6 +179,29 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         for regionName,regionPoly in self.map.iteritems():
             self.all += regionPoly
 
+        # Paths planned so far, keyed by the regions and the starting pose, and roadmaps of the regions
+        self.path_cache = None
+        if path_cache:
+            self.path_cache = PathCache(2*self.radius, pi/4)
+        self.roadmaps   = {}    # region index -> Roadmap
+        self.use_roadmap = use_roadmap
+
+        self.path_file = None
+        self.saved_paths    = {}    # what was loaded from the path file, to save again if unused in this run
+        self.saved_roadmaps = {}
+        if save_paths:
+            self.map_hash  = (self.geometry.getHash(), self.radius)
+            self.path_file = executor.proj.getFilenamePrefix() + ".rrtpaths"
+            self._loadPaths()
+
+        if use_roadmap:
+            num_loaded = len(self.roadmaps)
+            for i, region in enumerate(self.proj.rfi.regions):
+                if i not in self.roadmaps:
+                    self.roadmaps[i] = Roadmap(self.map[region.name], self.radius, seed=i)
+            if len(self.roadmaps) > num_loaded:
+                self._savePaths()
+
         # Start plotting if operating in Windows
         if self.operate_system == 2 and self.plotting ==True:
             # start using anmination to plot the robot
@@ -162,6 +210,10 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
             self.scope = _Scope(self.ax,self)
             thread.start_new_thread(self.jplot,())
 
+    def _stop(self):
+        # Keep the paths planned during this run for the next one
+        self._savePaths()
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -203,9 +255,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                 transFace   = None
                 q_gBundle   = [[],[]] # list of goal points (midpoints of transition faces)
                 face_normal = [[],[]] # normal of the trnasition faces
-                for i in range(len(self.proj.rfi.transitions[current_reg][next_reg])):
-                    pointArray_transface = [x for x in self.proj.rfi.transitions[current_reg][next_reg][i]]
-                    transFace = asarray(map(self.coordmap_map2lab,pointArray_transface))
+                for transFace in self.geometry.getTransitionFaces(current_reg, next_reg):
                     bundle_x = (transFace[0,0] +transFace[1,0])/2    #mid-point coordinate x
                     bundle_y = (transFace[0,1] +transFace[1,1])/2    #mid-point coordinate y
                     q_gBundle     = hstack((q_gBundle,vstack((bundle_x,bundle_y))))
@@ -238,8 +288,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                 self.plotMap(self.map)
                 plt.plot(pose[0],pose[1],'ko')
 
-            self.RRT_V,self.RRT_E,self.E_current_column = self.buildTree(\
-            [pose[0], pose[1]],pose[2],self.currentRegionPoly, self.nextRegionPoly,q_gBundle,face_normal)
+            self.RRT_V,self.RRT_E,self.E_current_column = self.planPath(current_reg, next_reg, pose, q_gBundle, face_normal)
 
             """
             # map the lab coordinates back to pixels
@@ -266,19 +315,115 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             # Figure out what region we think we stumbled into
-            for r in self.proj.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    print "I think I'm in " + r.name
-                    print pose
-                    break
+            r = self.geometry.findRegion([pose[0], pose[1]])
+            if r is not None:
+                print "I think I'm in " + self.proj.rfi.regions[r].name
+                print pose
             self.last_warning = time.time()
 
         #print "arrived:"+str(arrived)
         return arrived
 
+    def planPath(self, current_reg, next_reg, pose, q_gBundle, face_normal):
+        """
+        Returns a path from ``pose`` into the next region, in the same form as buildTree().
+        A path cached from about the same pose is reused if it can be reached from here,
+        then the roadmap of the current region is tried, and only then is a new tree built.
+        """
+
+        # Let the robot move out from the edge of the region if it has only just entered it
+        regionPoly = self.currentRegionPoly + PolyShapes.Circle(self.radius*2.5,(pose[0],pose[1]))
+
+        if self.path_cache is not None:
+            path = self.path_cache.get(current_reg, next_reg, pose)
+            if path is not None:
+                path = repairPath(pose, path, lambda a, b: regionPoly.covers(getSweptCircle(a, b, self.radius)))
+                if path is not None:
+                    if self.system_print == True:
+                        print "Reusing the cached path"
+                    return self.pathToTree(path)
+                self.path_cache.discard(current_reg, next_reg, pose)
+
+        path = None
+        if current_reg in self.roadmaps:
+            path = self.getRoadmapPath(current_reg, pose, regionPoly, q_gBundle, face_normal)
+
+        if path is not None:
+            V, E, E_current_column = self.pathToTree(path)
+        else:
+            V, E, E_current_column = self.buildTree([pose[0], pose[1]],pose[2],self.currentRegionPoly, self.nextRegionPoly,q_gBundle,face_normal)
+            path = V[1:,[E[0,0]] + E[1].tolist()]
+
+        if self.path_cache is not None:
+            self.path_cache.put(current_reg, next_reg, pose, path)
+
+        return V, E, E_current_column
+
+    def getRoadmapPath(self, current_reg, pose, regionPoly, q_gBundle, face_normal):
+        """
+        Returns a (2,N) array of waypoints from ``pose`` into the next region along the roadmap
+        of the current region, or None if the roadmap doesn't connect them.
+        """
+
+        # pushing possible q_goals into the current region, as in buildTree
+        q_gBundle   = mat(q_gBundle)
+        face_normal = mat(face_normal)
+        goals = []
+        for i in range(q_gBundle.shape[1]):
+            q_g = q_gBundle[:,i]+face_normal[:,i]*1.5*self.radius
+            if not self.currentRegionPoly.isInside(q_g[0,0],q_g[1,0]):
+                q_g = q_gBundle[:,i]-face_normal[:,i]*1.5*self.radius
+            goals.append((q_g[0,0],q_g[1,0]))
+
+        path, goal_index = self.roadmaps[current_reg].findPath(pose[0:2], goals, regionPoly)
+        if path is None:
+            return None
+
+        #push the goal point to the next region
+        q_g = mat(path[:,-1]).T+face_normal[:,goal_index]*3*self.radius
+        if not self.nextRegionPoly.isInside(q_g[0,0],q_g[1,0]):
+            q_g = q_g-face_normal[:,goal_index]*6*self.radius
+
+        return hstack((path, array(q_g)))
+
+    def pathToTree(self, path):
+        """
+        Returns the V and E matrices of a tree that is just the given (2,N) array of waypoints.
+        """
+
+        n = shape(path)[1]
+        V = vstack((arange(n), path))
+        E = vstack((arange(n-1), arange(1,n)))
+        return V, E, 0
+
+    def _loadPaths(self):
+        try:
+            with open(self.path_file, "rb") as f:
+                map_hash, paths, roadmaps = cPickle.load(f)
+        except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+            return
+
+        if map_hash == self.map_hash:
+            logging.info("Loaded saved paths from {}".format(self.path_file))
+            self.saved_paths = paths
+            self.saved_roadmaps = roadmaps
+            if self.path_cache is not None:
+                self.path_cache.update(paths)
+            if self.use_roadmap:
+                self.roadmaps.update(roadmaps)
+
+    def _savePaths(self):
+        if self.path_file is None:
+            return
+
+        paths = self.path_cache.paths if self.path_cache is not None else self.saved_paths
+        roadmaps = self.roadmaps if self.use_roadmap else self.saved_roadmaps
+        try:
+            with open(self.path_file, "wb") as f:
+                cPickle.dump((self.map_hash, paths, roadmaps), f, cPickle.HIGHEST_PROTOCOL)
+        except IOError as e:
+            logging.warning("Could not save paths: {}".format(e))
+
     def createRegionPolygon(self,region,hole = None):
         """
         This function takes in the region points and make it a Polygon.
@@ -369,18 +514,15 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         theta           = self.orientation_bound(theta)
         V_theta         = array([theta])
 
-        #!!! CONTROL SPACE: generate a list of omega for random sampling
-        omegaLowerBound = -math.pi/20      # upper bound for the value of omega
-        omegaUpperBound = math.pi/20       # lower bound for the value of omega
-        omegaNoOfSteps  = 20
-        self.omega_range = linspace(omegaLowerBound,omegaUpperBound,omegaNoOfSteps)
-        self.omega_range_escape = linspace(omegaLowerBound*4,omegaUpperBound*4,omegaNoOfSteps*4)    # range used when stuck > stuck_thres
+        # index of the nodes on the tree, for checking overlaps with new nodes
+        self.node_index = SpatialIndex(2*self.radius)
+        self.node_index.insert(0, (q_init[0,0], q_init[1,0]))
 
         regionPolyOld = Polygon.Polygon(regionPoly)
         regionPoly += PolyShapes.Circle(self.radius*2.5,(q_init[0,0],q_init[1,0]))
 
         # check faces of the current region for goal points
-        E     = [[],[]]       # the tree matrix
+        E     = numpy.zeros((2,0), dtype=int)       # the tree matrix
         Other = [[],[]]
         path                        = False          # if path formed then = 1
         stuck                       = 0              # count for changing the range of sampling omega
@@ -416,8 +558,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                     q_g = q_gBundle[:,i]-face_normal[:,i]*1.5*self.radius    ##original 2*self.radius
 
                 #forming polygon for path checking
-                EdgePolyGoal = PolyShapes.Circle(self.radius,(q_g[0,0],q_g[1,0])) + PolyShapes.Circle(self.radius,(V[1,shape(V)[1]-1],V[2:,shape(V)[1]-1]))
-                EdgePolyGoal = PolyUtils.convexHull(EdgePolyGoal)
+                EdgePolyGoal = self.getSweptPolygon([(q_g[0,0],q_g[1,0]), (V[1,shape(V)[1]-1],V[2,shape(V)[1]-1])])
                 dist = norm(q_g - V[1:,shape(V)[1]-1])
 
                 #check connection to goal
@@ -476,6 +617,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                     (cols,) = nonzero(q_pass_dist == min(q_pass_dist))
                     cols = asarray(cols)[0]
                 q_g = q_pass[1:,cols]
+                goal_index = int(q_pass[0,cols])
                 """
                 q_g = q_g-(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])/norm(q_gBundle[:,q_pass[0,cols]]-V[1:,(shape(V)[1]-1)])*3*self.radius   #org 3
                 if not nextRegionPoly.isInside(q_g[0],q_g[1]):
@@ -502,7 +644,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                         self.ax.plot(q_g[0,0],q_g[1,0],'ko')
 
                 # trim the path connecting current node to goal point into pieces if the path is too long now
-                numOfPoint = floor(norm(V[1:,shape(V)[1]-1]- q_g)/self.step_size)
+                numOfPoint = int(floor(norm(V[1:,shape(V)[1]-1]- q_g)/self.step_size))
                 if numOfPoint < 3:
                     numOfPoint = 3
                 x = linspace( V[1,shape(V)[1]-1], q_g[0,0], numOfPoint )
@@ -513,9 +655,9 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
                         E = hstack((E,vstack((shape(V)[1]-2,shape(V)[1]-1))))
 
                 #push the goal point to the next region
-                q_g = q_g+face_normal[:,q_pass[0,cols]]*3*self.radius    ##original 2*self.radius
+                q_g = q_g+face_normal[:,goal_index]*3*self.radius    ##original 2*self.radius
                 if not nextRegionPoly.isInside(q_g[0],q_g[1]):
-                    q_g = q_g-face_normal[:,q_pass[0,cols]]*6*self.radius    ##original 2*self.radius
+                    q_g = q_g-face_normal[:,goal_index]*6*self.radius    ##original 2*self.radius
                 V = hstack((V,vstack((shape(V)[1],q_g[0,0],q_g[1,0]))))
                 E = hstack((E,vstack((shape(V)[1]-2 ,shape(V)[1]-1))))
 
@@ -544,18 +686,14 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
             print 'Here is the V matrix:', V, 'Here is the E matrix:',E
             print >>sys.__stdout__, 'Here is the V matrix:\n', V, '\nHere is the E matrix:\n',E
 
-        #B: trim to a single path
-        single = 0
-        while single == 0:
-            trim  = 0
-            for j in range(shape(V)[1]-3):
-                (row,col) = nonzero(E == j+1)
-                if len(col) == 1:
-                    E = delete(E, col[0], 1)
-                    trim = 1
-
-            if trim == 0:
-                single = 1;
+        #B: trim to a single path, by following the tree back from the goal
+        parent_edge = dict((E[1,i], i) for i in range(shape(E)[1]))
+        path_edges  = []
+        node        = shape(V)[1]-1
+        while node in parent_edge:
+            path_edges.append(parent_edge[node])
+            node = E[0,parent_edge[node]]
+        E = E[:,sorted(path_edges)]
 
         ####print with matlib
         if self.plotting ==True :
@@ -609,7 +747,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
             tree_index = shape(V)[1]-1
         else:
             if random.choice([1,2]) == 1:
-                tree_index = random.choice(array(V[0])[0])
+                tree_index = random.randrange(shape(V)[1])
             else:
                 tree_index = shape(V)[1]-1
 
@@ -618,22 +756,13 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         yPrev     = V[2,tree_index]
         thetaPrev = V_theta[tree_index]
 
-        j = 1
         #!!!! CONTROL SPACE STEP 3 - Check path of the robot
-        path_robot = PolyShapes.Circle(self.radius,(xPrev,yPrev))
-        while j <= self.timeStep:
-            xOrg      = xPrev
-            yOrg      = yPrev
-            xPrev     = xPrev + self.velocity/omega*(sin(omega* 1 + thetaPrev)-sin(thetaPrev))
-            yPrev     = yPrev - self.velocity/omega*(cos(omega* 1 + thetaPrev)-cos(thetaPrev))
-            thetaPrev = omega* 1 + thetaPrev
-            path_robot = path_robot + PolyShapes.Circle(self.radius,(xPrev,yPrev))
-
-            j = j + 1
-
-        thetaPrev = self.orientation_bound(thetaPrev)
-        path_all = PolyUtils.convexHull(path_robot)
-        in_bound = regionPoly.covers(path_all)
+        (footprint, dx, dy) = self.swept_footprints[omega]
+        rotation  = array([[cos(thetaPrev), -sin(thetaPrev)], [sin(thetaPrev), cos(thetaPrev)]])
+        path_all  = Polygon.Polygon((dot(footprint, rotation.T) + (xPrev, yPrev)).tolist())
+        (xPrev, yPrev) = dot(rotation, (dx, dy)) + (xPrev, yPrev)
+        thetaPrev = self.orientation_bound(thetaPrev + omega*self.timeStep)
+        in_bound  = regionPoly.covers(path_all)
         """
         # plotting
         if plotting == True:
@@ -643,14 +772,14 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         stuck = stuck + 1
 
         if in_bound:
-            robot_new_node = PolyShapes.Circle(self.radius,(xPrev,yPrev))
             # check how many nodes on the tree does the new node overlaps with
             nodes_overlap_count = 0
-            for k in range(shape(V)[1]-1):
-                robot_old_node = PolyShapes.Circle(self.radius,(V[1,k],V[2,k]))
-                if robot_new_node.overlaps(robot_old_node):
-                    if  abs(thetaPrev - V_theta[k]) <   self.max_angle_overlap:
-                        nodes_overlap_count += 1
+            for k in self.node_index.neighbors((xPrev,yPrev), 2*self.radius):
+                if k < shape(V)[1]-1 and abs(thetaPrev - V_theta[k]) < self.max_angle_overlap:
+                    nodes_overlap_count += 1
+                    if nodes_overlap_count >= 2:
+                        # that's all we need to know
+                        break
 
 
             if nodes_overlap_count == 0 or (stuck > self.stuck_thres+1 and nodes_overlap_count < 2) or (stuck > self.stuck_thres+500):
@@ -669,6 +798,7 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
 
                 V = hstack((V,vstack((shape(V)[1],xPrev,yPrev))))
                 V_theta = hstack((V_theta,thetaPrev))
+                self.node_index.insert(shape(V)[1]-1, (xPrev,yPrev))
                 E = hstack((E,vstack((tree_index ,shape(V)[1]-1))))
                 Other = hstack((Other,vstack((self.velocity,omega))))
                 ##################### E should add omega and velocity
@@ -686,6 +816,36 @@ class RRTControllerHandler(handlerTemplates.MotionControlHandler):
         return  V,V_theta,E,Other,stuck,append_after_latest_node, connection_to_tree
 
 
+    def getSweptFootprint(self,omega):
+        """
+        Returns the convex hull of the area swept by the robot while turning at ``omega``
+        for self.timeStep steps from the origin facing along the x-axis (as an array of
+        points), and the x, y position it ends at.
+        """
+
+        xPrev     = 0.0
+        yPrev     = 0.0
+        thetaPrev = 0.0
+        centers   = [(xPrev,yPrev)]
+        for j in range(self.timeStep):
+            xPrev     = xPrev + self.velocity/omega*(sin(omega* 1 + thetaPrev)-sin(thetaPrev))
+            yPrev     = yPrev - self.velocity/omega*(cos(omega* 1 + thetaPrev)-cos(thetaPrev))
+            thetaPrev = omega* 1 + thetaPrev
+            centers.append((xPrev,yPrev))
+
+        return asarray(PolyUtils.pointList(self.getSweptPolygon(centers))), xPrev, yPrev
+
+    def getSweptPolygon(self,centers):
+        """
+        Returns the convex hull of the robot footprint placed at each of ``centers``
+        """
+
+        path_robot = Polygon.Polygon()
+        for center in centers:
+            path_robot += Polygon.Polygon((self.robot_footprint + center).tolist())
+
+        return PolyUtils.convexHull(path_robot)
+
     def orientation_bound(self,theta):
         """
         make sure the returned angle is between 0 to 2*pi
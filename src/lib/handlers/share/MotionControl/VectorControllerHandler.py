@@ -10,6 +10,7 @@ Uses the vector field algorithm developed by Stephen R. Lindemann to calculate a
 import __vectorControllerHelper as vectorControllerHelper
 from numpy import *
 from __is_inside import *
+from __regionGeometry import getRegionGeometry
 import time, math
 
 import lib.handlers.handlerTemplates as handlerTemplates
@@ -27,8 +28,11 @@ class VectorControllerHandler(handlerTemplates.MotionControlHandler):
         # Get information about regions
         self.rfi = executor.proj.rfi
         self.coordmap_map2lab = executor.hsub.coordmap_map2lab
+        self.geometry = getRegionGeometry(self.rfi, self.coordmap_map2lab)
         self.last_warning = 0
 
+        self.vector_fields = {}     # (current region, exit face index or None) -> VectorField
+
     def gotoRegion(self, current_reg, next_reg, last=False):
         """
         If ``last`` is True, we will move to the center of the destination region.
@@ -52,59 +56,45 @@ class VectorControllerHandler(handlerTemplates.MotionControlHandler):
             time.sleep(1)
             return False
 
-        # NOTE: Information about region geometry can be found in self.rfi.regions:
-        pointArray = [x for x in self.rfi.regions[current_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T
+        # NOTE: Information about region geometry can be found in self.rfi.regions,
+        # and its lab-frame equivalent in self.geometry
 
         if last:
             transFaceIdx = None
         else:
             # Find a face to go through
             # TODO: Account for non-determinacy?
-            # For now, let's just choose the largest face available, because we are probably using a big clunky robot
-            # TODO: Why don't we just store this as the index?
-            transFaceIdx = None
-            max_magsq = 0
-            for i, face in enumerate(self.rfi.regions[current_reg].getFaces()):
-                if face not in self.rfi.transitions[current_reg][next_reg]:
-                    continue
-
-                tf_pta, tf_ptb = face
-                tf_vector = tf_ptb - tf_pta
-                magsq = (tf_vector.x)**2 + (tf_vector.y)**2
-                if magsq > max_magsq:
-                    transFaceIdx = i
-                    max_magsq = magsq
+            # For now, this is the largest face available, because we are probably using a big clunky robot
+            transFaceIdx = self.geometry.getTransitionFaceIndex(current_reg, next_reg)
 
             if transFaceIdx is None:
                 print "ERROR: Unable to find transition face between regions %s and %s.  Please check the decomposition (try viewing projectname_decomposed.regions in RegionEditor or a text editor)." % (self.rfi.regions[current_reg].name, self.rfi.regions[next_reg].name)
 
 
 		# Run algorithm to find a velocity vector (global frame) to take the robot to the next region
-        V = vectorControllerHelper.getController([pose[0], pose[1]], vertices, transFaceIdx)
+        V = self.get_vector_field(current_reg, transFaceIdx).evaluate([pose[0], pose[1]])[0]
 
         # Pass this desired velocity on to the drive handler
         self.drive_handler.setVelocity(V[0], V[1], pose[2])
 
-        departed = not is_inside([pose[0], pose[1]], vertices)
-        pointArray = [x for x in self.rfi.regions[next_reg].getPoints()]
-        pointArray = map(self.coordmap_map2lab, pointArray)
-        vertices = mat(pointArray).T
+        departed = not self.geometry.isInside([pose[0], pose[1]], current_reg)
         # Figure out whether we've reached the destination region
-        arrived = is_inside([pose[0], pose[1]], vertices)
+        arrived = self.geometry.isInside([pose[0], pose[1]], next_reg)
 
         if departed and (not arrived) and (time.time()-self.last_warning) > 0.5:
             #print "WARNING: Left current region but not in expected destination region"
-            # Figure out what region we think we stumbled into
-            for r in self.rfi.regions:
-                pointArray = [self.coordmap_map2lab(x) for x in r.getPoints()]
-                vertices = mat(pointArray).T
-
-                if is_inside([pose[0], pose[1]], vertices):
-                    #print "I think I'm in " + r.name
-                    #print pose
-                    break
             self.last_warning = time.time()
 
         return arrived
+
+    def get_vector_field(self, current_reg, transFaceIdx):
+        """
+        Returns the vector field for leaving ``current_reg`` through face ``transFaceIdx``
+        (or for heading to its center if this is None), with caching.
+        """
+
+        key = (current_reg, transFaceIdx)
+        if key not in self.vector_fields:
+            self.vector_fields[key] = vectorControllerHelper.VectorField(self.geometry.vertices[current_reg], transFaceIdx)
+
+        return self.vector_fields[key]
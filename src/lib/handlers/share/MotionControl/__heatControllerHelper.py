@@ -20,6 +20,16 @@ def getController(Vertex, exitface, last):
     the potential field based control law that will take a robot from an
     initial position in a region to the exit face that leads to the next
     region or to the map reference point (in the last region)
+    The inputs are the same as for getControllerData().
+    """
+
+    return makeController(getControllerData(Vertex, exitface, last))
+
+def getControllerData(Vertex, exitface, last):
+    """
+    This function does the (expensive) initialization for a controller, returning
+    a tuple that can be passed to makeController().  The tuple contains only
+    numbers and arrays, so it can be pickled (e.g. to compute it in another process).
     The input is:
        Vertex = vertices of the region, specified in clockwise order (2 x No. of vertices)
        exitface - index of exitface. (i.e. if the exit face is the face
@@ -78,6 +88,22 @@ def getController(Vertex, exitface, last):
 
     hessian = True # calculate the hessian terms
 
+    return (last, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad)
+
+def buildControllerData(args):
+    """
+    Calls getControllerData() with a tuple of arguments, for use with Pool.map()
+    """
+
+    return getControllerData(*args)
+
+def makeController(data):
+    """
+    Returns the controller function for the output of getControllerData()
+    """
+
+    (last, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad) = data
+
     if last:
         # Return a controller that heads to the "center" of the region
         # NOTE: This will never converge perfectly due to discrete-time simulation;
@@ -99,6 +125,257 @@ def getController(Vertex, exitface, last):
 
     return controller
 
+class FieldEvaluator(object):
+    """
+    Evaluates the controller for the output of getControllerData() at many points at once.
+
+    The face definitions are stored as contiguous (n x 2) arrays, and the mapping to the
+    disk and the heat solution are calculated for all of the points together.
+    Points near the boundary, a vertex or the map center, where the original code has
+    special cases, are handed to the controller from makeController() instead.
+    """
+
+    def __init__(self, data):
+        (last, P0, N0, Pin, Nin, qx, ae1, ae2, Bmax, hessian, Vtx, Brad) = data
+
+        self.data = data
+        self.last = last
+        self.controller = makeController(data)
+
+        self.has_exit = (P0.size != 0)
+        self.qx = asarray(qx, dtype=float).ravel()
+        self.Pin = ascontiguousarray(asarray(Pin, dtype=float).T)
+        self.Nin = ascontiguousarray(asarray(Nin, dtype=float).T)
+        if self.has_exit:
+            self.P0 = asarray(P0, dtype=float).ravel()
+            self.N0 = asarray(N0, dtype=float).ravel()
+        else:
+            self.P0 = self.N0 = None
+
+        # Rotation that places the exit face bisector on the negative x-axis (see map2diskScale)
+        if self.has_exit:
+            qe = self.P0 - self.qx
+            a0 = atan2(qe[1], qe[0])
+        else:
+            a0 = pi
+        self.R = array([[cos(pi-a0), -sin(pi-a0)], [sin(pi-a0), cos(pi-a0)]])
+
+        # Faces and vertices in the rotated frame centered on qx
+        self.Ps = ascontiguousarray(dot(self.Pin - self.qx, self.R.T))
+        self.Ns = ascontiguousarray(dot(self.Nin, self.R.T))
+        self.Vs = ascontiguousarray(dot(asarray(Vtx, dtype=float).T - self.qx, self.R.T))
+        if self.has_exit:
+            self.Ps0 = dot(self.R, self.P0 - self.qx)
+            self.Ns0 = dot(self.R, self.N0)
+        else:
+            self.Ps0 = self.Ns0 = None
+
+        # For each face, the indices of all the other faces
+        n = self.Pin.shape[0]
+        self.others = [array([j for j in xrange(n) if j != i], dtype=int) for i in xrange(n)]
+
+        # map2diskScale uses Bmax**(1/N) with integer division, i.e. 1
+        self.Bfact = Bmax**(1/(1 + n))
+        self.Bscale = self.Bfact/Bmax
+        self.Brad = Brad
+
+        if last:
+            self.qf = self.qx
+            self.alpha = 0.25
+            self.ae1, self.ae2 = -pi, pi
+            # Xgoal_penn pulls back the gradient using the Jacobian at the goal
+            [qcf, qs, Rot, Jf] = map2diskScale(mat(self.qf).T, P0, N0, Pin, Nin, qx, -pi, pi, Bmax, False, Vtx, Brad)[0:4]
+            self.qcf = asarray(qcf, dtype=float).ravel()
+            self.Jf = asarray(Jf, dtype=float)
+        else:
+            dae = 2*pi - ae2 + ae1
+            self.ae1 = ae1 - 0.005*dae
+            self.ae2 = ae2 + 0.005*dae
+
+    def _faceDistances(self, q, P0, N0, Pin, Nin):
+        """
+        Returns the distance of each point to the exit face (or None) and to the other faces,
+        measured along the inward normals
+        """
+
+        din = ((q[:,newaxis,:] - Pin[newaxis,:,:]) * Nin[newaxis,:,:]).sum(axis=2)
+        if P0 is None:
+            return [None, din]
+        return [-dot(q - P0, N0), din]
+
+    def _classifyInside(self, dexit, din):
+        """
+        Returns masks of the points that is_inside() would certainly call inside, and
+        of the points close enough to the boundary that we should leave it to is_inside()
+        """
+
+        inside = (din > 1e-9).all(axis=1)
+        outside = (din < -2e-8).any(axis=1)
+        if dexit is not None:
+            inside &= (dexit > 1e-9)
+            outside |= (dexit < -2e-6)
+
+        return [inside, ~(inside | outside)]
+
+    def evaluate(self, points):
+        """
+        Evaluates the controller at each of ``points`` (an N x 2 array, or a single point).
+
+        Returns [X, F, inside], where X is the N x 2 array of desired velocity vectors,
+        F is the potential value and inside tells whether each point is in the region.
+        """
+
+        q = atleast_2d(asarray(points, dtype=float))
+        num = q.shape[0]
+
+        with errstate(divide='ignore', invalid='ignore'):
+            [X, F, inside, irregular] = self._evaluateRegular(q)
+
+        # Hand any special cases to the original implementation
+        for k in flatnonzero(irregular):
+            try:
+                [Xk, DqXk, Fk, insidek, Jk] = self.controller(mat(q[k]).T)
+            except (ValueError, ZeroDivisionError, linalg.LinAlgError):
+                # The hessian can't be calculated on some boundary lines, but
+                # it doesn't affect the vector field, so keep our own result
+                continue
+            X[k] = asarray(Xk, dtype=float).ravel()
+            F[k] = Fk
+            inside[k] = insidek
+
+        return [X, F, inside]
+
+    def _evaluateRegular(self, q):
+        # Check for points inside (is_inside)
+        [dexit, din] = self._faceDistances(q, self.P0, self.N0, self.Pin, self.Nin)
+        [inside, irregular] = self._classifyInside(dexit, din)
+
+        # Move to the rotated frame centered on qx (map2diskScale)
+        qv = q - self.qx
+        nqv = sqrt((qv**2).sum(axis=1))
+        irregular |= (nqv < 1e-10)
+        qs = dot(qv, self.R.T)
+
+        # Smoothing near vertices (check_vertex)
+        dv = sqrt(((qs[:,newaxis,:] - self.Vs[newaxis,:,:])**2).sum(axis=2))
+        irregular |= (dv < 2*self.Brad).any(axis=1)
+
+        # Distance product and its partials (beta_function)
+        [dexit_s, Bi] = self._faceDistances(qs, self.Ps0, self.Ns0, self.Ps, self.Ns)
+        [inside_s, irregular_s] = self._classifyInside(dexit_s, Bi)
+        irregular |= irregular_s
+
+        Bi = maximum(Bi, -1.e-2*self.Bfact) # Limit how large the negative can be
+        B = Bi.prod(axis=1)
+
+        if self.has_exit:
+            B0 = maximum(dexit_s, -1.e-2*self.Bfact) # (P0-q).N0
+            DxB = -self.Ns0[0]*B
+            DyB = -self.Ns0[1]*B
+        else:
+            B0 = ones(B.shape)
+            DxB = zeros(B.shape)
+            DyB = zeros(B.shape)
+
+        B = B*B0
+
+        # Must be in a vertex region (2 negatives - only 2 given convex polygon)
+        vertex_region = ~inside_s & (B > 0)
+        B = where(vertex_region, -B, B)
+        if self.has_exit:
+            fix = vertex_region & (B0 < 0)
+            DxB = where(fix, (1 if -self.Ns0[0] > 0 else -1)*abs(DxB), where(vertex_region, -DxB, DxB))
+            DyB = where(fix, (1 if -self.Ns0[1] > 0 else -1)*abs(DyB), where(vertex_region, -DyB, DyB))
+
+        for i, others in enumerate(self.others):
+            Bp = B0*Bi[:,others].prod(axis=1)
+            Bp = where(vertex_region & (Bi[:,i] != 0), -Bp, Bp)
+            DxB = DxB + Bp*self.Ns[i,0]
+            DyB = DyB + Bp*self.Ns[i,1]
+
+        B = B*self.Bscale
+        DxB = DxB*self.Bscale
+        DyB = DyB*self.Bscale
+
+        # Map to the disk
+        nq = nqv
+        qc = qs/(nq + B)[:,newaxis]
+
+        # We started inside, so make sure we stay inside
+        nqc = sqrt((qc**2).sum(axis=1))
+        qc = where((inside & (nqc > 1.0))[:,newaxis], qc/nqc[:,newaxis], qc)
+
+        # Jacobian of the mapping
+        x = qs[:,0]
+        y = qs[:,1]
+        den = (B + nq)**2
+        DxW = (B - DxB*x + y**2/nq)/den
+        DyW = -((x*(DyB + y/nq))/den)
+        DxZ = -(((DxB + x/nq)*y)/den)
+        DyZ = (B + x**2/nq - DyB*y)/den
+
+        r = sqrt((qc**2).sum(axis=1))
+        w = qc[:,0]
+        z = qc[:,1]
+        irregular |= (r < 1e-10) | ((r > 1.0) & (r - 1 < 1e-12))
+
+        if self.last:
+            # Gradient of the goal potential in the disk (disk_goal)
+            [wf, zf] = self.qcf
+            den = -2*w*wf + wf**2*z**2 + (-1 + z*zf)**2 + w**2*(wf**2 + zf**2)
+            F = (w**2 - 2*w*wf + wf**2 + (z - zf)**2)/(2.*den)
+            DwF = -(((-1 + wf**2 + zf**2)*(-(w**2*wf) + wf*(-1 + z**2) + w*(1 + wf**2 - 2*z*zf + zf**2)))/den**2)
+            DzF = -(((-1 + wf**2 + zf**2)*((-1 + w**2)*zf - z**2*zf + z*(1 - 2*w*wf + wf**2 + zf**2)))/den**2)
+
+            [[DxW, DyW], [DxZ, DyZ]] = self.Jf
+        else:
+            # Solution to the heat equation in the disk (disk_heat)
+            ae1 = self.ae1
+            ae2 = self.ae2
+            theta = arctan2(z, w)
+            irregular |= (abs(r - 1) < 2e-6) & ((abs(ae1 - theta) < 2e-6) | (abs(ae2 - theta) < 2e-6))
+
+            F = where(r**2 <= 1.0,
+                      (ae2-ae1)/(2*pi) - arctan2(r*sin(ae1-theta), 1 - r*cos(ae1-theta))/pi + \
+                          arctan2(r*sin(ae2-theta), 1 - r*cos(ae2-theta))/pi,
+                      where((theta > ae1) | (theta < ae2), 0.0, 1.0))
+
+            c1 = cos(ae1 - theta)
+            s1 = sin(ae1 - theta)
+            c2 = cos(ae2 - theta)
+            s2 = sin(ae2 - theta)
+            DwF = ((-2*r*z + 2*z*c1 + 2*w*s1)/(-(r*(1 + r**2)) + 2*r**2*c1) + \
+                   (-2*r*z + 2*z*c2 + 2*w*s2)/(r*(1 + r**2) - 2*r**2*c2))/(2.*pi)
+            DzF = ((2*(r*w - w*c1 + z*s1))/(-(r*(1 + r**2)) + 2*r**2*c1) + \
+                   (2*(r*w - w*c2 + z*s2))/(r*(1 + r**2) - 2*r**2*c2))/(2.*pi)
+
+            # Avoid the vertex fix in polygon_heat_penn when the Jacobian is near singular
+            T = DxW**2 + DyW**2 + DxZ**2 + DyZ**2
+            D = abs(DxW*DyZ - DyW*DxZ)
+            s_max = sqrt((T + sqrt(maximum(T**2 - 4*D**2, 0)))/2)
+            irregular |= ~(s_max*s_max < 1e7*D)
+
+        # Pull back the normalized negative gradient (polygon_heat_penn)
+        Gx = DwF*DxW + DxZ*DzF
+        Gy = DwF*DyW + DyZ*DzF
+        NG = sqrt(Gx**2 + Gy**2)
+        NG = where(NG > 0, NG, inf)
+        G = -column_stack((Gx/NG, Gy/NG))
+
+        if self.last:
+            # Scaling factor a' la Rizzi '98 (Xgoal_penn)
+            D2 = ((q - self.qf)**2).sum(axis=1)
+            X = (D2/(D2 + self.alpha))[:,newaxis]*G
+        else:
+            # Rotate back to original frame
+            X = dot(G, self.R)
+
+        irregular |= ~isfinite(X).all(axis=1)
+        X[~isfinite(X)] = 0
+        F = array(F, dtype=float)
+
+        return [X, F, inside, irregular]
+
     #*************************************************************************
 
 
@@ -1320,7 +1597,7 @@ def disk_heat(q,ae1,ae2,hessian=False):
             H = mat([[lDwwF, lDwzF],
                      [lDwzF, lDzzF]])
             cn=cond(H)
-        return [F,G,H,cn,discontinuity,limit]
+        return [F,G,H,cn,discontinuity]
     else:
         limit=0
         # It gets a little crazy at these isolated points, so let's push off
@@ -1405,3 +1682,54 @@ def disk_heat(q,ae1,ae2,hessian=False):
             cn = cond(H)
       
     return [F,G,H,cn,discontinuity]
+
+def benchmarkFieldEvaluator(Vertex, exitface, last, num_points=2500):
+    """
+    Compares FieldEvaluator against the original point-by-point controller on a grid
+    of points covering the polygon ``Vertex``, printing the speed of each and the
+    largest difference between their results.
+    """
+
+    from time import time
+
+    data = getControllerData(mat(Vertex), exitface, last)
+    controller = makeController(data)
+    evaluator = FieldEvaluator(data)
+
+    side = int(sqrt(num_points))
+    xmin, ymin = asarray(Vertex).min(axis=1)
+    xmax, ymax = asarray(Vertex).max(axis=1)
+    gx, gy = meshgrid(linspace(xmin, xmax, side), linspace(ymin, ymax, side))
+    points = column_stack((gx.ravel(), gy.ravel()))
+
+    tic = time()
+    old = [controller(mat(p).T) for p in points]
+    old_time = time() - tic
+
+    tic = time()
+    [X, F, inside] = evaluator.evaluate(points)
+    batch_time = time() - tic
+
+    tic = time()
+    for p in points:
+        evaluator.evaluate(p)
+    single_time = time() - tic
+
+    X_old = array([asarray(o[0]).ravel() for o in old])
+    F_old = array([o[2] for o in old], dtype=float)
+    inside_old = array([o[3] for o in old], dtype=bool)
+
+    n = len(points)
+    print "%d points (%s region)" % (n, "last" if last else "exit face %d" % exitface)
+    print "  original:       %8.2f us/point" % (1e6*old_time/n)
+    print "  FieldEvaluator: %8.2f us/point in one batch, %8.2f us/point one at a time" % \
+          (1e6*batch_time/n, 1e6*single_time/n)
+    print "  max difference: X %.3g, F %.3g, inside %d" % \
+          (abs(X - X_old).max(), abs(F - F_old).max(), (inside != inside_old).sum())
+
+if __name__ == "__main__":
+    # Clockwise hexagon
+    Vertex = [[0., 1., 3., 4., 3., 1.],
+              [0., 2., 2., 0., -2., -2.]]
+    benchmarkFieldEvaluator(Vertex, 2, False)
+    benchmarkFieldEvaluator(Vertex, 2, True)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+=====================================================
+pathCache.py - Cache of Paths Between Regions
+=====================================================
+
+Remembers the paths planned by the motion controllers for each transition between regions,
+so that a robot that makes the same transition again from about the same place can reuse
+the old path instead of planning a new one.
+"""
+
+from numpy import *
+from math import floor, pi
+from collections import OrderedDict
+
+class PathCache(object):
+    def __init__(self, position_resolution, angle_resolution=None, max_paths=1000):
+        """
+        position_resolution - start positions in the same square of this size share a path
+        angle_resolution - start orientations within the same sector of this size share a path;
+                           if None, the orientation is ignored
+        max_paths - the most paths to keep; the oldest ones are dropped first
+        """
+
+        self.position_resolution = float(position_resolution)
+        self.angle_resolution = angle_resolution
+        self.max_paths = max_paths
+        self.paths = OrderedDict()     # (current region, next region, discretized pose) -> (D,N) array of waypoints
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _getKey(self, current_reg, next_reg, pose):
+        key = (current_reg, next_reg,
+               int(floor(pose[0]/self.position_resolution)),
+               int(floor(pose[1]/self.position_resolution)))
+
+        if self.angle_resolution is not None:
+            num_sectors = int(round(2*pi/self.angle_resolution))
+            key += (int(round(pose[2]/self.angle_resolution)) % num_sectors,)
+
+        return key
+
+    def get(self, current_reg, next_reg, pose):
+        """
+        Returns the waypoints of the path stored for a start at ``pose`` (x, y, theta), or None.
+        """
+
+        return self.paths.get(self._getKey(current_reg, next_reg, pose))
+
+    def put(self, current_reg, next_reg, pose, path):
+        """
+        Stores the (D,N) array of waypoints ``path``, the first of which is the start.
+        """
+
+        key = self._getKey(current_reg, next_reg, pose)
+        self.paths.pop(key, None)
+        self.paths[key] = asarray(path, dtype=float)
+        self._trim()
+
+    def update(self, paths):
+        """
+        Adds the paths of another cache with the same resolutions, e.g. from a saved ``paths``,
+        as older than those already stored.
+        """
+
+        merged = OrderedDict((key, path) for key, path in paths.iteritems() if key not in self.paths)
+        merged.update(self.paths)
+        self.paths = merged
+        self._trim()
+
+    def _trim(self):
+        while len(self.paths) > self.max_paths:
+            self.paths.popitem(last=False)
+
+    def discard(self, current_reg, next_reg, pose):
+        """
+        Forgets the path stored for a start at ``pose``, e.g. because it can't be reused from there.
+        """
+
+        self.paths.pop(self._getKey(current_reg, next_reg, pose), None)
+
+def repairPath(p, path, isSegmentFree, num_fixed=1):
+    """
+    Adapts a stored path to start at ``p`` instead, by heading straight for the last of its leading
+    waypoints that can all be reached directly from ``p``.  The last ``num_fixed`` waypoints are
+    always kept.  ``isSegmentFree(a, b)`` checks whether the robot can move directly
+    from ``a`` to ``b``.  Returns the new (D,N) array of waypoints, or None if no waypoint can be
+    reached and the path needs to be replanned.
+    """
+
+    p = asarray(p, dtype=float)[:path.shape[0]]
+
+    reachable = None
+    for k in xrange(path.shape[1] - num_fixed):
+        if not isSegmentFree(p, path[:,k]):
+            break
+        reachable = k
+
+    if reachable is None:
+        return None
+
+    return hstack((p[:,newaxis], path[:,reachable:]))
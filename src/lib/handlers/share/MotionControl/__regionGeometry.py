@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+=====================================================
+regionGeometry.py - Lab-frame Region Geometry Cache
+=====================================================
+
+Computes the lab-frame geometry of every region in a map once, so that motion controllers
+don't need to transform region vertices and search for transition faces on every update.
+"""
+
+from numpy import *
+from __is_inside import is_inside
+import hashlib
+
+class RegionGeometry(object):
+    def __init__(self, rfi, coordmap_map2lab):
+        """
+        rfi - the RegionFileInterface of the (decomposed) map used for execution
+        coordmap_map2lab - the map->lab coordinate transformation
+        """
+
+        self.rfi = rfi
+        self.coordmap_map2lab = coordmap_map2lab
+
+        self.vertices = []          # (2,N) matrix of lab-frame vertices for each region
+        self.bounding_boxes = []    # lab-frame (xmin, ymin, xmax, ymax) for each region
+
+        for region in rfi.regions:
+            points = self._toLab([x for x in region.getPoints()])
+            self.vertices.append(mat(points).T)
+            self.bounding_boxes.append((points[:,0].min(), points[:,1].min(), points[:,0].max(), points[:,1].max()))
+
+        # Index of the largest face shared with each adjacent region, and the faces themselves
+        self.transition_face_indices = {}
+        self.transition_faces = {}
+
+        transitions = getattr(rfi, "transitions", None)
+        if transitions is not None:
+            for i, row in enumerate(transitions):
+                for j, shared_faces in enumerate(row):
+                    if i != j and shared_faces:
+                        self.transition_face_indices[i, j] = self._findLargestSharedFace(i, j)
+                        self.transition_faces[i, j] = [self._toLab([x for x in face]) for face in shared_faces]
+
+    def _toLab(self, points):
+        if hasattr(self.coordmap_map2lab, "transformPoints"):
+            return self.coordmap_map2lab.transformPoints(points)
+        else:
+            return asarray(map(self.coordmap_map2lab, points), dtype=float)
+
+    def _findLargestSharedFace(self, current_reg, next_reg):
+        # For now, let's just choose the largest face available, because we are probably using a big clunky robot
+        transFaceIdx = None
+        max_magsq = 0
+        for i, face in enumerate(self.rfi.regions[current_reg].getFaces()):
+            if face not in self.rfi.transitions[current_reg][next_reg]:
+                continue
+
+            tf_pta, tf_ptb = face
+            tf_vector = tf_ptb - tf_pta
+            magsq = (tf_vector.x)**2 + (tf_vector.y)**2
+            if magsq > max_magsq:
+                transFaceIdx = i
+                max_magsq = magsq
+
+        return transFaceIdx
+
+    def getTransitionFaceIndex(self, current_reg, next_reg):
+        """
+        Returns the index of the largest face of region ``current_reg`` that is shared with
+        region ``next_reg``, or None if there is none.
+        """
+
+        return self.transition_face_indices.get((current_reg, next_reg))
+
+    def getTransitionFaces(self, current_reg, next_reg):
+        """
+        Returns a list of (2,2) arrays of the lab-frame endpoints of each face shared by
+        regions ``current_reg`` and ``next_reg``.
+        """
+
+        return self.transition_faces.get((current_reg, next_reg), [])
+
+    def getHash(self):
+        """
+        Returns a hash of the lab-frame region vertices and the choice of transition faces,
+        for checking whether anything saved for this map is still valid.
+        """
+
+        h = hashlib.sha1()
+        for vertices in self.vertices:
+            h.update(ascontiguousarray(vertices, dtype=float).tostring())
+            h.update("|")
+        h.update(repr(sorted(self.transition_face_indices.items())))
+
+        return h.hexdigest()
+
+    def isInside(self, p, reg):
+        """
+        Returns True if the lab-frame point ``p`` is inside region ``reg``.
+        """
+
+        xmin, ymin, xmax, ymax = self.bounding_boxes[reg]
+        if not (xmin <= p[0] <= xmax and ymin <= p[1] <= ymax):
+            return False
+
+        return is_inside(p, self.vertices[reg])
+
+    def findRegion(self, p):
+        """
+        Returns the index of the first region containing the lab-frame point ``p``, or None.
+        """
+
+        for reg in xrange(len(self.vertices)):
+            if self.isInside(p, reg):
+                return reg
+
+        return None
+
+_last_geometry = None
+
+def getRegionGeometry(rfi, coordmap_map2lab):
+    """
+    Returns the RegionGeometry for the given map and coordinate transformation,
+    reusing the last one created if it is for the same map.
+    """
+
+    global _last_geometry
+
+    if _last_geometry is None or _last_geometry.rfi is not rfi \
+       or _last_geometry.coordmap_map2lab is not coordmap_map2lab \
+       or len(_last_geometry.vertices) != len(rfi.regions):
+        _last_geometry = RegionGeometry(rfi, coordmap_map2lab)
+
+    return _last_geometry
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+=====================================================
+roadmap.py - Probabilistic Roadmap of a Region
+=====================================================
+
+A graph of free positions in a region and the straight paths between them, built once per
+region so that paths through the region can be found by a graph search instead of by
+planning from scratch.
+"""
+
+from numpy import *
+from __spatialIndex import SpatialIndex
+import heapq
+import random
+import Polygon
+import Polygon.Utils as PolyUtils
+import Polygon.Shapes as PolyShapes
+
+def getSweptCircle(a, b, radius):
+    """
+    Returns the polygon swept by a circle of the given radius moving straight from ``a`` to ``b``.
+    """
+
+    swept = PolyShapes.Circle(radius, (a[0], a[1]))
+    if (a[0], a[1]) != (b[0], b[1]):
+        swept += PolyShapes.Circle(radius, (b[0], b[1]))
+        swept = PolyUtils.convexHull(swept)
+    return swept
+
+class Roadmap(object):
+    def __init__(self, regionPoly, radius, num_samples=100, connection_radius=None, seed=None):
+        """
+        regionPoly - the polygon of the region (with any holes removed)
+        radius - radius of the robot; it must fit entirely inside the region along the roadmap
+        num_samples - number of free positions to sample, trying at most ten times as many
+        connection_radius - the longest edge of the roadmap; by default, a few times the
+                            average spacing of the samples
+        seed - seed for the random sampling, to get the same roadmap every time
+        """
+
+        self.radius = radius
+
+        if connection_radius is None:
+            connection_radius = 3*sqrt(regionPoly.area()/num_samples)
+        self.connection_radius = connection_radius
+
+        rng = random.Random(seed)
+        xmin, xmax, ymin, ymax = regionPoly.boundingBox()
+
+        # Sample free positions
+        nodes = []
+        for i in xrange(10*num_samples):
+            if len(nodes) >= num_samples:
+                break
+            p = (rng.uniform(xmin, xmax), rng.uniform(ymin, ymax))
+            if regionPoly.covers(PolyShapes.Circle(radius, p)):
+                nodes.append(p)
+
+        self.nodes = array(nodes, dtype=float).reshape((-1,2))
+        self.node_index = SpatialIndex(connection_radius)
+        for i, p in enumerate(nodes):
+            self.node_index.insert(i, p)
+
+        # Connect each of them to the others in view
+        self.edges = [{} for p in nodes]   # node -> {neighbouring node: length of edge}
+        for i, p in enumerate(nodes):
+            for j in self.node_index.neighbors(p, connection_radius):
+                if j <= i:
+                    continue
+                if regionPoly.covers(getSweptCircle(p, nodes[j], radius)):
+                    length = hypot(p[0]-nodes[j][0], p[1]-nodes[j][1])
+                    self.edges[i][j] = length
+                    self.edges[j][i] = length
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _connect(self, p, regionPoly):
+        """
+        Returns a dictionary of the nodes that can be reached directly from ``p``, and the distance to each
+        """
+
+        result = {}
+        for i in self.node_index.neighbors(p, self.connection_radius):
+            if regionPoly.covers(getSweptCircle(p, self.nodes[i], self.radius)):
+                result[i] = hypot(p[0]-self.nodes[i,0], p[1]-self.nodes[i,1])
+        return result
+
+    def findPath(self, start, goals, regionPoly):
+        """
+        Returns a (2,N) array of the waypoints of the shortest path on the roadmap from ``start``
+        to any of the points in the list ``goals``, and the index of the goal reached.  Connections
+        from the start and the goals to the roadmap must be covered by ``regionPoly``, which may
+        be a little bigger than the region the roadmap was built in.  Returns (None, None) if
+        there is no such path.
+        """
+
+        start = (float(start[0]), float(start[1]))
+        num_nodes = len(self.nodes)
+
+        # The goals are extra nodes after the roadmap's own, with edges only into them
+        goal_edges = {}
+        for k, goal in enumerate(goals):
+            goal = (float(goal[0]), float(goal[1]))
+            for i, length in self._connect(goal, regionPoly).iteritems():
+                goal_edges.setdefault(i, {})[num_nodes+k] = length
+        start_edges = self._connect(start, regionPoly)
+        for k, goal in enumerate(goals):
+            if regionPoly.covers(getSweptCircle(start, goal, self.radius)):
+                start_edges[num_nodes+k] = hypot(start[0]-goal[0], start[1]-goal[1])
+
+        # Dijkstra's algorithm, from the start (node -1)
+        distance = {-1: 0.0}
+        previous = {}
+        queue = [(0.0, -1)]
+        reached = None
+        while queue:
+            d, i = heapq.heappop(queue)
+            if d > distance[i]:
+                continue
+            if i >= num_nodes:
+                reached = i
+                break
+
+            if i < 0:
+                neighbors = start_edges.items()
+            else:
+                neighbors = self.edges[i].items() + goal_edges.get(i, {}).items()
+
+            for j, length in neighbors:
+                if d + length < distance.get(j, inf):
+                    distance[j] = d + length
+                    previous[j] = i
+                    heapq.heappush(queue, (d + length, j))
+
+        if reached is None:
+            return None, None
+
+        # Follow the path back from the goal
+        waypoints = [goals[reached-num_nodes]]
+        i = previous[reached]
+        while i >= 0:
+            waypoints.append(self.nodes[i])
+            i = previous[i]
+        waypoints.append(start)
+        waypoints.reverse()
+
+        return array(waypoints, dtype=float).T, reached-num_nodes
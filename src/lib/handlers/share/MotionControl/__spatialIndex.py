@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+=====================================================
+spatialIndex.py - Incremental Index of 2D Points
+=====================================================
+
+A uniform grid of buckets of points, used by the motion controllers to find the nodes
+of a growing tree or roadmap near a given location without checking all of them.
+"""
+
+from math import floor, ceil
+
+class SpatialIndex(object):
+    def __init__(self, cell_size):
+        """
+        cell_size - the side of each grid cell; queries are fastest when this is
+                    about the radius that will usually be searched
+        """
+
+        self.cell_size = float(cell_size)
+        self.cells = {}     # (i, j) -> keys of the points in that cell
+        self.points = {}    # key -> (x, y)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _getCell(self, p):
+        return (int(floor(p[0]/self.cell_size)), int(floor(p[1]/self.cell_size)))
+
+    def insert(self, key, p):
+        """
+        Adds the point ``p`` to the index, to be returned as ``key``.
+        """
+
+        self.points[key] = (float(p[0]), float(p[1]))
+        self.cells.setdefault(self._getCell(p), []).append(key)
+
+    def neighbors(self, p, radius):
+        """
+        Returns the keys of all points closer than ``radius`` to ``p``.
+        """
+
+        (ci, cj) = self._getCell(p)
+        n = int(ceil(radius/self.cell_size))
+        radius_sq = radius**2
+
+        result = []
+        for i in xrange(ci-n, ci+n+1):
+            for j in xrange(cj-n, cj+n+1):
+                for key in self.cells.get((i, j), ()):
+                    (x, y) = self.points[key]
+                    if (x-p[0])**2 + (y-p[1])**2 < radius_sq:
+                        result.append(key)
+
+        return result
@@ -173,3 +173,73 @@ def getGlobalVF(bp,Vf,Vc):
 	V = bp*Vf + (1 - bp)*Vc
 	V = V / norm(V)
 	return V
+
+
+class VectorField(object):
+	"""
+	This class precomputes the face data of a cell, so that the vector field of
+	getController() can be evaluated at many points at once (e.g. to plot it over
+	a grid).
+	The inputs are (given in order):
+		vert = vertices of the region, specified in clockwise order (2 x No. of vertices)
+		exit = index of exit face, or None to head to the center of the region
+	"""
+
+	def __init__(self, vert, exit):
+		vert = asarray(vert, dtype=float)
+		V = hstack((vert, vert[:, : 1]))
+		self.start = ascontiguousarray(V[:, :-1].T)  # first vertex of each face
+		self.delta = ascontiguousarray(diff(V, axis=1).T)  # vector along each face
+		self.length = sqrt((self.delta**2).sum(axis=1))
+		self.vertical = (self.delta[:, 0] == 0)
+		self.horizontal = (self.delta[:, 1] == 0)
+
+		# Face Vector Field in the region of influence of each face
+		self.face_vf = array([getFaceVF(vert, i, exit) for i in range(vert.shape[1])])
+
+		# Attractor of the Cell Vector Field
+		if exit is None:
+			self.attractor = vert.mean(axis=1)
+		else:
+			self.attractor = self.start[exit] + self.delta[exit]/float(2)
+
+	def evaluate(self, points):
+		"""
+		This function returns the velocity vectors of the field at each of the
+		given points, as an (N x 2) array.  The velocity is zero at the attractor,
+		where the field isn't defined.
+		The input is:
+			points = x-y positions (N x 2), or a single x-y position
+		"""
+
+		p = atleast_2d(asarray(points, dtype=float))[:, 0:2]
+		idx = arange(p.shape[0])
+
+		# Distances to each face, as in getRegion()
+		rel = self.start[newaxis, :, :] - p[:, newaxis, :]
+		cross = self.delta[:, 0]*rel[:, :, 1] - rel[:, :, 0]*self.delta[:, 1]
+		d = where(self.vertical, abs(rel[:, :, 0]),
+				  where(self.horizontal, abs(rel[:, :, 1]), abs(cross) / self.length))
+		ROI = d.argmin(axis=1)
+		min_d = d[idx, ROI]
+
+		with errstate(divide='ignore', invalid='ignore', over='ignore'):
+			# s-parameter and bump function, as in getSParam() and getBump()
+			# (a point on a vertex is on two faces, and only the one in ROI counts)
+			frac = where(d == 0, 0.0, (d - min_d[:, newaxis]) / d)
+			frac[idx, ROI] = 1
+			s = 1 - frac.prod(axis=1)
+			Ls = (1 / s) * exp(-1 / s)
+			Ls_2 = (1 / (1-s)) * exp(-1 / (1-s))
+			b = where(s <= 0, 1.0, where(s >= 1, 0.0, 1 - Ls / (Ls + Ls_2)))[:, newaxis]
+
+			# Face and Cell Vector Fields, blended as in getGlobalVF()
+			Vf = self.face_vf[ROI]
+			Vc = self.attractor - p
+			Vc = Vc / sqrt((Vc**2).sum(axis=1))[:, newaxis]
+			Vc[~isfinite(Vc)] = 0
+			Vel = b*Vf + (1 - b)*Vc
+			Vel = Vel / sqrt((Vel**2).sum(axis=1))[:, newaxis]
+			Vel[~isfinite(Vel)] = 0
+
+		return Vel
@@ -13,16 +13,195 @@
 import os, sys, re
 import fileMethods
 import inspect, types
-from numpy import linalg, array, finfo, mat, eye
+from numpy import linalg, array, finfo, eye, asarray, dot, ndarray
 from copy import deepcopy
 import ast
 import json
 import traceback
 import globalConfig, logging
 import importlib
+import imp
+import functools
 import handlers.handlerTemplates as ht
 from hsubParsingUtils import parseCallString
 
+# File (in the user's cache directory) where handler metadata is cached between runs,
+# so that discovering handlers doesn't require importing all of them
+HANDLER_METADATA_CACHE_FILE = "handler_metadata.json"
+
+_handlerMetadataCache = None
+_handlerMetadataCacheDirty = False  # whether there is metadata that hasn't been saved yet
+
+def _getHandlerMetadataCachePath():
+    cache_dir = globalConfig.get_cache_dir()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, HANDLER_METADATA_CACHE_FILE)
+
+def _getHandlerMetadataCache():
+    global _handlerMetadataCache
+
+    if _handlerMetadataCache is None:
+        try:
+            with open(_getHandlerMetadataCachePath()) as f:
+                _handlerMetadataCache = json.load(f)
+        except (IOError, ValueError, TypeError):
+            _handlerMetadataCache = {}
+
+    return _handlerMetadataCache
+
+def _saveHandlerMetadataCache():
+    global _handlerMetadataCacheDirty
+
+    cache_path = _getHandlerMetadataCachePath()
+    if cache_path is None or not _handlerMetadataCacheDirty:
+        return
+    _handlerMetadataCacheDirty = False
+    temp_path = "{}.{}".format(cache_path, os.getpid())
+
+    # Write to a temporary file first, so other processes never see half a cache
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(_handlerMetadataCache, f)
+        if os.name == "nt" and os.path.exists(cache_path):
+            os.remove(cache_path)
+        os.rename(temp_path, cache_path)
+    except (IOError, OSError) as e:
+        logging.debug("Could not save handler metadata cache: {}".format(e))
+
+def _parseImports(file_path):
+    """
+    Return the names of the top-level modules imported by the given file,
+    or None if it can't be parsed.  Only imports at the top level of the file
+    are included, since others are usually optional.
+    """
+
+    try:
+        with open(file_path) as f:
+            tree = ast.parse(f.read(), file_path)
+    except (IOError, SyntaxError):
+        return None
+
+    return _importsInTree(tree)
+
+def _importsInTree(tree):
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module is not None:
+            names.append(node.module.split('.')[0])
+
+    return names
+
+_moduleExists = {}
+
+def _findMissingImport(file_path, imports, _visited=None):
+    """
+    Return the name of a module that the given file imports (directly, or through
+    other modules next to it) but that can't be found, or None if they all can.
+    This is how importing a handler most often fails, and it can be checked
+    without importing anything.
+    """
+
+    if _visited is None:
+        _visited = set()
+    _visited.add(file_path)
+
+    file_dir = os.path.dirname(file_path)
+    for name in imports:
+        local_path = os.path.join(file_dir, name)
+        if os.path.exists(local_path + ".py"):
+            # Imports of modules next to this one are relative in Python 2
+            if local_path + ".py" not in _visited:
+                missing = _findMissingImport(local_path + ".py", _parseImports(local_path + ".py") or [], _visited)
+                if missing is not None:
+                    return missing
+            continue
+        elif os.path.exists(os.path.join(local_path, "__init__.py")):
+            continue
+
+        if name not in _moduleExists:
+            # Also look where LTLMoP's own modules are, in case we were started from elsewhere
+            for path in [None, [globalConfig.get_ltlmop_root(), os.path.join(globalConfig.get_ltlmop_root(), "lib")]]:
+                try:
+                    f = imp.find_module(name, path)[0]
+                except ImportError:
+                    continue
+                if f is not None:
+                    f.close()
+                _moduleExists[name] = True
+                break
+            else:
+                _moduleExists[name] = False
+
+        if not _moduleExists[name]:
+            return name
+
+    return None
+
+def _parseHandlerMetadata(file_path):
+    """
+    Find the handler class in the given handler file without importing it, by
+    looking at its syntax tree.  Returns a dictionary with the class name, the
+    handler type name, the name, docstring and argument names of each method
+    defined in the class itself, and the modules the file imports, or None if
+    the handler is not simple enough to be understood this way.
+    """
+
+    try:
+        with open(file_path) as f:
+            tree = ast.parse(f.read(), file_path)
+    except (IOError, SyntaxError):
+        return None
+
+    handler_type_names = ht.getAllHandlerTypeName(short_name=False)
+
+    # Only look for classes that directly subclass one of the handler templates
+    handler_classes = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        for base in node.bases:
+            base_name = base.attr if isinstance(base, ast.Attribute) else getattr(base, 'id', None)
+            if base_name in handler_type_names:
+                handler_classes.append((node, base_name))
+
+    if len(handler_classes) != 1:
+        return None
+
+    handler_class, base_name = handler_classes[0]
+
+    # Other base classes could contribute methods too
+    if len(handler_class.bases) != 1:
+        return None
+
+    methods = []
+    for node in handler_class.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+
+        # Decorated methods and tuple arguments are beyond us
+        if node.decorator_list or not all(isinstance(a, ast.Name) for a in node.args.args):
+            return None
+
+        methods.append({"name": node.name,
+                        "doc": ast.get_docstring(node),
+                        "args": [a.id for a in node.args.args]})
+
+    # Methods inherited from the template don't have any parameters to describe
+    if "__init__" not in (m["name"] for m in methods):
+        return None
+
+    methods.sort(key=lambda m: m["name"])
+
+    return {"class_name": handler_class.name, "h_type": base_name, "methods": methods,
+            "imports": _importsInTree(tree)}
+
+def _str(s):
+    # JSON gives us back unicode, but everyone else expects str
+    return s.encode("utf-8") if isinstance(s, unicode) else s
+
 
 ###################################################
 # Define individual objects for handler subsystem #
@@ -212,6 +391,17 @@ class HandlerMethodConfig(object):
 
         return self.method_reference(**arg_dict)
 
+    def getBoundFunction(self):
+        """
+        Return a function equivalent to execute(), but with the stored parameter values
+        bound once up front, for when the method will be called many times.
+        Changes to the parameter values after this is called will not take effect.
+        """
+        if self.method_reference is None:
+            raise ValueError("No reference of method {} is set.".format(self.name))
+
+        return functools.partial(self.method_reference, **self.getArgDict())
+
     def fromMethod(self, method, handler_config):
         """
         Create a HandlerMethodConfig from the python method object
@@ -220,11 +410,19 @@ class HandlerMethodConfig(object):
         handler_config: instance of HandlerConfig where this HandlerMethodConfig locates
         """
 
-        self.name = method.__name__
+        self.fromMethodInfo(method.__name__, inspect.getdoc(method), inspect.getargspec(method)[0], handler_config)
+
+    def fromMethodInfo(self, name, doc, arg_names, handler_config):
+        """
+        Create a HandlerMethodConfig from the name, docstring and argument names of a method
+
+        handler_config: instance of HandlerConfig where this HandlerMethodConfig locates
+        """
+
+        self.name = name
         self.handler = handler_config
 
         # parse the description of the function
-        doc = inspect.getdoc(method)
         if doc is not None:
             for line in doc.split('\n'):
 
@@ -248,7 +446,7 @@ class HandlerMethodConfig(object):
         self.comment = self.comment.strip()
 
         # check what Python thinks are the parameters of the method
-        para_names = set(inspect.getargspec(method)[0])
+        para_names = set(arg_names)
 
         # make sure we have a description for every non-ignored parameter
         for n in para_names - self.handler.ignore_parameters:
@@ -368,14 +566,84 @@ class HandlerConfig(object):
 
         return name, h_type, handler_class
 
+    @classmethod
+    def loadHandlerMetadata(self, handler_module_path):
+        """
+        Find the name, type and methods of the handler in a given handler module,
+        without importing the module unless it is too unusual to understand otherwise.
+        Methods are returned as (name, docstring, argument names) tuples.
+
+        Results are cached until the handler file is modified, and written to disk
+        by saveHandlerMetadataCache().  Like importing the module, raises ImportError
+        if the handler imports a module that isn't available.
+        """
+
+        global _handlerMetadataCacheDirty
+
+        # add lib to the module name if it is not there already
+        if not handler_module_path.startswith('lib.'): handler_module_path = 'lib.' + handler_module_path
+        handler_module_name = handler_module_path.rpartition('.')[2]
+        file_path = os.path.join(globalConfig.get_ltlmop_root(), *handler_module_path.split('.')) + '.py'
+
+        cache = _getHandlerMetadataCache()
+
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            metadata = None
+        else:
+            metadata = cache.get(file_path)
+            if metadata is None or metadata["mtime"] != st.st_mtime or metadata["size"] != st.st_size:
+                metadata = _parseHandlerMetadata(file_path)
+                if metadata is not None:
+                    metadata.update(mtime=st.st_mtime, size=st.st_size)
+                    cache[file_path] = metadata
+                    _handlerMetadataCacheDirty = True
+
+        if metadata is None:
+            # Do it the slow way
+            name, h_type, handler_class = self.loadHandlerClass(handler_module_path)
+            methods = [(method_name, inspect.getdoc(method), inspect.getargspec(method)[0])
+                       for method_name, method in inspect.getmembers(handler_class, inspect.ismethod)]
+            return name, h_type, methods
+
+        missing_module = _findMissingImport(file_path, map(_str, metadata["imports"]))
+        if missing_module is not None:
+            logging.warning("Failed to import handler {0} : No module named {1}".format(handler_module_name, missing_module))
+            raise ImportError
+
+        if metadata["class_name"].lower() != handler_module_name.lower():
+            logging.warning("File name: {0} mismatch with class name: {1}.".format(metadata["class_name"], handler_module_name))
+
+        h_type = ht.getHandlerTypeClass(_str(metadata["h_type"]))
+        methods = [(_str(m["name"]), _str(m["doc"]), map(_str, m["args"])) for m in metadata["methods"]]
+
+        # Add the methods inherited from the handler template, as inspecting the class would
+        own_method_names = set(m[0] for m in methods)
+        methods.extend((method_name, inspect.getdoc(method), inspect.getargspec(method)[0])
+                       for method_name, method in inspect.getmembers(h_type, inspect.ismethod)
+                       if method_name not in own_method_names)
+        methods.sort(key=lambda m: m[0])
+
+        return handler_module_name, h_type, methods
+
+    @classmethod
+    def saveHandlerMetadataCache(self):
+        """
+        Write the metadata found by loadHandlerMetadata() since the last save to the cache on disk.
+        """
+
+        _saveHandlerMetadataCache()
+
     def loadHandlerMethod(self, handler_module_path, onlyLoadInit=False):
         """
         Load method info (name, arg...) in the given handler file
         If onlyLoadInit is True, only the info of __init__ method will be loaded
         If over_write_h_type is given, then over write the handler type with it
+        The handler module itself is not imported until the handler is instantiated
         """
-        # load the handler class first
-        name, h_type, handler_class = self.loadHandlerClass(handler_module_path)
+        # load the handler info first
+        name, h_type, handler_methods = self.loadHandlerMetadata(handler_module_path)
 
         # update the handler name and type info
         # handler name is the name of the file
@@ -388,17 +656,14 @@ class HandlerConfig(object):
         else:
             onlyLoadInit = True
 
-        # get all methods in this handler
-        handler_methods = inspect.getmembers(handler_class, inspect.ismethod)
-
         # parse each method into method object
-        for method_name, method in handler_methods:
+        for method_name, doc, arg_names in handler_methods:
             # only parse the method not start with underscore (exclude __inti__)
             # only parse the __init__ method if required
             if ((not onlyLoadInit and (not str(method_name).startswith('_')) or str(method_name)=='__init__') ):
                 method_config = HandlerMethodConfig(name=method_name)
                 try:
-                    method_config.fromMethod(method, self)
+                    method_config.fromMethodInfo(method_name, doc, arg_names, self)
                 except SyntaxError as e:
 #                     raise ht.LoadingError("Error while inspecting method {!r} of handler {!r}: {}".format(method_name, handler_module_path, e))
                     logging.warning("Error while inspecting method {!r} of handler {!r}: {}".format(method_name, handler_module_path, e))
@@ -406,6 +671,35 @@ class HandlerConfig(object):
                 # add this method into the method list of the handler
                 self.methods.append(method_config)
 
+class CoordinateTransform(object):
+    """
+    An affine coordinate transformation given by a 3x3 matrix in homogeneous coordinates,
+    which can be called like a function on a single point (returning [x, y]) or on an
+    (N, 2) array of points (returning an (N, 2) array).
+    """
+    def __init__(self, T):
+        # Only the first two rows matter, since we don't use the third coordinate
+        self.A = array(T, dtype=float)[0:2, 0:2]
+        self.b = array(T, dtype=float)[0:2, 2]
+
+        # Unpack these too, because plain float arithmetic is much faster for single points
+        (self.a11, self.a12), (self.a21, self.a22) = self.A.tolist()
+        self.b1, self.b2 = self.b.tolist()
+
+    def __call__(self, pt):
+        if isinstance(pt, ndarray) and pt.ndim == 2:
+            return self.transformPoints(pt)
+
+        x, y = float(pt[0]), float(pt[1])
+        return [self.a11*x + self.a12*y + self.b1, self.a21*x + self.a22*y + self.b2]
+
+    def transformPoints(self, pts):
+        """
+        Transform each row of an (N, 2) array (or list of points), returning an (N, 2) array
+        """
+        pts = asarray(pts, dtype=float)
+        return dot(pts[:, 0:2], self.A.T) + self.b
+
 class RobotConfig(object):
     """
     A Robot config object
@@ -479,8 +773,8 @@ class RobotConfig(object):
             T = eye(3)
 
         #### Create the coordmap functions
-        coordmap_map2lab = lambda pt: (linalg.inv(T) * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
-        coordmap_lab2map = lambda pt: (T * mat([pt[0], pt[1], 1]).T).T.tolist()[0][0:2]
+        coordmap_map2lab = CoordinateTransform(linalg.inv(T))
+        coordmap_lab2map = CoordinateTransform(T)
 
         return coordmap_map2lab, coordmap_lab2map
 
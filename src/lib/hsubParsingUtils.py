@@ -99,6 +99,19 @@ def parseCallString(text, mode="single", make_call_function=None):
 
     return call_list, f
 
+def flattenBoolOp(tree):
+    """ Return the operands of BoolOp `tree`, with the operands of any directly
+        nested BoolOps of the same type merged in (in order). """
+
+    values = []
+    for t in tree.values:
+        if isinstance(t, ast.BoolOp) and type(t.op) is type(tree.op):
+            values.extend(flattenBoolOp(t))
+        else:
+            values.append(t)
+
+    return values
+
 def parseCallTree(tree, mode, make_call_function):
     """ This function contains the recursive parts of parseCallString. """
 
@@ -107,8 +120,9 @@ def parseCallTree(tree, mode, make_call_function):
         if mode == "single":
             raise SyntaxError("Boolean operators are not permitted in 'single' parsing mode.")
 
-        # Evaluate our children
-        subresults = [parseCallTree(t, mode, make_call_function) for t in tree.values]
+        # Evaluate our children, flattening any nested operators of the same
+        # kind (e.g. "a and (b and c)") so there is only one level to evaluate
+        subresults = [parseCallTree(t, mode, make_call_function) for t in flattenBoolOp(tree)]
 
         # Combine all the CallDescriptors from our children
         joined_calls = chain.from_iterable(r[0] for r in subresults)
@@ -118,17 +132,28 @@ def parseCallTree(tree, mode, make_call_function):
         if make_call_function is None:
             return joined_calls, None
 
+        subfunctions = tuple(r[1] for r in subresults)
+
         # Construct a function appropriately joining our subfunctions
+        # (these get called for every sensor update, so avoid any unnecessary overhead)
         if isinstance(tree.op, ast.And):
             if mode == "sensor":
-                f = lambda **kwargs: all(r[1](**kwargs) for r in subresults)
+                def f(**kwargs):
+                    for g in subfunctions:
+                        if not g(**kwargs):
+                            return False
+                    return True
             elif mode == "actuator":
                 # For actuators, we treat "and" as "and next..."
                 # We can return a list of the return values, but it's probably not useful
-                f = lambda **kwargs: [r[1](**kwargs) for r in subresults]
+                f = lambda **kwargs: [g(**kwargs) for g in subfunctions]
         elif isinstance(tree.op, ast.Or):
             if mode == "sensor":
-                f = lambda **kwargs: any(r[1](**kwargs) for r in subresults)
+                def f(**kwargs):
+                    for g in subfunctions:
+                        if g(**kwargs):
+                            return True
+                    return False
             elif mode == "actuator":
                 raise SyntaxError("OR operator is not permitted in actuators because it doesn't make sense.")
 
@@ -1265,45 +1265,40 @@ def replaceLogicOp(formula):
 
     return formula
 
+# Matches, in order of precedence: next(s.X), next((s.X)), s.X and e.X
+RegionNameRE = re.compile(r'next\(s\.(\w+)\)|next\(\(s\.(\w+)\)\)|\bs\.(\w+)\b|\be\.(\w+)\b')
+
+# Maps (region names, id(bitEncode)) -> (bitEncode, {region name: (next, current, env) encodings})
+_regionEncodingCache = {}
+
+def _getRegionEncodingMap(bitEncode,regionList):
+    key = (tuple(regionList), id(bitEncode))
+    if key not in _regionEncodingCache:
+        # Only keep a handful of maps around; there is usually just one per compilation
+        if len(_regionEncodingCache) > 8:
+            _regionEncodingCache.clear()
+        # Hold on to bitEncode so its id cannot be reused while the entry is alive
+        _regionEncodingCache[key] = (bitEncode, dict((prop, (bitEncode['next'][ind], bitEncode['current'][ind], bitEncode['env'][ind]))
+                                                     for ind, prop in reversed(list(enumerate(regionList)))))
+    return _regionEncodingCache[key][1]
+
 def replaceRegionName(formula,bitEncode,regionList):
     ''' This function replaces the region names with the appropriate bit encoding.
+        'next' region names get the next encoding, other region names the current
+        encoding, and region sensors (e.X) the env encoding.  All substitutions are
+        done in a single pass over the formula.
     '''
-    tempFormula = formula[:]
-    
-    # first replace all 'next' region names with the next encoding
-    for nextProp in re.findall('(next\(s\.\w+\)|next\(\(s\.\w+\)\))',tempFormula):
-        prop = nextProp.replace('next((s.','')
-        prop = prop.replace('next(s.','')
-        prop = prop.replace(')','')
-
-        if prop in regionList:
-            ind = regionList.index(prop)
-            tempFormula = tempFormula.replace(nextProp, bitEncode['next'][ind])
-            # 'replace' is fine here because we are replacing next(region) and that cannot be a partial name
-               
-    # replace all leftover region names with the current encoding
-    for prop in re.findall('s\.(\w+)',tempFormula):
-        if prop in regionList:
-            ind = regionList.index(prop)
-            # replace every occurrence of the proposition with the bit encoding
-            # it is written this way to prevent partial word replacements (as with the .replace method)
-            #tempFormula = re.sub('\s+'+prop, ' '+bitEncode['current'][ind],tempFormula) # if following a space
-            #tempFormula = re.sub('\('+prop, '('+bitEncode['current'][ind],tempFormula) # if in ()
-            tempFormula = re.sub('\\bs\.'+prop+'\\b', bitEncode['current'][ind],tempFormula)
-
-            #tempFormula = tempFormula.replace(prop, bitEncode['current'][ind])
-    
-    # Handle region sensor names
-    for prop in re.findall('e\.(\w+)',tempFormula):
-        if prop in regionList:
-            ind = regionList.index(prop)
-            # replace every occurrence of the proposition with the bit encoding
-            # it is written this way to prevent partial word replacements (as with the .replace method)
-            tempFormula = re.sub('\\be\.'+prop+'\\b', bitEncode['env'][ind],tempFormula)
-    
-    LTLsubformula = tempFormula 
+    encodings = _getRegionEncodingMap(bitEncode,regionList)
 
-    return LTLsubformula
+    def substitute(m):
+        for group, enc in ((1, 0), (2, 0), (3, 1), (4, 2)):
+            prop = m.group(group)
+            if prop is not None:
+                if prop in encodings:
+                    return encodings[prop][enc]
+                return m.group(0)
+
+    return RegionNameRE.sub(substitute, formula)
 
 def createStayFormula(regionNames, use_bits=True):
     if use_bits:
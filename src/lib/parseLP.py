@@ -9,6 +9,32 @@ import decomposition
 
 Polygon.setTolerance(0.1)
 
+def findLocativePhrases(spec):
+    """ Return the lists (regionNear, regionBetween) of regions that need to be
+        generated for the locative prepositions used in `spec` """
+
+    regionNear = []
+    regionBetween = []
+
+    # get all regions that need to find "region near"
+    # the items in the list are tuple with region name and distance from the region boundary, default value is 50
+    for m in re.finditer(r'near (?P<rA>\w+)', spec):
+        if m.group("rA") not in regionNear:
+            regionNear.append((m.group("rA"),50))
+            
+    # find "within distance from a region" is just special case of find "region near"
+    for m in re.finditer(r'within (?P<dist>\d+) (from|of) (?P<rA>\w+)', spec):
+        if m.group("rA") not in regionNear:
+            regionNear.append((m.group("rA"),int(m.group("dist"))))
+            
+    # get all regions that need to find "region between"
+    # the items in the list are tuple with two region names       
+    for m in re.finditer(r'between (?P<rA>\w+) and (?P<rB>\w+)', spec):
+        if (m.group("rA"),m.group("rB")) not in regionBetween and (m.group("rB"),m.group("rA")) not in regionBetween:
+            regionBetween.append((m.group("rA"),m.group("rB")))
+
+    return regionNear, regionBetween
+
 class parseLP:
     """
     A parser to parse the locative prepositions in specification
@@ -48,22 +74,7 @@ class parseLP:
             # turn list of string into one string
             spec = "\n".join([line for line in self.proj.spec_data['SPECIFICATION']['Spec'] if not line.startswith("#")])
             
-            # get all regions that need to find "region near"
-            # the items in the list are tuple with region name and distance from the region boundary, default value is 50
-            for m in re.finditer(r'near (?P<rA>\w+)', spec):
-                if m.group("rA") not in self.regionNear:
-                    self.regionNear.append((m.group("rA"),50))
-                    
-            # find "within distance from a region" is just special case of find "region near"
-            for m in re.finditer(r'within (?P<dist>\d+) (from|of) (?P<rA>\w+)', spec):
-                if m.group("rA") not in self.regionNear:
-                    self.regionNear.append((m.group("rA"),int(m.group("dist"))))
-                    
-            # get all regions that need to find "region between"
-            # the items in the list are tuple with two region names       
-            for m in re.finditer(r'between (?P<rA>\w+) and (?P<rB>\w+)', spec):
-                if (m.group("rA"),m.group("rB")) not in self.regionBetween and (m.group("rB"),m.group("rA")) not in self.regionBetween:
-                    self.regionBetween.append((m.group("rA"),m.group("rB")))
+            self.regionNear, self.regionBetween = findLocativePhrases(spec)
                 
             # generate new regions
             self.generateNewRegion()
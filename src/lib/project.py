@@ -13,6 +13,7 @@
 import os, sys
 import fileMethods, regions
 from numpy import *
+from copy import copy, deepcopy
 import logging
 import globalConfig
 
@@ -46,6 +47,7 @@ class Project:
                                 "symbolic": False,  # Use BDDs instead of explicit-state strategies
                                 "decompose": True,  # Create regions for free space and region overlaps (required for Locative Preposition support)
                                 "use_region_bit_encoding": True, # Use a vector of "bitX" propositions to represent regions, for efficiency
+                                "compact_topology": False, # Group topology destinations by shared bit prefixes (requires bit encoding)
                                 "synthesizer": "jtlv", # Name of synthesizer to use ("jtlv" or "slugs")
                                 "parser": "structured"}  # Spec parser: SLURP ("slurp"), structured English ("structured"), or LTL ("ltl")
 
@@ -54,6 +56,36 @@ class Project:
     def setSilent(self, silent):
         self.silent = silent
 
+    def snapshot(self):
+        """
+        Return a lightweight copy of this project, e.g. for compiling a modified
+        specification alongside the original.
+
+        Only the specification and proposition settings are copied, and the map
+        is shared with the original, so replace (rather than modify) it on the copy
+        if it needs to differ.  The copy gets no handlers and no shared data of its
+        own; those belong to the running project.
+        """
+
+        new_proj = copy(self)
+
+        new_proj.shared_data = {}
+        new_proj.h_instance = {'init':{},'pose':None,'locomotionCommand':None,'motionControl':None,'drive':None,'sensor':{},'actuator':{}}
+        for attr in ["hsub", "sensor_handler", "actuator_handler"]:
+            new_proj.__dict__.pop(attr, None)
+
+        new_proj.spec_data = deepcopy(self.spec_data)  # Only strings, so this is cheap
+        new_proj.compile_options = dict(self.compile_options)
+
+        if self.regionMapping is not None:
+            new_proj.regionMapping = dict((k, list(v)) for k, v in self.regionMapping.iteritems())
+
+        for attr in ["all_sensors", "enabled_sensors", "all_actuators", "enabled_actuators",
+                     "all_customs", "internal_props"]:
+            setattr(new_proj, attr, list(getattr(self, attr)))
+
+        return new_proj
+
     def loadRegionMapping(self):
         """
         Takes the region mapping data and returns region mapping dictionary.
@@ -1,24 +1,33 @@
 import itertools
-import project
+import threading
 import re
 import fsa
 import logging
+import strategy
 from LTLParser.LTLFormula import LTLFormula, LTLFormulaType
 from createJTLVinput import createLTLfile
 import specCompiler
 
-class ExecutorResynthesisExtensions:
+class ExecutorResynthesisExtensions(object):
     """ Extensions to Executor to allow for specification rewriting and resynthesis.
         This class is not meant to be instantiated. """
 
+    def __init__(self):
+        super(ExecutorResynthesisExtensions, self).__init__()
+
+        # A (project, strategy, spec text) triple from background resynthesis, waiting to be swapped in
+        self.pending_resynthesis = None
+        self.resynthesis_thread = None
+        self.resynthesis_lock = threading.Lock()
+
 
     def getCurrentStateAsLTL(self, include_env=False):
         """ Return a boolean formula (as a string) capturing the current discrete state of the system (and, optionally, the environment as well) """
 
-        if self.aut:
+        if self.strategy:
             # If we have current state in the automaton, use it (since it can capture
             # state of internal propositions).
-            return fsa.stateToLTL(self.aut.current_state, include_env=include_env)
+            return self.strategy.current_state.getLTLRepresentation(include_inputs=include_env)
         else:
             # If we have no automaton yet, determine our state manually
             # TODO: support env
@@ -30,18 +39,15 @@ class ExecutorResynthesisExtensions:
         """ Creates a copy of a proj, and creates an accompanying spec file with an 
             auto-incremented counter in the name.  (Not overwriting is mostly for debugging.)"""
 
-        # reload from file instead of deepcopy because hsub stuff can include uncopyable thread locks, etc
-        new_proj = project.Project()
+        # Share the map instead of deepcopying (which would also choke on uncopyable
+        # thread locks, etc.); only the spec settings are copied, and handlers are left
+        # with the running project until the new one is swapped in
+        new_proj = proj.snapshot()
         new_proj.setSilent(True)
-        new_proj.loadProject(self.proj.getFilenamePrefix() + ".spec")
 
-        # copy hsub references manually
-        new_proj.hsub = proj.hsub
-        new_proj.hsub.proj = new_proj # oh my god, guys
-        new_proj.h_instance = proj.h_instance
-        
-        new_proj.sensor_handler = proj.sensor_handler
-        new_proj.actuator_handler = proj.actuator_handler
+        # The compiler expects the non-decomposed regions
+        if proj.compile_options['decompose'] and hasattr(proj, "rfiold"):
+            new_proj.rfi = proj.rfiold
 
         # Choose a name by incrementing the stepX suffix
         # Note: old files from previous executions will be overwritten
@@ -54,6 +60,14 @@ class ExecutorResynthesisExtensions:
         
         return new_proj
 
+    def _carryOverRuntimeData(self, old_proj, new_proj):
+        """ Give `new_proj` everything that was set up on `old_proj` at runtime
+            (coordinate maps, handler instances and their shared data). """
+
+        for attr in ("coordmap_map2lab", "coordmap_lab2map", "shared_data", "h_instance"):
+            if hasattr(old_proj, attr):
+                setattr(new_proj, attr, getattr(old_proj, attr))
+
     def _setSpecificationInitialConditionsToCurrent(self, proj):
         """ Remove any existing initial conditions from the guarantees portion of the LTL specification
             and replace them with the current state of the system.
@@ -78,10 +92,13 @@ class ExecutorResynthesisExtensions:
         # write the file back
         createLTLfile(ltl_filename, assumptions, gc)
 
-    def resynthesizeFromNewSpecification(self, spec_text):
-        self.pause()
+    def _synthesizeNewSpecification(self, spec_text, from_current_state=True):
+        """ Create a copy of the current project with specification `spec_text`, and
+            synthesize a strategy for it.  Returns the new project, or None if the
+            new specification is unsynthesizable.
 
-        self.postEvent("INFO", "Starting resynthesis...")
+            If `from_current_state` is True, the strategy only starts from the
+            current state of the system. """
 
         # Copy the current project
         new_proj = self._duplicateProject(self.proj)
@@ -96,9 +113,8 @@ class ExecutorResynthesisExtensions:
         c = specCompiler.SpecCompiler()
         c.proj = new_proj
 
-        # Make sure rfi is non-decomposed here
-        c.proj.loadRegionFile(decomposed=False)
-
+        # The duplicated project has the non-decomposed regions loaded already.
+        # If the map hasn't changed, the previous decomposition is reused.
         if c.proj.compile_options["decompose"]:
             c._decompose()
 
@@ -107,7 +123,8 @@ class ExecutorResynthesisExtensions:
         c._writeSMVFile()
 
         # Constrain the initial conditions to our current state
-        self._setSpecificationInitialConditionsToCurrent(new_proj)
+        if from_current_state:
+            self._setSpecificationInitialConditionsToCurrent(new_proj)
 
         # Synthesize a strategy
         (realizable, realizableFS, output) = c._synthesize()
@@ -115,13 +132,25 @@ class ExecutorResynthesisExtensions:
 
         if not (realizable or realizableFS):
             logging.error("Specification for resynthesis was unsynthesizable!")
-            self.pause()
-            return False
+            return None
 
         logging.info("New automaton has been created.")
 
+        return new_proj
+
+    def resynthesizeFromNewSpecification(self, spec_text):
+        self.pause()
+
+        self.postEvent("INFO", "Starting resynthesis...")
+
+        new_proj = self._synthesizeNewSpecification(spec_text)
+        if new_proj is None:
+            self.pause()
+            return False
+
         # Load in the new strategy
 
+        self._carryOverRuntimeData(self.proj, new_proj)
         self.proj = new_proj
 
         logging.info("Reinitializing execution...")
@@ -136,6 +165,129 @@ class ExecutorResynthesisExtensions:
         
         # TODO: reload from file less often
 
+    def resynthesizeInBackground(self, spec_text):
+        """ Like resynthesizeFromNewSpecification(), but without stopping the robot:
+            synthesis happens in a separate thread while the current strategy keeps
+            executing, and the new strategy is swapped in at the next transition
+            boundary.  Returns False if a resynthesis is already in progress.
+
+            Since the robot keeps moving, the new strategy is not constrained to
+            the state we are in now; if the state we are in at swap time is not
+            part of it, we fall back to resynthesizeFromNewSpecification(). """
+
+        with self.resynthesis_lock:
+            if self.resynthesis_thread is not None:
+                logging.warning("Resynthesis is already in progress")
+                return False
+
+            self.pending_resynthesis = None
+            self.resynthesis_thread = threading.Thread(target=self._backgroundResynthesis, args=(spec_text,),
+                                                       name="Resynthesis")
+            self.resynthesis_thread.daemon = True
+            self.resynthesis_thread.start()
+
+        self.postEvent("INFO", "Starting resynthesis in the background...")
+
+        return True
+
+    def _backgroundResynthesis(self, spec_text):
+        try:
+            new_proj = self._synthesizeNewSpecification(spec_text, from_current_state=False)
+            if new_proj is None:
+                self.postEvent("INFO", "Resynthesis failed; continuing with the current strategy.")
+                return
+
+            # Load everything the new strategy needs now, so the swap itself is quick
+            if new_proj.compile_options['decompose']:
+                new_proj.rfiold = new_proj.rfi
+                new_proj.rfi = new_proj.loadRegionFile(decomposed=True)
+
+            new_strategy = self.loadAutFile(new_proj.getStrategyFilename(), proj=new_proj)
+
+            with self.resynthesis_lock:
+                self.pending_resynthesis = (new_proj, new_strategy, spec_text)
+
+            self.postEvent("INFO", "New strategy is ready; switching to it at the next transition.")
+        except Exception:
+            logging.exception("Error during background resynthesis")
+        finally:
+            with self.resynthesis_lock:
+                self.resynthesis_thread = None
+
+    def _atTransitionBoundary(self):
+        """ Return True if we are not in the middle of moving to a new state """
+
+        return not self.last_next_states or self.next_state == self.strategy.current_state
+
+    def _findCorrespondingState(self, new_proj, new_strategy):
+        """ Find a state in `new_strategy` that matches our current region,
+            outputs, and sensor readings, or return None if there is none. """
+
+        # Regions are matched by name, since the new project has its own region objects
+        current_region = self.strategy.current_state.getPropValue('region')
+        region_index = -1
+        if current_region is not None:
+            region_index = new_proj.rfi.indexOfRegionWithName(current_region.name)
+        if region_index < 0:
+            region_index = self._getCurrentRegionFromPose(rfi=new_proj.rfi)
+        if region_index is None:
+            return None
+
+        prop_assignments = {"region": new_proj.rfi.regions[region_index]}
+
+        new_outputs = new_proj.enabled_actuators + new_proj.all_customs
+        prop_assignments.update((p, v) for p, v in self.current_outputs.iteritems() if p in new_outputs)
+
+        # We can only read the sensors that are set up already
+        prop_assignments.update(self.hsub.getSensorValue([p for p in new_proj.enabled_sensors
+                                                          if p in self.proj.enabled_sensors]))
+
+        return new_strategy.searchForOneState(prop_assignments)
+
+    def swapInPendingStrategy(self):
+        """ If background resynthesis has produced a new strategy and it is safe to do so,
+            start executing the new strategy from the state corresponding to our current one.
+            Called from the execution loop between iterations.  Returns True if a swap happened. """
+
+        if self.pending_resynthesis is None or not self._atTransitionBoundary():
+            return False
+
+        with self.resynthesis_lock:
+            new_proj, new_strategy, spec_text = self.pending_resynthesis
+            self.pending_resynthesis = None
+
+        # Match on where we are now, not where we were when resynthesis started
+        new_state = self._findCorrespondingState(new_proj, new_strategy)
+        if new_state is None:
+            logging.warning("Current state does not exist in the new strategy; resynthesizing from the current state instead.")
+            self.postEvent("INFO", "New strategy does not cover the current state; resynthesizing from here...")
+            if self.resynthesizeFromNewSpecification(spec_text):
+                return True
+
+            logging.error("Resynthesis from the current state failed; continuing with the current strategy.")
+            self.resume()
+            return False
+
+        self._carryOverRuntimeData(self.proj, new_proj)
+
+        old_proj = self.proj
+        self.proj = new_proj
+
+        # The motion controller needs to know about the new regions
+        if new_proj.rfi is not old_proj.rfi and self.hsub.reloadMotionControlHandler() is None:
+            logging.error("Could not set up motion control for the new regions; continuing with the current strategy.")
+            self.proj = old_proj
+            return False
+
+        self.strategy = new_strategy
+        self.strategy.current_state = new_state
+        self.last_next_states = []
+        self.next_state = None
+
+        self.postEvent("INFO", "Switched to new strategy, now in state {}.".format(new_state.state_id))
+
+        return True
+
 
 
 
@@ -7,13 +7,14 @@ import numpy
 import glob
 import StringIO
 import logging
+import collections
 
 from multiprocessing import Pool
 
 import project
 import regions
 import parseLP
-from createJTLVinput import createLTLfile, createSMVfile, createTopologyFragment, createInitialRegionFragment
+from createJTLVinput import createLTLfile, createSMVfile, createTopologyFragment, createInitialRegionFragment, getBitEncoding
 from parseEnglishToLTL import bitEncoding, replaceRegionName, createStayFormula
 import fsa
 from copy import deepcopy
@@ -21,12 +22,27 @@ from cores.coreUtils import *
 import handlerSubsystem
 
 from asyncProcesses import AsynchronousProcessThread
+import synthesisServer
+from synthesisServer import GROneServerRequestThread
+import globalConfig
 
 import strategy
 
 # Hack needed to ensure there's only one
 _SLURP_SPEC_GENERATOR = None
 
+# Decompositions and topology fragments of recently compiled maps, so that
+# recompiling with an unchanged map (e.g. for resynthesis) can skip them.
+# Decompositions are stored and handed out as copies; topology fragments are strings
+MAX_MAP_CACHE_SIZE = 4
+_mapCache = {}
+
+# Maximum number of lines of analysis output to keep
+MAX_ANALYSIS_LOG_LINES = 10000
+
+# Reuse one JVM for all JTLV runs instead of starting a new one each time
+USE_SYNTHESIS_SERVER = globalConfig.getConfigOption("synthesis", "jtlv_server", False)
+
 
 class SpecCompiler(object):
     def __init__(self, spec_filename=None):
@@ -89,41 +105,100 @@ class SpecCompiler(object):
             self.proj.rfi.transitions[idx0][idx1] = [(0,0)] # fake trans face
             self.proj.rfi.transitions[idx1][idx0] = [(0,0)]
 
+    def _getMapCacheKey(self):
+        """ Return a key identifying everything the decomposition and topology
+            depend on, or None if the region file is unknown. """
+
+        rfi = self.proj.rfi
+        if rfi is None or rfi.filename is None or not os.path.exists(rfi.filename):
+            return None
+
+        # Decomposition also generates regions for "near X", "between X and Y", etc.
+        spec = "\n".join([line for line in self.proj.specText.split("\n") if not line.startswith("#")])
+        regionNear, regionBetween = parseLP.findLocativePhrases(spec)
+
+        st = os.stat(rfi.filename)
+
+        return (os.path.abspath(rfi.filename), st.st_mtime, st.st_size,
+                self.proj.compile_options["decompose"], self.proj.compile_options["convexify"],
+                tuple(regionNear), tuple(regionBetween))
+
+    def _getMapCacheEntry(self):
+        key = self._getMapCacheKey()
+        if key is None:
+            return None
+
+        if key not in _mapCache:
+            if len(_mapCache) >= MAX_MAP_CACHE_SIZE:
+                _mapCache.clear()
+            _mapCache[key] = {"decomposition": None, "topology": {}}
+
+        return _mapCache[key]
+
     def _decompose(self):
-        self.parser = parseLP.parseLP()
-        self.parser.main(self.proj.getFilenamePrefix() + ".spec")
+        cache_entry = self._getMapCacheEntry()
+
+        if cache_entry is not None and cache_entry["decomposition"] is not None:
+            logging.info("Map is unchanged; reusing previous decomposition")
+            # Hand out a copy, since the compiler and its callers modify these
+            self.parser = parseLP.parseLP()
+            self.parser.proj = project.Project()
+            self.parser.proj.rfi, self.parser.proj.regionMapping = deepcopy(cache_entry["decomposition"])
+        else:
+            self.parser = parseLP.parseLP()
+            self.parser.main(self.proj.getFilenamePrefix() + ".spec")
+
+            # Remove all references to any obstacle regions at this point
+            for r in self.proj.rfi.regions:
+                if r.isObstacle:
+                    # Delete corresponding decomposed regions
+                    for sub_r in self.parser.proj.regionMapping[r.name]:
+                        del self.parser.proj.rfi.regions[self.parser.proj.rfi.indexOfRegionWithName(sub_r)]
 
-        # Remove all references to any obstacle regions at this point
-        for r in self.proj.rfi.regions:
-            if r.isObstacle:
-                # Delete corresponding decomposed regions
-                for sub_r in self.parser.proj.regionMapping[r.name]:
-                    del self.parser.proj.rfi.regions[self.parser.proj.rfi.indexOfRegionWithName(sub_r)]
+                        # Remove decomposed region from any overlapping mappings
+                        for k,v in self.parser.proj.regionMapping.iteritems():
+                            if k == r.name: continue
+                            if sub_r in v:
+                                v.remove(sub_r)
 
-                    # Remove decomposed region from any overlapping mappings
-                    for k,v in self.parser.proj.regionMapping.iteritems():
-                        if k == r.name: continue
-                        if sub_r in v:
-                            v.remove(sub_r)
+                    # Remove mapping for the obstacle region
+                    del self.parser.proj.regionMapping[r.name]
 
-                # Remove mapping for the obstacle region
-                del self.parser.proj.regionMapping[r.name]
+            #self.proj.rfi.regions = filter(lambda r: not (r.isObstacle or r.name == "boundary"), self.proj.rfi.regions)
 
-        #self.proj.rfi.regions = filter(lambda r: not (r.isObstacle or r.name == "boundary"), self.proj.rfi.regions)
+            # FIXME: properly support obstacles in non-decomposed maps?
+            if self.proj.compile_options["decompose"]:
+                self.parser.proj.rfi.recalcAdjacency()
+
+            if cache_entry is not None:
+                cache_entry["decomposition"] = deepcopy((self.parser.proj.rfi, self.parser.proj.regionMapping))
 
         # save the regions into new region file
         filename = self.proj.getFilenamePrefix() + '_decomposed.regions'
 
-        # FIXME: properly support obstacles in non-decomposed maps?
-        if self.proj.compile_options["decompose"]:
-            self.parser.proj.rfi.recalcAdjacency()
-
         self.parser.proj.rfi.writeFile(filename)
 
 
         self.proj.regionMapping = self.parser.proj.regionMapping
         self.proj.writeSpecFile()
 
+    def _getTopologyFragment(self, adjData, regions, bitEncode):
+        """ Return the topology part of the LTL, reusing it from an earlier
+            compilation of the same map if possible. """
+
+        options = (self.proj.compile_options["use_region_bit_encoding"], self.proj.compile_options["compact_topology"])
+
+        cache_entry = self._getMapCacheEntry()
+        if cache_entry is not None and options in cache_entry["topology"]:
+            return cache_entry["topology"][options]
+
+        topo = createTopologyFragment(adjData, regions, use_bits=options[0], bitEncode=bitEncode, compact=options[1])
+
+        if cache_entry is not None:
+            cache_entry["topology"][options] = topo
+
+        return topo
+
     def _writeSMVFile(self):
         if self.proj.compile_options["decompose"]:
             numRegions = len(self.parser.proj.rfi.regions)
@@ -299,14 +374,10 @@ class SpecCompiler(object):
         else:
             regionList = [x.name for x in self.proj.rfi.regions]
 
+        bitEncode = None
         if self.proj.compile_options["use_region_bit_encoding"]:
-            # Define the number of bits needed to encode the regions
-            numBits = int(math.ceil(math.log(len(regionList),2)))
-
             # creating the region bit encoding
-            bitEncode = bitEncoding(len(regionList),numBits)
-            currBitEnc = bitEncode['current']
-            nextBitEnc = bitEncode['next']
+            bitEncode = getBitEncoding(len(regionList))
 
             # switch to bit encodings for regions
             LTLspec_env = replaceRegionName(LTLspec_env, bitEncode, regionList)
@@ -327,9 +398,9 @@ class SpecCompiler(object):
         # Store some data needed for later analysis
         self.spec = {}
         if self.proj.compile_options["decompose"]:
-            self.spec['Topo'] = createTopologyFragment(adjData, self.parser.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"])
+            self.spec['Topo'] = self._getTopologyFragment(adjData, self.parser.proj.rfi.regions, bitEncode)
         else:
-            self.spec['Topo'] = createTopologyFragment(adjData, self.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"])
+            self.spec['Topo'] = self._getTopologyFragment(adjData, self.proj.rfi.regions, bitEncode)
 
         # Substitute any macros that the parsers passed us
         LTLspec_env = self.substituteMacros(LTLspec_env)
@@ -358,14 +429,13 @@ class SpecCompiler(object):
 
         # Add in a fragment to make sure that we start in a valid region
         if self.proj.compile_options["decompose"]:
-            self.spec['InitRegionSanityCheck'] = createInitialRegionFragment(self.parser.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"])
+            self.spec['InitRegionSanityCheck'] = createInitialRegionFragment(self.parser.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"], bitEncode=bitEncode)
         else:
-            self.spec['InitRegionSanityCheck'] = createInitialRegionFragment(self.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"])
-        LTLspec_sys += "\n&\n" + self.spec['InitRegionSanityCheck']
-
-        LTLspec_sys += "\n&\n" + self.spec['Topo']
+            self.spec['InitRegionSanityCheck'] = createInitialRegionFragment(self.proj.rfi.regions, use_bits=self.proj.compile_options["use_region_bit_encoding"], bitEncode=bitEncode)
 
-        createLTLfile(self.proj.getFilenamePrefix(), LTLspec_env, LTLspec_sys)
+        # The (possibly very long) topology is written out as a separate part, without
+        # being appended to the rest of the guarantees
+        createLTLfile(self.proj.getFilenamePrefix(), LTLspec_env, [LTLspec_sys, self.spec['InitRegionSanityCheck'], self.spec['Topo']])
 
         if self.proj.compile_options["parser"] == "slurp":
             self.reversemapping = {self.postprocessLTL(line,sensorList,robotPropList).strip():line.strip() for line in oldspec_env + oldspec_sys}
@@ -428,16 +498,9 @@ class SpecCompiler(object):
         else:
             regionList = [x.name for x in self.proj.rfi.regions]
 
-        # Define the number of bits needed to encode the regions
-        numBits = int(math.ceil(math.log(len(regionList),2)))
-
-        # creating the region bit encoding
-        bitEncode = bitEncoding(len(regionList),numBits)
-        currBitEnc = bitEncode['current']
-        nextBitEnc = bitEncode['next']
-
         # switch to bit encodings for regions
         if self.proj.compile_options["use_region_bit_encoding"]:
+            bitEncode = getBitEncoding(len(regionList))
             text = replaceRegionName(text, bitEncode, regionList)
 
         text = self.substituteMacros(text)
@@ -521,6 +584,23 @@ class SpecCompiler(object):
 
         return cmd
 
+    def _getGROneServer(self):
+        """ Return the shared JTLV synthesis server, or None if it is disabled
+            in global.cfg or not compiled. """
+
+        if not USE_SYNTHESIS_SERVER:
+            return None
+
+        jtlv_path = os.path.join(self.proj.ltlmop_root, "etc", "jtlv")
+        if not os.path.exists(os.path.join(jtlv_path, "GROne", "GROneServer.class")):
+            logging.warning("Synthesis server is enabled but not compiled; please re-run dist/setup.py.")
+            return None
+
+        # Same JVM options as for a single run, but with the server as the main class
+        cmd = self._getGROneCommand("GROneServer")[:-2]
+
+        return synthesisServer.getServer(cmd)
+
     def _autIsNonTrivial(self):
         """
         Check for a) empty automaton, or b) trivial initial-state automaton
@@ -528,23 +608,10 @@ class SpecCompiler(object):
         (This can indicate unsatisfiable system initial conditions (case a),
          or an unsat environment (case b).)
 
-        TODO: Do this in the Java code; it's super inefficient to
-        load the whole aut just to check this.
+        Only reads as much of the strategy as needed to find one transition.
         """
 
-        if self.proj.compile_options["decompose"]:
-            regions = self.parser.proj.rfi.regions
-        else:
-            regions = self.proj.rfi.regions
-
-        region_domain = strategy.Domain("region", regions, strategy.Domain.B0_IS_MSB)
-        strat = strategy.createStrategyFromFile(self.proj.getStrategyFilename(),
-                                                self.proj.enabled_sensors,
-                                                self.proj.enabled_actuators + self.proj.all_customs + [region_domain])
-
-        nonTrivial = any([len(strat.findTransitionableStates({}, s)) > 0 for s in strat.iterateOverStates()])
-
-        return nonTrivial
+        return strategy.strategyFileHasTransitions(self.proj.getStrategyFilename())
 
     def _analyze(self):
         if self.proj.compile_options["synthesizer"].lower() != "jtlv":
@@ -554,21 +621,32 @@ class SpecCompiler(object):
         if cmd is None:
             return (False, False, [], "")
 
-        subp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)
+        server = self._getGROneServer()
+        if server is not None:
+            dlines = server.request("GROneDebug", cmd[-2:])
+        else:
+            subp = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=False)
+            dlines = subp.stdout
 
         realizable = False
         unsat = False
         nonTrivial = False
 
 
-        output = ""
+        # Only keep the most recent part of the log, in case it is huge
+        output = collections.deque(maxlen=MAX_ANALYSIS_LOG_LINES)
+        num_lines = 0
         to_highlight = []
-        for dline in subp.stdout:
-            output += dline
+        for dline in dlines:
+            output.append(dline)
+            num_lines += 1
             if "Specification is synthesizable!" in dline:   
                 realizable = True            
                 nonTrivial = self._autIsNonTrivial()
                 if nonTrivial:
+                    # Nothing else we need to know, so don't wait for the rest
+                    if server is None:
+                        subp.kill()
                     break
 
             ### Highlight sentences corresponding to identified errors ###
@@ -629,8 +707,13 @@ class SpecCompiler(object):
             if "unsatisfiable" in dline or "inconsistent" in dline :
                 unsat = True
 
-        subp.stdout.close()
+        dlines.close()
+        if server is None:
+            subp.wait()
 
+        output = "".join(output)
+        if num_lines > MAX_ANALYSIS_LOG_LINES:
+            output = "({} earlier lines omitted)\n".format(num_lines - MAX_ANALYSIS_LOG_LINES) + output
 
 
         return (realizable, unsat, nonTrivial, to_highlight, output)
@@ -643,7 +726,7 @@ class SpecCompiler(object):
         #from JTLV.
 
         #find number of states in automaton/counter for unsat/unreal core max unrolling depth ("recurrence diameter")
-        proj_copy = deepcopy(self.proj)
+        proj_copy = self.proj.snapshot()
         proj_copy.rfi = self.parser.proj.rfi
         proj_copy.sensor_handler = None
         proj_copy.actuator_handler = None
@@ -933,7 +1016,15 @@ class SpecCompiler(object):
         # Kick off the subprocess
         logging.info("Synthesizing a strategy...")
 
-        self.synthesis_subprocess = AsynchronousProcessThread(cmd, onSubprocessComplete, onLog)
+        server = None
+        if self.proj.compile_options["synthesizer"].lower() == "jtlv":
+            server = self._getGROneServer()
+
+        if server is not None:
+            self.synthesis_subprocess = GROneServerRequestThread(server, "GROneMain", cmd[cmd.index("GROneMain")+1:],
+                                                                 onSubprocessComplete, onLog)
+        else:
+            self.synthesis_subprocess = AsynchronousProcessThread(cmd, onSubprocessComplete, onLog)
 
     def abortSynthesis(self):
         """ Kill any running synthesis process. """
@@ -945,13 +1036,22 @@ class SpecCompiler(object):
             self.synthesis_subprocess = None
 
     def compile(self):
+        # Wall-clock time taken by each stage, in seconds
+        self.stage_times = {}
+
         if self.proj.compile_options["decompose"]:
             logging.info("Decomposing...")
+            tic = globalConfig.best_timer()
             self._decompose()
+            self.stage_times["decompose"] = globalConfig.best_timer() - tic
         logging.info("Writing LTL file...")
+        tic = globalConfig.best_timer()
         spec, tb, resp = self._writeLTLFile()
+        self.stage_times["ltl"] = globalConfig.best_timer() - tic
         logging.info("Writing SMV file...")
+        tic = globalConfig.best_timer()
         self._writeSMVFile()
+        self.stage_times["smv"] = globalConfig.best_timer() - tic
 
         if tb is None:
             logging.error("Compilation aborted")
@@ -959,5 +1059,9 @@ class SpecCompiler(object):
 
         #self._checkForEmptyGaits()
 
-        return self._synthesize()
+        tic = globalConfig.best_timer()
+        result = self._synthesize()
+        self.stage_times["synthesis"] = globalConfig.best_timer() - tic
+
+        return result
 
@@ -45,6 +45,21 @@ def createStrategyFromFile(filename, input_propositions, output_propositions):
 
     return new_strategy
 
+def strategyFileHasTransitions(filename):
+    """ Return True if the strategy in `filename` has at least one transition.
+
+        This is much faster than loading the strategy and checking each state,
+        since it stops as soon as a transition is found. """
+
+    if filename.endswith(".aut"):
+        import fsa
+        return fsa.fileHasTransitions(filename)
+    elif filename.endswith(".bdd"):
+        import bdd
+        return bdd.fileHasTransitions(filename)
+    else:
+        raise ValueError("Unsupported strategy file type.  Filename must end with either '.aut' or '.bdd'.")
+
 class Domain(object):
     """ A Domain is a bit-vector abstraction, allowing a proposition to effectively
     have values other than just True and False.
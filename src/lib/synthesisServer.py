@@ -0,0 +1,166 @@
+"""
+    ==========================================================
+    synthesisServer.py - Long-lived JTLV synthesis subprocess
+    ==========================================================
+
+    Keeps a single JVM running GROneServer, so that repeated compiles do not
+    each pay for JVM startup and class loading.  Requests are the same
+    arguments that would be passed to GROneMain/GROneDebug on the command
+    line, and the output lines are exactly what those would have printed,
+    so callers can parse them in the same way.
+"""
+
+import os
+import atexit
+import logging
+import threading
+import subprocess
+
+DONE_MESSAGE = "==== GROneServer: request complete ===="
+CANCEL_MESSAGE = "==== GROneServer: cancel request ===="
+
+class GROneServer(object):
+    def __init__(self, cmd):
+        """ `cmd` is the command line that starts the GROneServer JVM """
+
+        self.cmd = cmd
+        self.process = None
+        self.lock = threading.Lock()
+
+    def _ensureRunning(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+
+        logging.info("Starting synthesis server...")
+        self.process = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, close_fds=False, bufsize=-1)
+
+    def request(self, module, args):
+        """ Run `module` (e.g. "GROneMain") with command-line `args`, and
+            yield each line of output as it is produced.
+
+            Only one request runs at a time; if the generator is closed
+            early, the request is cancelled. """
+
+        with self.lock:
+            self._ensureRunning()
+
+            # The server may have been started from a different directory
+            args = [os.path.abspath(a) if os.path.exists(a) else a for a in args]
+            self.process.stdin.write("\t".join([module] + args) + "\n")
+            self.process.stdin.flush()
+
+            finished = False
+            try:
+                for line in iter(self.process.stdout.readline, ''):
+                    if line.rstrip("\r\n") == DONE_MESSAGE:
+                        finished = True
+                        break
+                    yield line
+            finally:
+                if not finished:
+                    self._cancel()
+
+    def _cancel(self):
+        """ Stop the running request and wait for the server to acknowledge it """
+
+        if self.process is None or self.process.poll() is not None:
+            return
+
+        try:
+            self.process.stdin.write(CANCEL_MESSAGE + "\n")
+            self.process.stdin.flush()
+        except IOError:
+            return
+
+        # Only output written before the cancellation arrived is left to skip
+        for line in iter(self.process.stdout.readline, ''):
+            if line.rstrip("\r\n") == DONE_MESSAGE:
+                return
+
+    def kill(self):
+        """ Abort any running request.  The server will be restarted the next
+            time it is needed. """
+
+        if self.process is not None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+
+    def shutdown(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process = None
+
+class GROneServerRequestThread(threading.Thread):
+    def __init__(self, server, module, args, callback, logFunction):
+        """
+        Run a request on `server` asynchronously, in the same way as
+        asyncProcesses.AsynchronousProcess runs a command.
+        """
+
+        self.server = server
+        self.module = module
+        self.args = args
+        self.callback = callback
+        self.logFunction = logFunction
+
+        self.running = False
+
+        threading.Thread.__init__(self)
+
+        self.startComplete = threading.Event()
+
+        # Auto-start
+        self.daemon = True
+        self.start()
+
+    def kill(self):
+        logging.info("Killing synthesis server request `%s`..." % ' '.join([self.module] + self.args))
+
+        self.running = False
+
+        # This will cause the blocking readline() in the server to return with an EOF
+        self.server.kill()
+
+    def run(self):
+        self.running = True
+        self.startComplete.set()
+
+        lines = self.server.request(self.module, self.args)
+        try:
+            for line in lines:
+                if not self.running:
+                    return
+
+                if self.logFunction is not None:
+                    self.logFunction(line)
+                else:
+                    print line,
+        finally:
+            lines.close()
+
+        # Call any callback function if terminated succesfully
+        if self.callback is not None and self.running:
+            self.callback()
+
+_servers = {}
+_serversLock = threading.Lock()
+
+def getServer(cmd):
+    """ Return the shared server started by `cmd`, creating it if necessary """
+
+    with _serversLock:
+        key = tuple(cmd)
+        if key not in _servers:
+            _servers[key] = GROneServer(cmd)
+        return _servers[key]
+
+@atexit.register
+def shutdownServers():
+    with _serversLock:
+        for server in _servers.values():
+            server.shutdown()
+        _servers.clear()
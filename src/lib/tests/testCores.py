@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Checks the CNF helpers used by the core finder, and the incremental PicoSAT
+session against picomus (when a PicoSAT build with its shared library is present).
+"""
+
+import unittest
+import glob
+import numpy
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cores import coreUtils
+from cores.picosatBinding import loadLibrary
+
+def _picomusCommand():
+    """ Same lookup as SpecCompiler._getPicosatCommand, without the logging """
+
+    paths = [p for p in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cores", "picosat-*"))
+             if os.path.isdir(p)]
+    if not paths or not os.path.exists(os.path.join(paths[0], "picomus")):
+        return None
+    return [os.path.join(paths[0], "picomus")]
+
+PICOMUS = _picomusCommand()
+PICOSAT_LIB = loadLibrary(PICOMUS)
+
+class TestClauseHelpers(unittest.TestCase):
+    def testShiftClauses(self):
+        clauses = numpy.array([1, -2, 0, -3, 0])
+        self.assertEqual(coreUtils.shiftClauses(clauses, 5).tolist(), [6, -7, 0, -8, 0])
+
+    def testDimacs(self):
+        clauses = numpy.array([1, -2, 0, -3, 0])
+        self.assertEqual(coreUtils.numClauses(clauses), 2)
+        self.assertEqual(coreUtils.clausesToDimacs(clauses), "1 -2 0\n-3 0\n")
+
+    def testConjunctsToCNF(self):
+        conjuncts = ["s.a", "[](s.a -> next(s.b))", "[]<>(!s.b)"]
+        mapping, cnfMapping, init, trans, goals, numVars = coreUtils.conjunctsToCNF(conjuncts, ["a", "b"])
+
+        # Init holds the initial condition and one step of the transition relation
+        self.assertEqual(coreUtils.numClauses(init), len(mapping["s.a"]) + len(mapping["[](s.a -> next(s.b))"]))
+        self.assertEqual(coreUtils.numClauses(trans), len(mapping["[](s.a -> next(s.b))"]))
+        self.assertGreater(coreUtils.numClauses(goals), 0)
+        # Next-step propositions are numbered one time step on
+        self.assertTrue(numpy.any(numpy.abs(trans) > numVars))
+
+@unittest.skipIf(PICOMUS is None or PICOSAT_LIB is None, "needs picomus and a shared PicoSAT library")
+class TestIncrementalCores(unittest.TestCase):
+    def testMatchesPicomus(self):
+        # Once s.a holds it always does, and so does s.b, so the goal is never reached
+        conjuncts = ["[](s.a -> next(s.a))", "[](s.a -> s.b)", "[]<>(!s.b)", "[](s.d | !s.d)"]
+        badInit = "s.a"
+        args = coreUtils.conjunctsToCNF([badInit] + conjuncts, ["a", "b", "c", "d"])
+        mapping, cnfMapping, init, trans, goals, numProps = args
+        depths = range(1, 4)
+
+        incremental = coreUtils.findGuiltyLTLConjunctsIncremental(PICOSAT_LIB, depths, numProps, init, trans, goals,
+                                                                  mapping, cnfMapping, conjuncts, 0)
+        separate = [coreUtils.findGuiltyLTLConjuncts(PICOMUS, d, numProps, init, trans, goals,
+                                                     mapping, cnfMapping, conjuncts, 0) for d in depths]
+
+        self.assertEqual(len(incremental), len(separate))
+        for a, b in zip(incremental, separate):
+            self.assertEqual(set(a), set(b))
+        self.assertTrue(incremental[-1])
+        self.assertNotIn("[](s.d | !s.d)", incremental[-1])
+
+if __name__ == "__main__":
+    unittest.main()
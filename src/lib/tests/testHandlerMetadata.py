@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Checks that reading handler metadata without importing gives the same answers as importing.
+"""
+
+import unittest
+import inspect
+import tempfile
+import shutil
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# Handlers import the templates as lib.handlers.handlerTemplates, so we need to match that
+from lib import hsubConfigObjects
+from lib.hsubConfigObjects import HandlerConfig
+
+class TestHandlerMetadata(unittest.TestCase):
+    def setUp(self):
+        # Keep the cache out of the user's home directory
+        self.tempdir = tempfile.mkdtemp()
+        self.old_cache_home = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = self.tempdir
+        hsubConfigObjects._handlerMetadataCache = None
+        hsubConfigObjects._handlerMetadataCacheDirty = False
+
+    def tearDown(self):
+        if self.old_cache_home is None:
+            del os.environ["XDG_CACHE_HOME"]
+        else:
+            os.environ["XDG_CACHE_HOME"] = self.old_cache_home
+        hsubConfigObjects._handlerMetadataCache = None
+        hsubConfigObjects._handlerMetadataCacheDirty = False
+        shutil.rmtree(self.tempdir)
+
+    def writeModule(self, name, text):
+        with open(os.path.join(self.tempdir, name + ".py"), "w") as f:
+            f.write(text)
+        return os.path.join(self.tempdir, name + ".py")
+
+    def testMatchesImport(self):
+        for module in ["lib.handlers.share.Pose.NullPoseHandler", "lib.handlers.share.Sensor.DummySensorHandler"]:
+            name, h_type, handler_class = HandlerConfig.loadHandlerClass(module)
+            methods = [(method_name, inspect.getdoc(method), inspect.getargspec(method)[0])
+                       for method_name, method in inspect.getmembers(handler_class, inspect.ismethod)]
+
+            self.assertIsNotNone(hsubConfigObjects._parseHandlerMetadata(inspect.getsourcefile(handler_class)))
+            self.assertEqual(HandlerConfig.loadHandlerMetadata(module), (name, h_type, methods))
+
+    def testInheritedTemplateMethods(self):
+        name, h_type, methods = HandlerConfig.loadHandlerMetadata("lib.handlers.share.Pose.NullPoseHandler")
+        self.assertIn("getPose", [m[0] for m in methods])
+
+    def testCacheLocation(self):
+        HandlerConfig.loadHandlerMetadata("lib.handlers.share.Pose.NullPoseHandler")
+        HandlerConfig.loadHandlerMetadata("lib.handlers.share.Sensor.DummySensorHandler")
+        cache_path = os.path.join(self.tempdir, "ltlmop", hsubConfigObjects.HANDLER_METADATA_CACHE_FILE)
+        # Nothing is written until we ask for it
+        self.assertFalse(os.path.exists(cache_path))
+
+        HandlerConfig.saveHandlerMetadataCache()
+        self.assertTrue(os.path.exists(cache_path))
+        hsubConfigObjects._handlerMetadataCache = None
+        self.assertEqual(len(hsubConfigObjects._getHandlerMetadataCache()), 2)
+
+    def testMissingImports(self):
+        self.writeModule("__helper", "import os\nimport no_such_module_for_ltlmop\n")
+        handler = self.writeModule("FakeHandler", "import sys\nimport __helper\n"
+                                                  "try:\n    import optional_module_for_ltlmop\nexcept ImportError:\n    pass\n")
+        imports = hsubConfigObjects._parseImports(handler)
+
+        self.assertEqual(imports, ["sys", "__helper"])
+        self.assertEqual(hsubConfigObjects._findMissingImport(handler, imports), "no_such_module_for_ltlmop")
+        self.assertIsNone(hsubConfigObjects._findMissingImport(handler, ["sys", "numpy", "lib"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Checks handler lookup in the handler subsystem.
+"""
+
+import unittest
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import handlerSubsystem
+import handlers.handlerTemplates as ht
+
+class TestGetHandlerInstanceByType(unittest.TestCase):
+    def setUp(self):
+        self.hsub = handlerSubsystem.HandlerSubsystem(None, os.path.dirname(os.path.abspath(__file__)))
+        self.drive = object()
+        self.hsub.main_handlers = {ht.DriveHandler: self.drive, ht.SensorHandler: object()}
+
+    def testCachedMainRobotHandler(self):
+        self.assertIs(self.hsub.getHandlerInstanceByType(ht.DriveHandler), self.drive)
+
+    def testSensorNeedsRobotName(self):
+        for handler_type_class in [ht.SensorHandler, ht.ActuatorHandler]:
+            self.assertRaises(ValueError, self.hsub.getHandlerInstanceByType, handler_type_class)
+
+if __name__ == "__main__":
+    unittest.main()
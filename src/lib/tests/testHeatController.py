@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Checks the batch heat controller field evaluator against the original point-by-point controller.
+"""
+
+import unittest
+import numpy
+import warnings
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "handlers", "share", "MotionControl"))
+
+import __heatControllerHelper as heatControllerHelper
+
+# Clockwise hexagon and an irregular pentagon
+POLYGONS = [[[0., 1., 3., 4., 3., 1.],
+             [0., 2., 2., 0., -2., -2.]],
+            [[0., 0.5, 4., 5., 2.],
+             [0., 3., 3.5, 1., -1.5]]]
+
+def _gridPoints(Vertex, side):
+    """ A grid covering the polygon and a little of its surroundings """
+
+    xmin, ymin = numpy.asarray(Vertex).min(axis=1) - 0.3
+    xmax, ymax = numpy.asarray(Vertex).max(axis=1) + 0.3
+    gx, gy = numpy.meshgrid(numpy.linspace(xmin, xmax, side), numpy.linspace(ymin, ymax, side))
+    return numpy.column_stack((gx.ravel(), gy.ravel()))
+
+class TestFieldEvaluator(unittest.TestCase):
+    def assertMatchesController(self, Vertex, exitface, last):
+        data = heatControllerHelper.getControllerData(numpy.mat(Vertex), exitface, last)
+        controller = heatControllerHelper.makeController(data)
+        evaluator = heatControllerHelper.FieldEvaluator(data)
+
+        points = _gridPoints(Vertex, 15)
+        # Include the vertices and the map center, where the special cases are
+        points = numpy.vstack((points, numpy.asarray(Vertex).T, numpy.asarray(data[5]).T))
+
+        [X, F, inside] = evaluator.evaluate(points)
+        for k, p in enumerate(points):
+            [Xk, DqXk, Fk, insidek, Jk] = controller(numpy.mat(p).T)
+            msg = "point {} of {} (exit face {}, last {})".format(p, Vertex, exitface, last)
+            self.assertTrue(numpy.allclose(X[k], numpy.asarray(Xk).ravel(), atol=1e-9), msg=msg)
+            self.assertAlmostEqual(F[k], Fk, places=9, msg=msg)
+            self.assertEqual(bool(inside[k]), bool(insidek), msg=msg)
+
+        # One point at a time gives the same as a batch
+        self.assertTrue(numpy.allclose(evaluator.evaluate(points[0])[0], X[0:1]))
+
+    def testExitFace(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for Vertex in POLYGONS:
+                self.assertMatchesController(Vertex, 2, False)
+
+    def testLastRegion(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for Vertex in POLYGONS:
+                self.assertMatchesController(Vertex, 2, True)
+
+if __name__ == "__main__":
+    unittest.main()
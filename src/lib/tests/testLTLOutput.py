@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Checks flattening of long formulas and part-by-part writing of .ltl files.
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from LTLParser import LTLFormula
+import createJTLVinput
+
+def _flattenReference(tree):
+    """ flatten_as_much_as_possible as it was before it was made iterative """
+
+    if len(tree) == 1 or isinstance(tree, basestring):
+        return tree
+
+    tree = [_flattenReference(t) for t in tree]
+    if tree[0] in LTLFormula.FLATTENABLE_TYPES:
+        parts = [tree[0]]
+        for a in tree[1:]:
+            if a[0] == tree[0]:
+                parts.extend(a[1:])
+            else:
+                parts.append(a)
+        return parts
+
+    return tree
+
+class TestFlatten(unittest.TestCase):
+    def testMatchesReference(self):
+        for formula in ['a & (b & c) & (d | (e | f) | g) & !(h & (i & j))',
+                        '[](a & b) & ((c ^ d) ^ e)',
+                        '(a | b) & (c & d) -> (e & (f & g))',
+                        'x']:
+            tree = LTLFormula.clean_tree(LTLFormula.fastParse(LTLFormula.tokenize(formula)))
+            self.assertEqual(LTLFormula.flatten_as_much_as_possible(tree), _flattenReference(tree))
+
+    def testLongConjunction(self):
+        n = 20000
+        tree = LTLFormula.parseLTL(" & ".join("s.a{}".format(i) for i in range(n)))
+        self.assertEqual(tree[0], "Conjunction")
+        self.assertEqual(len(tree), n+1)
+
+class TestLTLFile(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def readLTLFile(self, name, spec_env, spec_sys):
+        filename = os.path.join(self.tempdir, name)
+        createJTLVinput.createLTLfile(filename, spec_env, spec_sys)
+        with open(filename + ".ltl") as f:
+            return f.read()
+
+    def testPartsMatchConcatenation(self):
+        spec_env = "e.a & [](e.a -> next(e.b)) & []<>(e.b)"
+        parts = ["!s.x & [](next(s.x) <-> e.a) & []<>(s.x)", "(!s.bit0 | s.bit0)", "[](s.bit0 -> next(s.bit0))"]
+
+        self.assertEqual(self.readLTLFile("parts", spec_env, parts),
+                         self.readLTLFile("string", spec_env, "\n&\n".join(parts)))
+
+    def testFillerOnlyParsesWhatItNeeds(self):
+        # The unparseable second part is never looked at, since the first has every type
+        self.assertEqual(createJTLVinput.createNecessaryFillerSpec(["s.x & [](s.x) & []<>(s.x)", "(( not LTL"]), "")
+        self.assertEqual(createJTLVinput.createNecessaryFillerSpec(["[](s.x)", "", "s.y"]), "[]<>(TRUE)")
+        self.assertEqual(createJTLVinput.createNecessaryFillerSpec(""), "TRUE & [](TRUE) & []<>(TRUE)")
+
+if __name__ == "__main__":
+    unittest.main()
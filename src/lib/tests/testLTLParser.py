@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Checks the fast path of the LTL parser against the full parser.
+"""
+
+import unittest
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from LTLParser import LTLFormula
+
+class TestFastParse(unittest.TestCase):
+    formulas = ['TRUE',
+                '[]<>(s.a & !e.b)',
+                '(s.x -> next(s.y)) & []((e.a | e.b) <-> s.c)',
+                '!(a & b) | c',
+                '[](next(s.bit0) & !next(s.bit1) -> (e.sbit0 | FALSE))',
+                '((((a))))']
+
+    def testMatchesFullParser(self):
+        for formula in self.formulas:
+            tokens = LTLFormula.tokenize(formula)
+            self.assertEqual(LTLFormula.fastParse(tokens), LTLFormula.p.parse(tokens))
+
+    def testRejectsBadInput(self):
+        for formula in ['(a', 'a & ', '-> b']:
+            self.assertIsNone(LTLFormula.fastParse(LTLFormula.tokenize(formula)))
+
+    def testCachedParse(self):
+        formula = '[](s.a -> next(s.b))'
+        self.assertEqual(LTLFormula.parseLTL(formula), LTLFormula.parseLTL(formula))
+        self.assertIn(formula, LTLFormula._parse_cache)
+
+if __name__ == "__main__":
+    unittest.main()
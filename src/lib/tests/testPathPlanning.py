@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Checks the roadmaps and path cache shared by the motion controllers.
+"""
+
+import unittest
+import numpy
+import math
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "handlers", "share", "MotionControl"))
+
+import Polygon
+from __roadmap import Roadmap, getSweptCircle
+from __pathCache import PathCache, repairPath
+
+RADIUS = 0.2
+
+# A U-shaped region: the two arms can only be connected around the bottom
+U_SHAPE = Polygon.Polygon([(0, 0), (0, 10), (3, 10), (3, 3), (7, 3), (7, 10), (10, 10), (10, 0)])
+
+class TestRoadmap(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.roadmap = Roadmap(U_SHAPE, RADIUS, num_samples=150, seed=1)
+
+    def assertValidPath(self, path, start, goal):
+        self.assertEqual(path.shape[0], 2)
+        self.assertTrue(numpy.allclose(path[:,0], start))
+        self.assertTrue(numpy.allclose(path[:,-1], goal))
+        for k in range(path.shape[1] - 1):
+            self.assertTrue(U_SHAPE.covers(getSweptCircle(path[:,k].tolist(), path[:,k+1].tolist(), RADIUS)))
+
+    def testSeedIsRepeatable(self):
+        self.assertTrue(numpy.array_equal(Roadmap(U_SHAPE, RADIUS, num_samples=150, seed=1).nodes, self.roadmap.nodes))
+
+    def testPathAroundObstacle(self):
+        path, goal = self.roadmap.findPath((1.5, 9), [(8.5, 9)], U_SHAPE)
+        self.assertEqual(goal, 0)
+        self.assertValidPath(path, (1.5, 9), (8.5, 9))
+        # It has to go down below the gap between the arms
+        self.assertTrue(path[1].min() < 3)
+
+    def testDirectPath(self):
+        path, goal = self.roadmap.findPath((1, 1), [(9, 1)], U_SHAPE)
+        self.assertEqual(path.shape, (2, 2))
+
+    def testClosestGoal(self):
+        path, goal = self.roadmap.findPath((1.5, 9), [(8.5, 9), (1.5, 5)], U_SHAPE)
+        self.assertEqual(goal, 1)
+        self.assertValidPath(path, (1.5, 9), (1.5, 5))
+
+    def testUnreachableGoal(self):
+        self.assertEqual(self.roadmap.findPath((1.5, 9), [(5, 8)], U_SHAPE), (None, None))
+
+class TestRepairPath(unittest.TestCase):
+    def setUp(self):
+        self.path = numpy.array([[0., 1., 2., 3.], [0., 0., 0., 0.]])
+
+    def testSkipsReachableWaypoints(self):
+        # Everything can be reached from anywhere, but the last waypoint is kept
+        repaired = repairPath((0.5, 1.0, 0.3), self.path, lambda a, b: True)
+        self.assertTrue(numpy.array_equal(repaired, [[0.5, 2., 3.], [1., 0., 0.]]))
+
+    def testStopsAtBlockedWaypoint(self):
+        # Waypoints past x=1.5 are behind a wall
+        repaired = repairPath((0.5, 1.0), self.path, lambda a, b: b[0] < 1.5)
+        self.assertTrue(numpy.array_equal(repaired, [[0.5, 1., 2., 3.], [1., 0., 0., 0.]]))
+
+    def testNeedsReplanning(self):
+        self.assertIsNone(repairPath((0.5, 1.0), self.path, lambda a, b: False))
+
+class TestPathCache(unittest.TestCase):
+    def testResolution(self):
+        cache = PathCache(1.0, math.pi/4)
+        path = numpy.array([[0., 1.], [0., 1.]])
+        cache.put(1, 2, (0.2, 0.3, 0.1), path)
+
+        self.assertTrue(numpy.array_equal(cache.get(1, 2, (0.8, 0.9, -0.1)), path))
+        # The orientation wraps around
+        self.assertIsNotNone(cache.get(1, 2, (0.5, 0.5, 2*math.pi - 0.1)))
+        self.assertIsNone(cache.get(1, 2, (1.2, 0.5, 0.1)))
+        self.assertIsNone(cache.get(1, 2, (0.5, 0.5, math.pi/2)))
+        self.assertIsNone(cache.get(2, 1, (0.5, 0.5, 0.1)))
+
+    def testIgnoresOrientation(self):
+        cache = PathCache(1.0)
+        cache.put(1, 2, (0.5, 0.5), [[0., 1.], [0., 1.]])
+        self.assertIsNotNone(cache.get(1, 2, (0.5, 0.5, math.pi)))
+
+    def testDiscard(self):
+        cache = PathCache(1.0)
+        cache.put(1, 2, (0.5, 0.5), [[0., 1.], [0., 1.]])
+        cache.discard(1, 2, (0.1, 0.1))
+        self.assertIsNone(cache.get(1, 2, (0.5, 0.5)))
+        cache.discard(1, 2, (0.1, 0.1))
+
+    def testOldestPathsAreDropped(self):
+        cache = PathCache(1.0, max_paths=3)
+        for i in range(5):
+            cache.put(1, 2, (i, 0), [[i, 0.], [0., 0.]])
+        # Storing a path again makes it the newest
+        cache.put(1, 2, (2, 0), [[2, 0.], [0., 0.]])
+        cache.put(1, 2, (5, 0), [[5, 0.], [0., 0.]])
+
+        self.assertEqual(len(cache), 3)
+        self.assertEqual([i for i in range(6) if cache.get(1, 2, (i, 0)) is not None], [2, 4, 5])
+
+    def testUpdateKeepsBound(self):
+        saved = PathCache(1.0)
+        for i in range(5):
+            saved.put(1, 2, (i, 0), [[i, 0.], [0., 0.]])
+
+        cache = PathCache(1.0, max_paths=3)
+        cache.put(1, 2, (9, 0), [[9, 0.], [0., 0.]])
+        cache.update(saved.paths)
+
+        # The saved paths count as older, and the oldest of them are dropped
+        self.assertEqual(len(cache), 3)
+        self.assertEqual([i for i in range(10) if cache.get(1, 2, (i, 0)) is not None], [3, 4, 9])
+
+if __name__ == "__main__":
+    unittest.main()
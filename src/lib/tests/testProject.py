@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Checks what a project snapshot shares with the original project.
+"""
+
+import unittest
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import project
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.proj = project.Project()
+        self.proj.rfi = object()
+        self.proj.regionMapping = {"r1": ["p1", "p2"]}
+        self.proj.enabled_sensors = ["person"]
+        self.proj.shared_data["connection"] = object()
+        self.proj.h_instance["motionControl"] = object()
+        self.proj.hsub = object()
+
+    def testSettingsAreCopied(self):
+        new_proj = self.proj.snapshot()
+        new_proj.regionMapping["r1"].append("p3")
+        new_proj.enabled_sensors.append("fire")
+        new_proj.compile_options["decompose"] = False
+
+        self.assertEqual(self.proj.regionMapping, {"r1": ["p1", "p2"]})
+        self.assertEqual(self.proj.enabled_sensors, ["person"])
+        self.assertTrue(self.proj.compile_options["decompose"])
+
+    def testMapIsShared(self):
+        self.assertIs(self.proj.snapshot().rfi, self.proj.rfi)
+
+    def testHandlersAreNotShared(self):
+        new_proj = self.proj.snapshot()
+
+        self.assertFalse(hasattr(new_proj, "hsub"))
+        self.assertEqual(new_proj.shared_data, {})
+        self.assertIsNone(new_proj.h_instance["motionControl"])
+        self.assertIsNot(new_proj.h_instance, self.proj.h_instance)
+
+if __name__ == "__main__":
+    unittest.main()
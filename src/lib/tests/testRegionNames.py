@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Checks the single-pass region name replacement against the original one.
+"""
+
+import unittest
+import re
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parseEnglishToLTL
+
+def _replaceRegionNameReference(formula,bitEncode,regionList):
+    """ replaceRegionName as it was before it was made single-pass """
+
+    tempFormula = formula[:]
+
+    for nextProp in re.findall('(next\(s\.\w+\)|next\(\(s\.\w+\)\))',tempFormula):
+        prop = nextProp.replace('next((s.','')
+        prop = prop.replace('next(s.','')
+        prop = prop.replace(')','')
+
+        if prop in regionList:
+            ind = regionList.index(prop)
+            tempFormula = tempFormula.replace(nextProp, bitEncode['next'][ind])
+
+    for prop in re.findall('s\.(\w+)',tempFormula):
+        if prop in regionList:
+            ind = regionList.index(prop)
+            tempFormula = re.sub('\\bs\.'+prop+'\\b', bitEncode['current'][ind],tempFormula)
+
+    for prop in re.findall('e\.(\w+)',tempFormula):
+        if prop in regionList:
+            ind = regionList.index(prop)
+            tempFormula = re.sub('\\be\.'+prop+'\\b', bitEncode['env'][ind],tempFormula)
+
+    return tempFormula
+
+class TestReplaceRegionName(unittest.TestCase):
+    regionList = ['r1', 'r2', 'r10', 'kitchen', 'living_room']
+
+    formulas = ['next(s.r1) & s.r10 & e.r2',
+                'next((s.kitchen)) | !next(s.living_room)',
+                '[](s.r1 -> next(s.r2) | next(s.r10))',
+                's.r2x & s.r1 & e.kitchenette & s.carrying',
+                '[]<>(e.living_room & !s.kitchen) & next(s.notaregion)',
+                'no regions here']
+
+    def testMatchesOriginal(self):
+        bitEncode = parseEnglishToLTL.bitEncoding(len(self.regionList), 3)
+        for formula in self.formulas:
+            self.assertEqual(parseEnglishToLTL.replaceRegionName(formula, bitEncode, self.regionList),
+                             _replaceRegionNameReference(formula, bitEncode, self.regionList))
+
+    def testPartialNamesUntouched(self):
+        bitEncode = parseEnglishToLTL.bitEncoding(len(self.regionList), 3)
+        result = parseEnglishToLTL.replaceRegionName('s.r2x | s.r1', bitEncode, self.regionList)
+        self.assertTrue(result.startswith('s.r2x | '))
+        self.assertNotIn('s.r1', result)
+
+if __name__ == "__main__":
+    unittest.main()
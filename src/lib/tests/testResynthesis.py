@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Checks swapping in a strategy from background resynthesis, and what happens when that fails.
+"""
+
+import unittest
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import project
+import regions
+import strategy
+import fsa
+from resynthesis import ExecutorResynthesisExtensions
+
+def _makeProject(region_names):
+    proj = project.Project()
+    proj.rfi = regions.RegionFileInterface(regions=[regions.Region(name=n) for n in region_names])
+    proj.enabled_sensors = ["person"]
+    proj.all_sensors = ["person"]
+    proj.enabled_actuators = ["pick_up"]
+    proj.all_actuators = ["pick_up"]
+    return proj
+
+def _makeStrategy(proj, states):
+    """ An automaton without transitions, with one state per (region name, person, pick_up) """
+
+    strat = fsa.FSAStrategy()
+    region_domain = strategy.Domain("region", proj.rfi.regions, strategy.Domain.B0_IS_MSB)
+    strat.configurePropositions(["person"], ["pick_up", region_domain])
+    for i, (region_name, person, pick_up) in enumerate(states):
+        state = strat.states.addNewState({"region": proj.rfi.regions[proj.rfi.indexOfRegionWithName(region_name)],
+                                          "person": person, "pick_up": pick_up})
+        state.state_id = str(i)
+    return strat
+
+class _HandlerSubsystem(object):
+    def __init__(self, executor, motion_ok=True):
+        self.executor = executor
+        self.motion_ok = motion_ok
+        self.motion_reloads = []
+        self.person = False
+
+    def getSensorValue(self, names):
+        return dict((n, self.person) for n in names)
+
+    def reloadMotionControlHandler(self):
+        # Record which map the new handler would have been set up for
+        self.motion_reloads.append(self.executor.proj.rfi)
+        return object() if self.motion_ok else None
+
+class _Executor(ExecutorResynthesisExtensions):
+    """ Just enough of LTLMoPExecutor to run the swap """
+
+    def __init__(self, proj, strat, state):
+        super(_Executor, self).__init__()
+        self.proj = proj
+        self.strategy = strat
+        self.strategy.current_state = state
+        self.hsub = _HandlerSubsystem(self)
+        self.current_outputs = {"pick_up": False}
+        self.last_next_states = []
+        self.next_state = None
+        self.running = True
+        self.blocking_resyntheses = []
+        self.blocking_result = True
+
+    def postEvent(self, eventType, eventData=None):
+        pass
+
+    def resume(self):
+        self.running = True
+
+    def _getCurrentRegionFromPose(self, rfi=None):
+        return None
+
+    def resynthesizeFromNewSpecification(self, spec_text):
+        self.blocking_resyntheses.append(spec_text)
+        self.running = False
+        return self.blocking_result
+
+class TestStrategySwap(unittest.TestCase):
+    def setUp(self):
+        self.old_proj = _makeProject(["r1", "r2"])
+        old_strategy = _makeStrategy(self.old_proj, [("r1", False, False), ("r2", False, False)])
+        self.executor = _Executor(self.old_proj, old_strategy, old_strategy.states[1])
+        self.old_strategy = old_strategy
+
+        # The new map was decomposed differently
+        self.new_proj = self.old_proj.snapshot()
+        self.new_proj.rfi = regions.RegionFileInterface(regions=[regions.Region(name=n) for n in ["r2", "r1", "r3"]])
+
+    def setPending(self, states):
+        new_strategy = _makeStrategy(self.new_proj, states)
+        self.executor.pending_resynthesis = (self.new_proj, new_strategy, "new spec")
+        return new_strategy
+
+    def testSwapMatchesCurrentState(self):
+        new_strategy = self.setPending([("r1", False, False), ("r2", True, False), ("r2", False, False)])
+
+        self.assertTrue(self.executor.swapInPendingStrategy())
+        self.assertIs(self.executor.proj, self.new_proj)
+        self.assertIs(self.executor.strategy, new_strategy)
+        self.assertEqual(self.executor.strategy.current_state.state_id, "2")
+        self.assertIs(self.new_proj.shared_data, self.old_proj.shared_data)
+        # The motion controller was set up for the new regions
+        self.assertEqual(self.executor.hsub.motion_reloads, [self.new_proj.rfi])
+        self.assertIsNone(self.executor.pending_resynthesis)
+
+    def testSwapUsesStateAtSwapTime(self):
+        self.setPending([("r2", False, False), ("r2", True, False)])
+
+        # The sensor changed after resynthesis started
+        self.executor.hsub.person = True
+        self.assertTrue(self.executor.swapInPendingStrategy())
+        self.assertEqual(self.executor.strategy.current_state.state_id, "1")
+
+    def testWaitsForTransitionBoundary(self):
+        self.setPending([("r2", False, False)])
+        self.executor.last_next_states = [self.old_strategy.states[0]]
+        self.executor.next_state = self.old_strategy.states[0]
+
+        self.assertFalse(self.executor.swapInPendingStrategy())
+        self.assertIsNotNone(self.executor.pending_resynthesis)
+
+    def testFallsBackToBlockingResynthesis(self):
+        self.setPending([("r1", False, False)])
+
+        self.assertTrue(self.executor.swapInPendingStrategy())
+        self.assertEqual(self.executor.blocking_resyntheses, ["new spec"])
+
+    def testFailedFallbackKeepsCurrentStrategy(self):
+        self.setPending([("r1", False, False)])
+        self.executor.blocking_result = False
+
+        self.assertFalse(self.executor.swapInPendingStrategy())
+        self.assertIs(self.executor.proj, self.old_proj)
+        self.assertIs(self.executor.strategy, self.old_strategy)
+        self.assertTrue(self.executor.running)
+
+    def testMotionControlFailureKeepsCurrentStrategy(self):
+        self.setPending([("r2", False, False)])
+        self.executor.hsub.motion_ok = False
+
+        self.assertFalse(self.executor.swapInPendingStrategy())
+        self.assertIs(self.executor.proj, self.old_proj)
+        self.assertIs(self.executor.strategy, self.old_strategy)
+        self.assertEqual(self.executor.strategy.current_state.state_id, "1")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Checks the spatial index used by the motion controllers against a brute-force search.
+"""
+
+import unittest
+import random
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "handlers", "share", "MotionControl"))
+
+from __spatialIndex import SpatialIndex
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.points = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(500)]
+        self.queries = [(rng.uniform(-60, 60), rng.uniform(-60, 60)) for i in range(100)]
+
+    def bruteForce(self, p, radius):
+        return sorted(k for k, q in enumerate(self.points) if (q[0]-p[0])**2 + (q[1]-p[1])**2 < radius**2)
+
+    def testMatchesBruteForce(self):
+        # Search radii both smaller and bigger than the cells
+        for cell_size in [1.0, 7.5, 30.0]:
+            index = SpatialIndex(cell_size)
+            for k, p in enumerate(self.points):
+                index.insert(k, p)
+            self.assertEqual(len(index), len(self.points))
+
+            for p in self.queries:
+                for radius in [0.5, 5.0, 12.0]:
+                    self.assertEqual(sorted(index.neighbors(p, radius)), self.bruteForce(p, radius))
+
+    def testIncremental(self):
+        index = SpatialIndex(5.0)
+        self.assertEqual(index.neighbors((0, 0), 10.0), [])
+        index.insert("a", (1, 1))
+        index.insert("b", (-3, -3))
+        self.assertEqual(sorted(index.neighbors((0, 0), 2.0)), ["a"])
+        self.assertEqual(sorted(index.neighbors((0, 0), 10.0)), ["a", "b"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Checks the compact (bit-prefix cube) encoding of the map topology.
+"""
+
+import unittest
+import random
+import re
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import createJTLVinput
+
+class _Region(object):
+    def __init__(self, name):
+        self.name = name
+
+def _literals(formula):
+    return set(re.findall(r"!?next\(s\.bit\d+\)", formula))
+
+class TestPrefixCubes(unittest.TestCase):
+    def assertCubesCover(self, codes, numRegions):
+        numBits = len(bin(numRegions-1)) - 2 if numRegions > 1 else 1
+        nextBitEnc = createJTLVinput.getBitEncoding(numRegions)['next']
+        cubes = createJTLVinput._prefixCubes(sorted(codes), numRegions, numBits)
+
+        for code in range(numRegions):
+            # A region satisfies a cube if its encoding contains all of the cube's literals
+            covered = any(cube == "TRUE" or _literals(cube) <= _literals(nextBitEnc[code]) for cube in cubes)
+            self.assertEqual(covered, code in codes, msg="region {} with cubes {}".format(code, cubes))
+
+    def testAllRegions(self):
+        self.assertEqual(createJTLVinput._prefixCubes(range(6), 6, 3), ["TRUE"])
+
+    def testSingleRegion(self):
+        self.assertCubesCover([5], 6)
+
+    def testRandomSubsets(self):
+        rng = random.Random(0)
+        for numRegions in [2, 3, 5, 8, 13, 33]:
+            for trial in range(20):
+                codes = [c for c in range(numRegions) if rng.random() < 0.5] or [0]
+                self.assertCubesCover(codes, numRegions)
+
+    def testCompactFragmentIsShorter(self):
+        numRegions = 32
+        regions = [_Region("r{}".format(i)) for i in range(numRegions)]
+        adjData = [[abs(i-j) <= 4 for j in range(numRegions)] for i in range(numRegions)]
+
+        full = createJTLVinput.createTopologyFragment(adjData, regions)
+        compact = createJTLVinput.createTopologyFragment(adjData, regions, compact=True)
+        self.assertEqual(full.count("[]"), compact.count("[]"))
+        self.assertLess(len(compact), len(full))
+
+if __name__ == "__main__":
+    unittest.main()
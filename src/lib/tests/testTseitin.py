@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Checks that the Tseitin CNF encoding is equisatisfiable with the formula it encodes.
+"""
+
+import unittest
+import random
+import itertools
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from LTLParser.LTLFormula import parseLTL
+from cores import tseitin
+
+PROPOSITIONS = ["s.a", "s.b", "e.c", "next(s.a)", "next(e.c)"]
+
+def _randomFormula(rng, depth):
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice(PROPOSITIONS + ["TRUE", "FALSE"])
+
+    op = rng.choice(["&", "|", "->", "<->", "^", "!"])
+    if op == "!":
+        return "!(" + _randomFormula(rng, depth-1) + ")"
+    return "(" + _randomFormula(rng, depth-1) + " " + op + " " + _randomFormula(rng, depth-1) + ")"
+
+def _evaluate(tree, values, is_next=False):
+    """ Truth value of a parse tree, with `values` keyed by the encoder's variable names """
+
+    if tree[0] == "TRUE":
+        return True
+    elif tree[0] == "FALSE":
+        return False
+    elif tree[0] == "Assignment":
+        name = tree[1][0][2:]
+        return values["next_" + name if is_next else name]
+    elif tree[0] == "UnaryFormula":
+        if tree[1][0] == "NotOperator":
+            return not _evaluate(tree[2], values, is_next)
+        # The encoder ignores the other temporal operators, which unrolling takes care of
+        return _evaluate(tree[2], values, is_next or tree[1][0] == "NextOperator")
+
+    children = [_evaluate(t, values, is_next) for t in tree[1:]]
+    if tree[0] == "Conjunction":
+        return all(children)
+    elif tree[0] == "Disjunction":
+        return any(children)
+    elif tree[0] == "Implication":
+        return (not children[0]) or children[1]
+    elif tree[0] == "Biimplication":
+        return children[0] == children[1]
+    elif tree[0] == "Xor":
+        return reduce(lambda x, y: x != y, children)
+    raise ValueError(tree[0])
+
+def _satisfiable(clauses, fixed, num_vars):
+    """ Brute force: can the variables not in `fixed` be chosen to satisfy `clauses`? """
+
+    free = [v for v in range(1, num_vars+1) if v not in fixed]
+    for choice in itertools.product([False, True], repeat=len(free)):
+        values = dict(fixed)
+        values.update(zip(free, choice))
+        if all(any(values[abs(l)] == (l > 0) for l in clause) for clause in clauses):
+            return True
+    return False
+
+class TestTseitin(unittest.TestCase):
+    def assertEquisatisfiable(self, text):
+        tree = parseLTL(text)
+        clauses, names = tseitin.TseitinEncoder().encode(tree)
+
+        # Propositions eliminated as constants don't matter, so use all of them
+        all_props = ["a", "b", "c", "next_a", "next_c"]
+        for choice in itertools.product([False, True], repeat=len(all_props)):
+            values = dict(zip(all_props, choice))
+            fixed = dict((v+1, values[n]) for v, n in enumerate(names) if n is not None)
+            self.assertEqual(_satisfiable(clauses, fixed, len(names)), _evaluate(tree, values),
+                             msg="{} under {}".format(text, values))
+
+    def testSimpleFormulas(self):
+        for text in ["s.a & !s.b", "s.a -> next(s.a)", "(s.a <-> e.c) ^ s.b",
+                     "!(s.a & e.c) | (next(e.c) & TRUE)", "FALSE | s.b", "[](s.a -> next(e.c))"]:
+            self.assertEquisatisfiable(text)
+
+    def testRandomFormulas(self):
+        rng = random.Random(0)
+        for trial in range(150):
+            self.assertEquisatisfiable(_randomFormula(rng, 4))
+
+    def testLinearSize(self):
+        # A disjunction of conjunctions, which distributing would blow up exponentially
+        n = 12
+        text = " | ".join("(s.x{0} & s.y{0})".format(i) for i in range(n))
+        clauses, names = tseitin.encodeFormula(text)
+        self.assertLess(len(clauses), 4*n)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Checks the batch vector field of the vector controller against the original point-by-point controller.
+"""
+
+import unittest
+import numpy
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "handlers", "share", "MotionControl"))
+
+import __vectorControllerHelper as vectorControllerHelper
+
+# Clockwise hexagon, an irregular pentagon and an axis-aligned rectangle
+POLYGONS = [[[0., 1., 3., 4., 3., 1.],
+             [0., 2., 2., 0., -2., -2.]],
+            [[0., 0.5, 4., 5., 2.],
+             [0., 3., 3.5, 1., -1.5]],
+            [[0., 0., 3., 3.],
+             [0., 2., 2., 0.]]]
+
+class TestVectorField(unittest.TestCase):
+    def testMatchesController(self):
+        for Vertex in POLYGONS:
+            vert = numpy.array(Vertex)
+            xmin, ymin = vert.min(axis=1)
+            xmax, ymax = vert.max(axis=1)
+            # Offset the grid so that no point falls on a face, where the original divides by zero
+            gx, gy = numpy.meshgrid(numpy.linspace(xmin + 0.011, xmax - 0.017, 15),
+                                    numpy.linspace(ymin + 0.013, ymax - 0.019, 15))
+            points = numpy.column_stack((gx.ravel(), gy.ravel()))
+            points = points[[vectorControllerHelper.is_inside(p, vert) for p in points]]
+            self.assertTrue(len(points) > 20)
+
+            for exit in range(vert.shape[1]):
+                Vel = vectorControllerHelper.VectorField(vert, exit).evaluate(points)
+                for k, p in enumerate(points):
+                    expected = vectorControllerHelper.getController(p, vert, exit)
+                    self.assertTrue(numpy.allclose(Vel[k], expected, atol=1e-9),
+                                    msg="point {} of {} (exit face {})".format(p, Vertex, exit))
+
+    def testSinglePoint(self):
+        field = vectorControllerHelper.VectorField(numpy.array(POLYGONS[0]), 2)
+        self.assertEqual(field.evaluate([2., 0.5]).shape, (1, 2))
+        self.assertTrue(numpy.allclose(field.evaluate([2., 0.5]), field.evaluate([[2., 0.5], [1., 1.]])[0]))
+
+    def testFiniteEverywhere(self):
+        for Vertex in POLYGONS:
+            vert = numpy.array(Vertex)
+            center = vert.mean(axis=1)
+            # The vertices, the middle of each face, and the center
+            points = numpy.vstack((vert.T, (vert + numpy.roll(vert, -1, axis=1)).T/2, center))
+
+            for exit in [None] + range(vert.shape[1]):
+                Vel = vectorControllerHelper.VectorField(vert, exit).evaluate(points)
+                self.assertTrue(numpy.isfinite(Vel).all(), msg="{} (exit face {})".format(Vertex, exit))
+                if exit is not None:
+                    # Moving out through the middle of the exit face
+                    self.assertTrue(numpy.allclose(numpy.linalg.norm(Vel[vert.shape[1] + exit]), 1))
+
+            # Stopped at the center of the last region
+            self.assertTrue(numpy.array_equal(vectorControllerHelper.VectorField(vert, None).evaluate(center), [[0, 0]]))
+
+if __name__ == "__main__":
+    unittest.main()